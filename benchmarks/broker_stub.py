@@ -0,0 +1,96 @@
+"""
+broker_stub.py
+
+Bench-only stand-ins for the pieces src/services expects but this tree does
+not provide yet: src.services.broker.PaperBroker / Fill and a position
+portfolio (src.domain.portfolio.Portfolio with get_position / avg_cost).
+install() patches them in only where they are missing, so the services
+backtest / sweep cases time the real loop and vectorized code paths; once
+the real broker lands, install() is a no-op and the cases time it instead.
+
+Semantics follow the services layer: fill at the decision price +/- slippage
+(cfg.slippage_bps), fee = notional * cfg.fee_rate, BUY rejected when cash
+does not cover it, SELL capped at the held quantity, realized PnL against
+the average cost. Never imported by src/ or scripts/.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+NOTE = "src.services.broker PaperBroker/Fill missing: timed with benchmarks/broker_stub.py stand-ins"
+
+
+@dataclass(frozen=True)
+class Fill:
+    action: str
+    symbol: str
+    price: float
+    quantity: int
+    fee: float
+    cash_delta: float
+    realized_pnl: float
+    note: str
+
+
+@dataclass
+class Position:
+    quantity: int = 0
+    avg_cost: float = 0.0
+
+
+@dataclass
+class Portfolio:
+    cash: float
+    positions: Dict[str, Position] = field(default_factory=dict)
+
+    def get_position(self, symbol: str) -> Position:
+        return self.positions.get(symbol, Position())
+
+
+class PaperBroker:
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+    def execute(self, portfolio: Portfolio, decision) -> Tuple[Portfolio, Optional[Fill]]:
+        if decision.action not in ("BUY", "SELL"):
+            return portfolio, None
+        slip = float(self.cfg.slippage_bps) / 10000.0
+        px = float(decision.price) * (1.0 + slip if decision.action == "BUY" else 1.0 - slip)
+        pos = portfolio.positions.setdefault(decision.symbol, Position())
+
+        if decision.action == "BUY":
+            qty = int(decision.quantity)
+            fee = px * qty * float(self.cfg.fee_rate)
+            if px * qty + fee > portfolio.cash:
+                return portfolio, Fill("BUY", decision.symbol, px, 0, 0.0, 0.0, 0.0, "reject: cash")
+            pos.avg_cost = (pos.avg_cost * pos.quantity + px * qty) / (pos.quantity + qty)
+            pos.quantity += qty
+            portfolio.cash -= px * qty + fee
+            return portfolio, Fill("BUY", decision.symbol, px, qty, fee, -(px * qty + fee), 0.0, decision.reason)
+
+        qty = min(int(decision.quantity), pos.quantity)
+        if qty <= 0:
+            return portfolio, Fill("SELL", decision.symbol, px, 0, 0.0, 0.0, 0.0, "reject: no position")
+        fee = px * qty * float(self.cfg.fee_rate)
+        pnl = (px - pos.avg_cost) * qty - fee
+        pos.quantity -= qty
+        portfolio.cash += px * qty - fee
+        return portfolio, Fill("SELL", decision.symbol, px, qty, fee, px * qty - fee, pnl, decision.reason)
+
+
+def install() -> bool:
+    """Patch the stand-ins in where the tree lacks them; True when they are in use."""
+    import src.domain.portfolio as dp
+    import src.services.broker as broker
+
+    if getattr(broker, "PaperBroker", None) is PaperBroker:
+        return True
+    if hasattr(broker, "PaperBroker") and hasattr(broker, "Fill"):
+        return False
+    broker.PaperBroker = PaperBroker
+    broker.Fill = Fill
+    if not hasattr(dp.Portfolio, "get_position"):
+        dp.Portfolio = Portfolio
+    return True
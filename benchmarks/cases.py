@@ -0,0 +1,213 @@
+﻿"""
+cases.py
+
+Benchmark cases for the hot paths. Each Case has
+- setup(scale) -> (state, run)  untimed: imports + synthetic data
+- run(state)                    timed: the call being measured
+- units(state) -> int           work per run (bars, rows, grid pairs) for units/sec
+Importing the code under test happens in setup, so a case whose module does
+not import in this tree is reported as an error instead of stopping the suite.
+The services cases run on broker_stub.py stand-ins while this tree has no
+PaperBroker; such a case's state carries a "note" that run.py records.
+"""
+
+from __future__ import annotations
+
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import broker_stub
+import synthetic
+
+
+@dataclass(frozen=True)
+class Scale:
+    symbols: int       # price panel width (services backtest / sweep / engine)
+    days: int          # bars per symbol, and universe days
+    stocks: int        # universe width (ranking / breadth / portfolio v3)
+    grid: Tuple[int, int]  # MA sweep: (#short windows, #long windows)
+    seed: int = 7
+
+
+SIZES: Dict[str, Scale] = {
+    "small": Scale(symbols=20, days=250, stocks=200, grid=(4, 5)),
+    "medium": Scale(symbols=100, days=1000, stocks=1000, grid=(8, 10)),
+    "large": Scale(symbols=300, days=2500, stocks=2000, grid=(16, 20)),
+}
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[Scale], Tuple[Any, Callable[[Any], Any]]]  # -> (state, run)
+    units: Callable[[Any], int]
+
+
+CASES: List[Case] = []
+
+
+def case(name: str, units: Callable[[Any], int]):
+    """Register setup(scale) -> (state, run) as benchmark `name`."""
+    def deco(setup):
+        CASES.append(Case(name, setup, units))
+        return setup
+    return deco
+
+
+def _bars(state: dict) -> int:
+    md = state["md"]
+    return len(md.dates()) * len(md.symbols())
+
+
+def _rows(state: dict) -> int:
+    return len(state["df"])
+
+
+# ---------- src/core + src/services ----------
+
+def _cfg(**kw):
+    from src.domain.config import AppConfig
+    return AppConfig(**kw)
+
+
+@case("engine.decide", units=_bars)
+def _engine_decide(scale: Scale):
+    """InvestmentEngine.decide on every growing prefix, as the loop backtest calls it."""
+    from src.core.engine import InvestmentEngine
+
+    md = synthetic.price_panel(scale.symbols, scale.days, scale.seed)
+    views = {s: memoryview(md.series[s].closes) for s in md.symbols()}
+
+    def run(state):
+        eng = InvestmentEngine(state["cfg"])
+        for sym, view in state["views"].items():
+            for t in range(1, len(view) + 1):
+                eng.decide(sym, view[:t])
+
+    return {"md": md, "views": views, "cfg": _cfg()}, run
+
+
+def _services_backtest(mode: str):
+    def setup(scale: Scale):
+        stub = broker_stub.install()
+        from src.core.engine import InvestmentEngine
+        from src.services.backtest import run_backtest
+
+        md = synthetic.price_panel(scale.symbols, scale.days, scale.seed)
+        cfg = _cfg()
+
+        def run(state):
+            run_backtest(
+                md=state["md"],
+                engine=InvestmentEngine(cfg),
+                cfg=cfg,
+                start_cash=float(cfg.total_capital),
+                log_equity_path=None,
+                log_metrics_path=None,
+                log_trades_path=None,
+                engine_mode=mode,
+            )
+
+        return {"md": md, "note": broker_stub.NOTE if stub else None}, run
+    return setup
+
+
+case("services.run_backtest[loop]", units=_bars)(_services_backtest("loop"))
+case("services.run_backtest[vectorized]", units=_bars)(_services_backtest("vectorized"))
+
+
+def _grid(scale: Scale) -> Tuple[List[int], List[int]]:
+    n_short, n_long = scale.grid
+    shorts = list(range(2, 2 + n_short))
+    longs = list(range(2 + n_short + 5, 2 + n_short + 5 + 5 * n_long, 5))
+    return shorts, longs
+
+
+@case("services.run_ma_sweep[vectorized]", units=lambda state: state["pairs"])
+def _ma_sweep(scale: Scale):
+    stub = broker_stub.install()
+    from src.services.sweeper import generate_ma_grid, run_ma_sweep
+
+    md = synthetic.price_panel(scale.symbols, scale.days, scale.seed)
+    shorts, longs = _grid(scale)
+    tmp = tempfile.TemporaryDirectory(prefix="ia_bench_")  # removed with the state
+    out_csv = Path(tmp.name) / "ma_sweep.csv"
+
+    def run(state):
+        run_ma_sweep(md, _cfg(), out_csv, shorts=shorts, longs=longs, workers=1, engine_mode="vectorized")
+
+    state = {"md": md, "pairs": len(generate_ma_grid(shorts, longs)), "tmp": tmp,
+             "note": broker_stub.NOTE if stub else None}
+    return state, run
+
+
+# ---------- scripts/ ----------
+
+def _universe(scale: Scale):
+    return synthetic.universe_frame(scale.stocks, scale.days, scale.seed)
+
+
+@case("build_ranking_history.rank_history", units=_rows)
+def _rank_history(scale: Scale):
+    import build_ranking_history as brh
+
+    def run(state):
+        brh.rank_history(state["df"], top=60, threshold=0.0)
+
+    return {"df": _universe(scale)}, run
+
+
+@case("breadth_analyzer.build_breadth_history", units=_rows)
+def _breadth_history(scale: Scale):
+    # the aggregation build_breadth_history runs once the universe is loaded
+    import breadth_analyzer as ba
+
+    def run(state):
+        ba.breadth_from_frame(state["df"], score_threshold=70.0)
+
+    return {"df": _universe(scale)}, run
+
+
+def _portfolio_v3(engine: str):
+    def setup(scale: Scale):
+        import backtest_portfolio_v3 as v3
+        import breadth_analyzer as ba
+        import build_ranking_history as brh
+
+        df = _universe(scale)
+        dates = sorted(df["date"].unique().tolist())
+        market_df = synthetic.market_frame(dates, scale.seed)
+        breadth_df = ba.breadth_from_frame(df, score_threshold=70.0)
+        ranking_df = brh.rank_history(df, top=60, threshold=0.0)
+
+        def run(state):
+            v3.run_backtest(df, market_df, breadth_df, ranking_df, engine=engine)
+
+        return {"df": df}, run
+    return setup
+
+
+case("backtest_portfolio_v3.run_backtest[loop]", units=_rows)(_portfolio_v3("loop"))
+case("backtest_portfolio_v3.run_backtest[matrix]", units=_rows)(_portfolio_v3("matrix"))
+
+
+def _singlepos(engine: str):
+    def setup(scale: Scale):
+        import phase5_signals_rsi as p5
+        import phase6_backtest_singlepos as p6
+
+        df = synthetic.ohlc_frame(scale.days, scale.seed)
+        p5.add_indicators(df)
+        p5.add_signals(df)
+
+        def run(state):
+            p6.backtest_singlepos(state["df"], engine=engine)
+
+        return {"df": df}, run
+    return setup
+
+
+case("phase6_backtest_singlepos[array]", units=_rows)(_singlepos("array"))
+case("phase6_backtest_singlepos[rows]", units=_rows)(_singlepos("rows"))
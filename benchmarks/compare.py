@@ -0,0 +1,98 @@
+﻿"""
+compare.py
+
+Compare two benchmarks/run.py result files (e.g. before / after a commit):
+per case median time, new/old ratio and a verdict. Exits 1 when any case
+got slower than --threshold (default 1.10 = 10% slower), so it can gate CI.
+
+Usage:
+  python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json
+  python benchmarks/compare.py old.json new.json --threshold 1.25 --stat min_s
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def _load(path: str) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def _label(res: Dict[str, Any]) -> str:
+    env = res.get("env") or {}
+    commit = (env.get("commit") or "?")[:10]
+    return f"{commit}{'+dirty' if env.get('dirty') else ''} size={res.get('size')} created={res.get('created_at')}"
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float, stat: str = "median_s") -> List[Dict[str, Any]]:
+    """Rows for every case in either file; verdict: slower / faster / same / added / removed / error."""
+    rows: List[Dict[str, Any]] = []
+    oc, nc = old.get("cases") or {}, new.get("cases") or {}
+    for name in list(oc) + [n for n in nc if n not in oc]:
+        o, n = oc.get(name), nc.get(name)
+        row: Dict[str, Any] = {"case": name, "old": None, "new": None, "ratio": None}
+        if o is None:
+            row["verdict"] = "added"
+        elif n is None:
+            row["verdict"] = "removed"
+        elif o.get("status") != "ok" or n.get("status") != "ok":
+            row["verdict"] = "error"
+        else:
+            row["old"], row["new"] = float(o[stat]), float(n[stat])
+            row["ratio"] = row["new"] / row["old"] if row["old"] > 0 else None
+            if row["ratio"] is None:
+                row["verdict"] = "same"
+            elif row["ratio"] > threshold:
+                row["verdict"] = "slower"
+            elif row["ratio"] < 1.0 / threshold:
+                row["verdict"] = "faster"
+            else:
+                row["verdict"] = "same"
+        rows.append(row)
+    return rows
+
+
+def _ms(v: Optional[float]) -> str:
+    return f"{v * 1e3:10.3f}" if v is not None else f"{'-':>10}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Compare two benchmark result JSON files")
+    ap.add_argument("old")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=1.10, help="new/old ratio above which a case is a regression")
+    ap.add_argument("--stat", choices=["median_s", "min_s", "mean_s"], default="median_s")
+    args = ap.parse_args(argv)
+
+    if args.threshold <= 1.0:
+        raise SystemExit("--threshold must be > 1.0")
+    old, new = _load(args.old), _load(args.new)
+    print(f"old: {_label(old)}")
+    print(f"new: {_label(new)}")
+    if old.get("scale") != new.get("scale"):
+        print(f"WARN: different scales: {old.get('scale')} vs {new.get('scale')} (ratios are not like for like)")
+    o_env, n_env = old.get("env") or {}, new.get("env") or {}
+    for k in ("python", "numpy", "pandas", "machine"):
+        if o_env.get(k) != n_env.get(k):
+            print(f"WARN: {k} differs: {o_env.get(k)} vs {n_env.get(k)}")
+
+    rows = compare(old, new, args.threshold, args.stat)
+    print(f"{'case':<45} {'old ms':>10} {'new ms':>10} {'ratio':>7}  verdict")
+    for r in rows:
+        ratio = f"{r['ratio']:7.3f}" if r["ratio"] is not None else f"{'-':>7}"
+        print(f"{r['case']:<45} {_ms(r['old'])} {_ms(r['new'])} {ratio}  {r['verdict']}")
+
+    slower = [r["case"] for r in rows if r["verdict"] == "slower"]
+    if slower:
+        print(f"REGRESSION: {len(slower)} case(s) slower than x{args.threshold:.2f}: {', '.join(slower)}")
+        return 1
+    print(f"OK: no case slower than x{args.threshold:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
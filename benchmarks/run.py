@@ -0,0 +1,202 @@
+﻿"""
+run.py
+
+Reproducible benchmarks for the backtest / analytics hot paths (cases.py)
+on seeded synthetic data (synthetic.py), asv style:
+- every case: untimed setup, one warm-up call (imports, numba JIT, caches),
+  then --repeat samples of N calls each, N picked so a sample takes at least
+  --min_time seconds; per-call times are reported
+- results: one JSON per run under --out, named <UTC time>_<commit>_<size>.json,
+  with commit / dirty flag / python, numpy, pandas versions / machine / scale;
+  compare two of them with benchmarks/compare.py
+- a case that fails (import or run) is recorded as status "error" and the
+  rest still run; a case that ran on stand-ins (broker_stub.py) gets a "note"
+
+Usage:
+  python benchmarks/run.py --size small
+  python benchmarks/run.py --size medium --filter "backtest|sweep" --repeat 7
+  python benchmarks/run.py --size large --days 5000 --grid 20x30
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BENCH = Path(__file__).resolve().parent
+ROOT = BENCH.parent
+for p in (str(ROOT), str(ROOT / "scripts"), str(BENCH)):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from cases import CASES, SIZES, Case, Scale  # noqa: E402
+
+RESULTS_VERSION = 1
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        out = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def environment() -> Dict[str, Any]:
+    commit = _git("rev-parse", "HEAD")
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": commit,
+        "dirty": bool(status) if status is not None else None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _calls_per_sample(run, state, min_time: float, max_calls: int = 1_000_000) -> int:
+    """Like timeit.autorange: 1, 2, 5, 10, 20... calls until one sample takes min_time."""
+    n = 1
+    while True:
+        for m in (1, 2, 5):
+            calls = n * m
+            t0 = time.perf_counter()
+            for _ in range(calls):
+                run(state)
+            if time.perf_counter() - t0 >= min_time or calls >= max_calls:
+                return calls
+        n *= 10
+
+
+def bench_case(c: Case, scale: Scale, repeat: int, min_time: float) -> Dict[str, Any]:
+    rec: Dict[str, Any] = {"status": "ok"}
+    try:
+        t0 = time.perf_counter()
+        state, run = c.setup(scale)
+        rec["setup_s"] = round(time.perf_counter() - t0, 6)
+        run(state)  # warm-up
+        calls = _calls_per_sample(run, state, min_time)
+        times: List[float] = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            for _ in range(calls):
+                run(state)
+            times.append((time.perf_counter() - t0) / calls)
+        units = int(c.units(state))
+        if isinstance(state, dict) and state.get("note"):
+            rec["note"] = state["note"]
+    except Exception as e:
+        rec["status"] = "error"
+        rec["error"] = f"{type(e).__name__}: {e}"
+        rec["traceback"] = traceback.format_exc(limit=5)
+        return rec
+
+    med = statistics.median(times)
+    rec.update({
+        "calls_per_sample": calls,
+        "times_s": [round(t, 9) for t in times],
+        "min_s": round(min(times), 9),
+        "median_s": round(med, 9),
+        "mean_s": round(statistics.fmean(times), 9),
+        "stdev_s": round(statistics.stdev(times), 9) if len(times) > 1 else 0.0,
+        "units": units,
+        "units_per_s": round(units / med, 1) if med > 0 else None,
+    })
+    return rec
+
+
+def _parse_grid(s: str) -> tuple:
+    m = re.fullmatch(r"\s*(\d+)\s*[xX,]\s*(\d+)\s*", s)
+    if not m:
+        raise argparse.ArgumentTypeError("grid must look like 8x10 (#shorts x #longs)")
+    return int(m.group(1)), int(m.group(2))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Run the benchmark cases and write a JSON result file")
+    ap.add_argument("--size", choices=sorted(SIZES), default="small")
+    ap.add_argument("--symbols", type=int, default=None, help="override the size's price panel width")
+    ap.add_argument("--days", type=int, default=None, help="override bars per symbol / universe days")
+    ap.add_argument("--stocks", type=int, default=None, help="override universe width")
+    ap.add_argument("--grid", type=_parse_grid, default=None, help="override MA sweep grid, e.g. 8x10")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--filter", default="", help="regex on case names")
+    ap.add_argument("--repeat", type=int, default=5, help="timed samples per case")
+    ap.add_argument("--min_time", type=float, default=0.2, help="seconds per sample (more calls per sample if faster)")
+    ap.add_argument("--out", default=str(BENCH / "results"), help="directory for the JSON result")
+    ap.add_argument("--list", action="store_true", help="list case names and exit")
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    pat = re.compile(args.filter) if args.filter else None
+    cases = [c for c in CASES if pat is None or pat.search(c.name)]
+    if args.list:
+        for c in cases:
+            print(c.name)
+        return 0
+    if not cases:
+        print(f"ERROR: no case matches --filter {args.filter!r}")
+        return 2
+
+    overrides = {k: getattr(args, k) for k in ("symbols", "days", "stocks", "grid", "seed") if getattr(args, k) is not None}
+    scale = replace(SIZES[args.size], **overrides)
+
+    # tracing/profiling hooks would time themselves along with the code under test
+    for var in ("IA_TRACE", "IA_PROFILE"):
+        os.environ.pop(var, None)
+
+    env = environment()
+    print(f"bench: size={args.size} {asdict(scale)} commit={(env['commit'] or '?')[:10]}{' (dirty)' if env['dirty'] else ''}")
+    results: Dict[str, Dict[str, Any]] = {}
+    for c in cases:
+        rec = bench_case(c, scale, args.repeat, args.min_time)
+        results[c.name] = rec
+        if rec["status"] == "ok":
+            print(f"  {c.name:<45} median={rec['median_s'] * 1e3:10.3f} ms  "
+                  f"min={rec['min_s'] * 1e3:10.3f} ms  units/s={rec['units_per_s']:,.0f}"
+                  f"{'  (stand-in broker)' if rec.get('note') else ''}")
+        else:
+            print(f"  {c.name:<45} ERROR: {rec['error']}")
+
+    now = datetime.now(timezone.utc)
+    out = {
+        "version": RESULTS_VERSION,
+        "created_at": now.replace(microsecond=0).isoformat(),
+        "env": env,
+        "size": args.size,
+        "scale": asdict(scale),
+        "repeat": args.repeat,
+        "min_time": args.min_time,
+        "cases": results,
+    }
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{now.strftime('%Y%m%dT%H%M%SZ')}_{(env['commit'] or 'nogit')[:10]}_{args.size}.json"
+    path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    n_err = sum(1 for r in results.values() if r["status"] != "ok")
+    print(f"OK: wrote -> {path} (cases={len(results)} errors={n_err})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+﻿"""
+synthetic.py
+
+Seeded synthetic inputs for the benchmark cases, shaped like what the real
+code reads (no files are touched):
+- weekdays():       the trading calendar
+- price_panel():    MarketDataResult of random-walk closes (services backtest,
+                    MA sweep, InvestmentEngine.decide)
+- ohlc_frame():     one symbol's date/OHLC/volume bars (phase5 -> phase6)
+- universe_frame(): all_stocks_daily.csv rows (ranking / breadth history,
+                    backtest_portfolio_v3)
+Same seed + same sizes -> the same data on every machine and commit.
+"""
+
+from __future__ import annotations
+
+from array import array
+from datetime import date, timedelta
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from src.adapters.market_data import MarketDataResult, SymbolSeries
+
+SECTORS = ["Semis", "Finance", "Shipping", "Biotech", "Retail", "Steel", "Optics", "Auto"]
+
+
+def weekdays(count: int, start: date = date(2015, 1, 1)) -> List[str]:
+    out: List[str] = []
+    d = start
+    while len(out) < count:
+        if d.weekday() < 5:
+            out.append(d.isoformat())
+        d += timedelta(days=1)
+    return out
+
+
+def _walk(rng: np.random.Generator, n: int, start: float, vol: float = 0.02) -> np.ndarray:
+    steps = rng.normal(0.0, vol, size=n)
+    return np.maximum(1.0, np.round(start * np.exp(np.cumsum(steps)), 2))
+
+
+def price_panel(symbols: int, days: int, seed: int = 7, gap_prob: float = 0.02) -> MarketDataResult:
+    """Random-walk closes on weekdays; each symbol randomly skips ~gap_prob of days."""
+    rng = np.random.default_rng(seed)
+    cal = weekdays(days)
+    series = {}
+    for k in range(symbols):
+        closes = _walk(rng, days, rng.uniform(20.0, 800.0))
+        keep = rng.random(days) >= gap_prob
+        series[f"S{k:04d}"] = SymbolSeries([d for d, m in zip(cal, keep) if m], array("d", closes[keep].tolist()))
+    return MarketDataResult(series)
+
+
+def ohlc_frame(days: int, seed: int = 7) -> pd.DataFrame:
+    """date, open, high, low, close, volume for one symbol."""
+    rng = np.random.default_rng(seed)
+    close = _walk(rng, days, 500.0, vol=0.015)
+    open_ = np.round(close * (1.0 + rng.normal(0.0, 0.004, size=days)), 2)
+    high = np.round(np.maximum(open_, close) * (1.0 + rng.uniform(0.0, 0.01, size=days)), 2)
+    low = np.round(np.minimum(open_, close) * (1.0 - rng.uniform(0.0, 0.01, size=days)), 2)
+    return pd.DataFrame({
+        "date": weekdays(days),
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "volume": rng.integers(1_000, 50_000_000, size=days).astype(float),
+    })
+
+
+def universe_frame(stocks: int, days: int, seed: int = 7, missing_prob: float = 0.01) -> pd.DataFrame:
+    """
+    all_stocks_daily rows: every stock on every weekday (date-major, like the
+    CSV), each row dropped with missing_prob.
+    """
+    rng = np.random.default_rng(seed)
+    cal = np.array(weekdays(days, start=date(2020, 1, 1)), dtype=object)
+    codes = np.array([f"{1000 + k}" for k in range(stocks)], dtype=object)
+    n = days * stocks
+    keep = rng.random(n) >= missing_prob
+    di = np.repeat(np.arange(days), stocks)[keep]
+    ci = np.tile(np.arange(stocks), days)[keep]
+    m = int(keep.sum())
+    return pd.DataFrame({
+        "date": cal[di],
+        "code": codes[ci],
+        "name": np.array([f"Stock{c}" for c in codes], dtype=object)[ci],
+        "sector": np.array(SECTORS, dtype=object)[ci % len(SECTORS)],
+        "change_percent": np.round(rng.normal(0.05, 2.0, size=m), 2),
+        "total_score": np.round(rng.uniform(0.0, 100.0, size=m), 1),
+        "volume": rng.integers(1_000, 5_000_000, size=m).astype(float),
+        "source": "SYN",
+    })
+
+
+def market_frame(dates: List[str], seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "date": dates,
+        "market_ok": rng.random(len(dates)) < 0.8,
+        "trend_ok": rng.random(len(dates)) < 0.8,
+    })
@@ -11,6 +11,18 @@ Sources:
 - TWSE: https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=json&date=YYYYMMDD
 - TPEx: https://www.tpex.org.tw/web/stock/aftertrading/otc_quotes_no1430/stk_wn1430_result.php?l=zh-tw&se=EW&o=data&d=ROC/MM/DD
 
+Scheduling:
+- Dates are fetched concurrently (--workers), TWSE and TPEx in parallel, through one
+  keep-alive requests.Session; each host has its own token bucket (--rate req/s,
+  --burst), failed requests are retried with jittered backoff (--retries).
+- Rows are still appended in date order. A date is appended only when both markets
+  were fetched; finished dates (holidays included) go to --checkpoint so a rerun
+  resumes where the last one stopped. A past date that came back empty from both
+  markets is taken as a holiday; --recheck_empty fetches such dates again (e.g.
+  after an endpoint outage that answered with empty pages).
+- Raw responses go through the shared HTTP cache (data/cache/http, see http_cache.py):
+  dates before today are never re-downloaded once they returned rows; --no_cache skips it.
+
 Notes:
 - total_score here is a conservative, deterministic score computed from change_percent only.
   (You can later replace it with your full scoring model.)
@@ -25,11 +37,18 @@ import math
 import os
 import re
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 
 import requests
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from http_cache import HttpCache  # noqa: E402
+from http_client import HostLimiter, get_with_retry, make_session  # noqa: E402
+
+TWSE_URL = "https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL"
+TPEX_URL = "https://www.tpex.org.tw/web/stock/aftertrading/otc_quotes_no1430/stk_wn1430_result.php"
+
 
 def die(msg: str, code: int = 1) -> None:
     print(f"[FATAL] {msg}", file=sys.stderr)
@@ -103,16 +122,40 @@ def score_from_change_percent(cp: Optional[float]) -> float:
 
 # ----------------- TWSE -----------------
 
-def fetch_twse_stock_day_all(d: dt.date, timeout: int = 25) -> List[Dict[str, str]]:
-    url = "https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL"
+def _get(url: str, params: dict, headers: dict, timeout: int, session: Optional[requests.Session],
+         limiter: Optional[HostLimiter], retries: int, cache: Optional[HttpCache] = None,
+         as_of: Optional[dt.date] = None, accept=None) -> requests.Response:
+    if session is None and limiter is None and retries <= 0 and cache is None:
+        resp = requests.get(url, params=params, headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        return resp
+    return get_with_retry(session or requests.Session(), url, params=params, headers=headers,
+                          timeout=timeout, limiter=limiter, retries=retries,
+                          cache=cache, as_of=as_of, accept=accept)
+
+
+def _twse_has_rows(body: bytes) -> bool:
+    try:
+        j = json.loads(body.decode("utf-8"))
+    except ValueError:
+        return False
+    return isinstance(j, dict) and isinstance(j.get("data"), list) and len(j["data"]) > 0
+
+
+def _tpex_has_rows(body: bytes) -> bool:
+    return len(parse_tpex_o_data(body.decode("utf-8", errors="replace"))[1]) > 0
+
+
+def fetch_twse_stock_day_all(d: dt.date, timeout: int = 25, session: Optional[requests.Session] = None,
+                             url: str = TWSE_URL, limiter: Optional[HostLimiter] = None,
+                             retries: int = 0, cache: Optional[HttpCache] = None) -> List[Dict[str, str]]:
     params = {"response": "json", "date": d.strftime("%Y%m%d")}
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Accept": "application/json,text/plain,*/*",
         "Referer": "https://www.twse.com.tw/",
     }
-    resp = requests.get(url, params=params, headers=headers, timeout=timeout)
-    resp.raise_for_status()
+    resp = _get(url, params, headers, timeout, session, limiter, retries, cache, d, _twse_has_rows)
 
     j = resp.json()
     # Typical keys: "fields", "data", "stat", "date", ...
@@ -218,16 +261,16 @@ def parse_tpex_o_data(text: str) -> Tuple[List[str], List[List[str]]]:
     return header, rows
 
 
-def fetch_tpex_daily_close(d: dt.date, timeout: int = 25) -> List[Dict[str, str]]:
-    url = "https://www.tpex.org.tw/web/stock/aftertrading/otc_quotes_no1430/stk_wn1430_result.php"
+def fetch_tpex_daily_close(d: dt.date, timeout: int = 25, session: Optional[requests.Session] = None,
+                           url: str = TPEX_URL, limiter: Optional[HostLimiter] = None,
+                           retries: int = 0, cache: Optional[HttpCache] = None) -> List[Dict[str, str]]:
     params = {"l": "zh-tw", "se": "EW", "o": "data", "d": to_roc_date(d)}
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Accept": "text/plain,text/csv,application/json,*/*",
         "Referer": "https://www.tpex.org.tw/",
     }
-    resp = requests.get(url, params=params, headers=headers, timeout=timeout)
-    resp.raise_for_status()
+    resp = _get(url, params, headers, timeout, session, limiter, retries, cache, d, _tpex_has_rows)
 
     header, rows = parse_tpex_o_data(resp.text)
     if not rows:
@@ -336,13 +379,50 @@ def append_rows(path: str, schema: List[str], rows: List[Dict[str, str]]) -> Non
             w.writerow(r)
 
 
+def default_checkpoint_path(in_csv: str) -> str:
+    return os.path.splitext(in_csv)[0] + ".backfill_checkpoint.json"
+
+
+def load_checkpoint(path: str) -> set:
+    if not path or not os.path.exists(path):
+        return set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            j = json.load(f)
+    except (OSError, ValueError):
+        print(f"[WARN] unreadable checkpoint ignored: {path}")
+        return set()
+    return {str(x) for x in j.get("done", [])}
+
+
+def save_checkpoint(path: str, done: set) -> None:
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"done": sorted(done)}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--start", required=True, help="YYYY-MM-DD")
     ap.add_argument("--end", required=True, help="YYYY-MM-DD")
     ap.add_argument("--in_csv", default=r"data/all_stocks_daily.csv")
     ap.add_argument("--timeout", type=int, default=25)
-    ap.add_argument("--sleep", type=float, default=0.6)
+    ap.add_argument("--sleep", type=float, default=0.6,
+                    help="Seconds between requests to one host; used when --rate is not given.")
+    ap.add_argument("--rate", type=float, default=None, help="Max requests/sec per host (default: 1/--sleep).")
+    ap.add_argument("--burst", type=float, default=1.0, help="Token bucket size per host.")
+    ap.add_argument("--workers", type=int, default=4, help="Concurrent fetches (both hosts together).")
+    ap.add_argument("--retries", type=int, default=3, help="Retries per request on errors/429/5xx.")
+    ap.add_argument("--checkpoint", default=None,
+                    help="JSON of finished dates (default: <in_csv stem>.backfill_checkpoint.json; '' disables).")
+    ap.add_argument("--recheck_empty", action="store_true",
+                    help="Fetch checkpointed dates that had no rows again (they are not in --in_csv).")
+    ap.add_argument("--twse_url", default=TWSE_URL)
+    ap.add_argument("--tpex_url", default=TPEX_URL)
+    ap.add_argument("--no_cache", action="store_true", help="Bypass the shared HTTP response cache.")
     ap.add_argument("--force", action="store_true", help="Backfill even if date exists already (appends anyway).")
     ap.add_argument("--debug", action="store_true")
     args = ap.parse_args()
@@ -355,56 +435,83 @@ def main() -> None:
     if end < start:
         die("end < start")
 
+    ckpt = default_checkpoint_path(args.in_csv) if args.checkpoint is None else args.checkpoint
     have = existing_dates(args.in_csv)
+    done = load_checkpoint(ckpt)
     produced_any = False
 
+    todo: List[dt.date] = []
     for d in daterange(start, end):
         date_str = d.strftime("%Y-%m-%d")
-        if (not args.force) and (date_str in have):
-            print(f"[SKIP] {date_str} already exists")
-            continue
-
-        print(f"[DATE] {date_str}")
-
-        twse = []
-        tpex = []
-        try:
-            twse = fetch_twse_stock_day_all(d, timeout=args.timeout)
-        except Exception as e:
-            print(f"[WARN] TWSE fetch failed date={date_str}: {e}")
-            if args.debug:
-                raise
-
-        try:
-            tpex = fetch_tpex_daily_close(d, timeout=args.timeout)
-        except Exception as e:
-            print(f"[WARN] TPEX fetch failed date={date_str}: {e}")
-            if args.debug:
-                raise
-
-        merged = []
-
-        # Put both markets together; schema may have 'market' column, otherwise ignored.
-        for it in twse:
-            merged.append(it)
-        for it in tpex:
-            merged.append(it)
-
-        if not merged:
-            print(f"[WARN] No rows for {date_str} (holiday or endpoint returned empty)")
-            time.sleep(max(0.0, args.sleep))
-            continue
-
-        rows = build_rows_for_schema(schema, date_str, merged)
-        append_rows(args.in_csv, schema, rows)
-
-        produced_any = True
-        print(f"[OK] appended rows={len(rows)} -> {args.in_csv}")
-        time.sleep(max(0.0, args.sleep))
+        if not args.force:
+            if date_str in have:
+                print(f"[SKIP] {date_str} already exists")
+                continue
+            # dates with rows were skipped above, so a checkpointed date here had none
+            if date_str in done and not args.recheck_empty:
+                print(f"[SKIP] {date_str} done in checkpoint (no rows; --recheck_empty to fetch again)")
+                continue
+        todo.append(d)
+
+    rate = args.rate if args.rate is not None else (1.0 / args.sleep if args.sleep > 0 else None)
+    limiter = HostLimiter(rate, args.burst) if rate else None
+    workers = max(1, int(args.workers))
+    session = make_session(pool_size=workers)
+    cache = None if args.no_cache else HttpCache()
+    fetch_kw = dict(timeout=args.timeout, session=session, limiter=limiter, retries=max(0, args.retries), cache=cache)
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        # submit everything up front: the token buckets pace the requests, the
+        # loop below consumes results in date order so the CSV stays sorted
+        futures = [
+            (d,
+             pool.submit(fetch_twse_stock_day_all, d, url=args.twse_url, **fetch_kw),
+             pool.submit(fetch_tpex_daily_close, d, url=args.tpex_url, **fetch_kw))
+            for d in todo
+        ]
+
+        for d, f_twse, f_tpex in futures:
+            date_str = d.strftime("%Y-%m-%d")
+            print(f"[DATE] {date_str}")
+
+            failed = False
+            results = {}
+            for market, fut in (("TWSE", f_twse), ("TPEX", f_tpex)):
+                try:
+                    results[market] = fut.result()
+                except Exception as e:
+                    print(f"[WARN] {market} fetch failed date={date_str}: {e}")
+                    if args.debug:
+                        raise
+                    failed = True
+            if failed:
+                # neither appended nor checkpointed, so the next run retries the whole date
+                print(f"[WARN] {date_str} left for a later run")
+                continue
+
+            # Put both markets together; schema may have 'market' column, otherwise ignored.
+            merged = results["TWSE"] + results["TPEX"]
+
+            if not merged:
+                print(f"[WARN] No rows for {date_str} (holiday or endpoint returned empty)")
+            else:
+                rows = build_rows_for_schema(schema, date_str, merged)
+                append_rows(args.in_csv, schema, rows)
+                produced_any = True
+                print(f"[OK] appended rows={len(rows)} -> {args.in_csv}")
+
+            if merged or d < dt.date.today():
+                # an empty *today* may just be unpublished yet: keep it retryable
+                done.add(date_str)
+                save_checkpoint(ckpt, done)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        session.close()
 
     if not produced_any:
         raise RuntimeError("No backfill data produced for the given range. Try a wider range (or enable --debug).")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
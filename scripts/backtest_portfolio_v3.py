@@ -24,11 +24,24 @@ import argparse
 import json
 import math
 import os
+import sys
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS not in sys.path:
+    sys.path.insert(0, SCRIPTS)
+ROOT = os.path.dirname(SCRIPTS)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from trading_calendar import TradingCalendar
+from universe_store import load_universe
+from src.utils.instrument import stage, traced_run
+
 
 def _read_csv(path: str, dtype: Optional[dict] = None) -> pd.DataFrame:
     if not os.path.exists(path):
@@ -81,23 +94,6 @@ def _build_index_by_date(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     return out
 
 
-def _sorted_dates(dates: List[str]) -> List[str]:
-    # dates are YYYY-MM-DD; string sort works
-    return sorted({str(d) for d in dates})
-
-
-def _prev_trading_date(target_prev: str, available_dates: List[str]) -> Optional[str]:
-    """Find the nearest date <= target_prev in available_dates."""
-    if not available_dates:
-        return None
-    ds = _sorted_dates(available_dates)
-    # binary-ish scan backwards (small N is fine)
-    for d in reversed(ds):
-        if d <= target_prev:
-            return d
-    return None
-
-
 @dataclass
 class PickResult:
     codes: List[str]
@@ -112,17 +108,18 @@ def _select_codes_for_prev_date(
     threshold: float,
     ranking_by_date: Dict[str, pd.DataFrame],
     all_by_date: Dict[str, pd.DataFrame],
+    calendar: TradingCalendar,
 ) -> PickResult:
     """
     Select up to target_holdings based on prev_date.
-    If prev_date missing in all_by_date, backfill prev_date_used to nearest available <= prev_date.
+    If prev_date missing in all_by_date, backfill prev_date_used to nearest available <= prev_date
+    (calendar = all_by_date's dates).
     Then pick from ranking_history first; if insufficient, fill by all_stocks_daily volume.
     """
     if target_holdings <= 0:
         return PickResult(codes=[], source="RISK_OFF", status="RISK_OFF", prev_date_used=prev_date)
 
-    all_dates = list(all_by_date.keys())
-    prev_date_used = prev_date if prev_date in all_by_date else (_prev_trading_date(prev_date, all_dates) or prev_date)
+    prev_date_used = prev_date if prev_date in all_by_date else (calendar.prev_on_or_before(prev_date) or prev_date)
 
     # 1) ranking_history pool
     picked: List[str] = []
@@ -205,34 +202,81 @@ def _compute_turnover(prev_w: Dict[str, float], cur_w: Dict[str, float]) -> floa
     return max(0.0, min(1.0, 1.0 - overlap))
 
 
-def _get_ret(all_by_date: Dict[str, pd.DataFrame], date: str, code: str) -> Optional[float]:
-    df = all_by_date.get(date)
-    if df is None or len(df) == 0:
-        return None
-    m = df[df["code"].astype(str) == str(code)]
-    if len(m) == 0:
-        return None
-    v = m.iloc[0].get("change_percent", None)
-    r = _to_float(v, math.nan)
-    if math.isnan(r):
-        return None
-    return r / 100.0
-
-
-def _lookup_meta(all_by_date: Dict[str, pd.DataFrame], date: str, code: str) -> Tuple[str, str, str, float]:
-    """name, sector, source, total_score (best effort from all_stocks_daily on prev_date_used)."""
-    df = all_by_date.get(date)
-    if df is None or len(df) == 0:
-        return ("", "", "", math.nan)
-    m = df[df["code"].astype(str) == str(code)]
-    if len(m) == 0:
-        return ("", "", "", math.nan)
-    row = m.iloc[0]
-    name = _safe_str(row.get("name", ""))
-    sector = _safe_str(row.get("sector", ""))
-    src = _safe_str(row.get("source", ""))
-    ts = _to_float(row.get("total_score", None), math.nan)
-    return (name, sector, src, ts)
+def _float_values(col: pd.Series) -> List[float]:
+    """_to_float over a column (NaN when unparseable); numeric columns skip the per-value parse."""
+    if pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
+        return col.astype(float).tolist()
+    return [_to_float(v, math.nan) for v in col.tolist()]
+
+
+class DailyPanel:
+    """
+    (date, code) -> row lookups over all_stocks_daily.
+
+    Replaces filtering the date's sub-frame with `df["code"].astype(str) == code`
+    on every call: each date's code -> row map (plus parsed returns and meta
+    columns) is built on first use, after which lookups are dict hits. On
+    duplicate (date, code) rows the first one wins, as iloc[0] did.
+    """
+
+    META_COLS = ("name", "sector", "source", "total_score")
+
+    def __init__(self, df: pd.DataFrame, by_date: Optional[Dict[str, pd.DataFrame]] = None):
+        self._by_date = by_date if by_date is not None else _build_index_by_date(df)
+        self._slices: Dict[str, Optional[tuple]] = {}
+
+    def _slice(self, date: str) -> Optional[tuple]:
+        if date in self._slices:
+            return self._slices[date]
+        g = self._by_date.get(date)
+        out = None
+        if g is not None and len(g) > 0 and "code" in g.columns:
+            pos: Dict[str, int] = {}
+            for i, c in enumerate(g["code"].astype(str).tolist()):
+                if c not in pos:
+                    pos[c] = i
+            if "change_percent" in g.columns:
+                rets = [None if math.isnan(v) else v / 100.0 for v in _float_values(g["change_percent"])]
+            else:
+                rets = [None] * len(g)
+            meta = {c: g[c].tolist() for c in self.META_COLS if c in g.columns}
+            out = (pos, rets, meta)
+        self._slices[date] = out
+        return out
+
+    def ret(self, date: str, code: str) -> Optional[float]:
+        """change_percent / 100 for (date, code), or None when missing / not a number."""
+        sl = self._slice(date)
+        if sl is None:
+            return None
+        i = sl[0].get(str(code))
+        return None if i is None else sl[1][i]
+
+    def rets(self, date: str, codes: Iterable[str]) -> List[Optional[float]]:
+        """ret(date, c) for every c in codes, with one slice lookup for the date."""
+        sl = self._slice(date)
+        if sl is None:
+            return [None for _ in codes]
+        pos, vals = sl[0], sl[1]
+        return [None if (i := pos.get(str(c))) is None else vals[i] for c in codes]
+
+    def meta(self, date: str, code: str) -> Tuple[str, str, str, float]:
+        """name, sector, source, total_score (best effort from all_stocks_daily on prev_date_used)."""
+        sl = self._slice(date)
+        i = None if sl is None else sl[0].get(str(code))
+        if i is None:
+            return ("", "", "", math.nan)
+        m = sl[2]
+
+        def _get(col: str, default):
+            return m[col][i] if col in m else default
+
+        return (
+            _safe_str(_get("name", "")),
+            _safe_str(_get("sector", "")),
+            _safe_str(_get("source", "")),
+            _to_float(_get("total_score", None), math.nan),
+        )
 
 
 def _get_market_flags(market_by_date: Dict[str, pd.DataFrame], date: str) -> Tuple[bool, bool]:
@@ -263,52 +307,47 @@ def _get_breadth_metric(breadth_by_date: Dict[str, pd.DataFrame], date: str, fie
     return _to_float(row.get(field, None), math.nan)
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    # compatibility / inputs
-    ap.add_argument("--ranking_history_csv", default="data/ranking_history.csv")
-    ap.add_argument("--in_csv", default=None, help="(compat) deprecated; ignored if ranking_history_csv exists")
-    ap.add_argument("--market_csv", default="data/market_snapshot_taiex.csv")
-    ap.add_argument("--breadth_history_csv", default="data/breadth_history.csv")
-    # strategy params
-    ap.add_argument("--breadth_field", default="adv_ratio")
-    ap.add_argument("--breadth_min", type=float, default=0.50)
-    ap.add_argument("--threshold", type=float, default=70.0)
-    ap.add_argument("--holdings_on", type=int, default=15)
-    ap.add_argument("--cost_bps", type=float, default=25.0)
-    ap.add_argument("--init_capital", type=float, default=1_000_000.0)
-    ap.add_argument("--debug_date", default=None)
+def _frame(path: str, dtype: dict, frames: Optional[Dict[str, pd.DataFrame]]) -> pd.DataFrame:
+    """path's rows: the in-memory copy from frames when the caller has one, else read from disk."""
+    if frames and path in frames:
+        return frames[path].copy()
+    return _read_csv(path, dtype=dtype)
 
-    args = ap.parse_args()
 
+def _load_inputs(
+    args: argparse.Namespace,
+    all_df: Optional[pd.DataFrame] = None,
+    frames: Optional[Dict[str, pd.DataFrame]] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, str]:
+    """
+    all_df: universe frame already loaded by the caller (not modified);
+    frames: {csv path: DataFrame} already in memory for any of the args' csv paths.
+    """
     # ---- load universe ----
-    all_path = r"data/all_stocks_daily.csv"
-    all_df = _read_csv(all_path, dtype={"code": str, "source": str})
-    all_df["date"] = all_df["date"].astype(str)
-    all_df["code"] = all_df["code"].astype(str)
-    all_by_date = _build_index_by_date(all_df)
+    if all_df is None:
+        all_path = r"data/all_stocks_daily.csv"
+        all_df = load_universe(csv_path=all_path, float32_scores=False)
+    all_df = all_df.assign(date=all_df["date"].astype(str), code=all_df["code"].astype(str))
 
     # ---- load market ----
     market_df = pd.DataFrame()
     if os.path.exists(args.market_csv):
-        market_df = _read_csv(args.market_csv, dtype={"source": str})
+        market_df = _frame(args.market_csv, {"source": str}, frames)
         if "date" in market_df.columns:
             market_df["date"] = market_df["date"].astype(str)
-    market_by_date = _build_index_by_date(market_df) if len(market_df) > 0 else {}
 
     # ---- load breadth ----
     breadth_df = pd.DataFrame()
     if os.path.exists(args.breadth_history_csv):
-        breadth_df = _read_csv(args.breadth_history_csv, dtype={"source": str})
+        breadth_df = _frame(args.breadth_history_csv, {"source": str}, frames)
         if "date" in breadth_df.columns:
             breadth_df["date"] = breadth_df["date"].astype(str)
-    breadth_by_date = _build_index_by_date(breadth_df) if len(breadth_df) > 0 else {}
 
     # ---- load ranking history (primary) ----
     ranking_df = pd.DataFrame()
     ranking_source = "RANKING_HISTORY"
     if os.path.exists(args.ranking_history_csv):
-        ranking_df = _read_csv(args.ranking_history_csv, dtype={"code": str, "source": str})
+        ranking_df = _frame(args.ranking_history_csv, {"code": str, "source": str}, frames)
         if "date" in ranking_df.columns:
             ranking_df["date"] = ranking_df["date"].astype(str)
         ranking_df["code"] = ranking_df["code"].astype(str)
@@ -316,53 +355,275 @@ def main() -> int:
         # compat fallback: if caller provided in_csv, try it as ranking history (single-date ranking is still usable for that date only)
         if args.in_csv and os.path.exists(args.in_csv):
             ranking_source = "RANKING_CSV_COMPAT"
-            ranking_df = _read_csv(args.in_csv, dtype={"code": str, "source": str})
+            ranking_df = _frame(args.in_csv, {"code": str, "source": str}, frames)
             if "date" in ranking_df.columns:
                 ranking_df["date"] = ranking_df["date"].astype(str)
             else:
                 # no date column: cannot build history; keep empty
                 ranking_df = pd.DataFrame()
 
+    return all_df, market_df, breadth_df, ranking_df, ranking_source
+
+
+@dataclass
+class BacktestResult:
+    backtest_rows: List[dict]
+    attrib_rows: List[dict]
+    holdings_rows: List[dict]
+    plan_rows: List[dict]
+    summary: dict
+
+
+@dataclass
+class _DayPlan:
+    """Path-dependent part of one backtest day: regime + picks + target weights."""
+    date: str
+    prev_date: str
+    market_ok: bool
+    trend_ok: bool
+    breadth_metric: float
+    risk_on: bool
+    risk_mode: str
+    target_holdings: int
+    pick: PickResult
+    weights: Dict[str, float]
+
+
+@dataclass
+class _Accounting:
+    """Per-day returns/costs/equity, one entry per _DayPlan; rets[t] maps each held code to its return (or None)."""
+    turnover: List[float]
+    gross: List[float]
+    cost_frac: List[float]
+    net: List[float]
+    equity: List[float]
+    drawdown: List[float]
+    returns_count: List[int]
+    rets: List[Dict[str, Optional[float]]]
+
+
+def _account_loop(days: List[_DayPlan], panel: DailyPanel, cost_bps: float, init_cap: float) -> _Accounting:
+    """Day-by-day accounting (reference engine)."""
+    acc = _Accounting([], [], [], [], [], [], [], [])
+    equity = init_cap
+    peak = init_cap
+    prev_weights: Dict[str, float] = {}
+
+    for day in days:
+        d = day.date
+        cur_weights = day.weights
+
+        # compute returns (one lookup per holding, reused by the holdings export)
+        day_rets = {c: panel.ret(d, c) for c in cur_weights}
+        returns_count = 0
+        gross = 0.0
+
+        # If NO_PICKS on RISK_ON => do NOT charge turnover/cost, do NOT pretend turnover.
+        if day.risk_on and len(cur_weights) == 0 and day.pick.status == "NO_PICKS":
+            turnover = 0.0
+            cost_frac = 0.0
+            net = 0.0
+        else:
+            turnover = _compute_turnover(prev_weights, cur_weights)
+            cost_frac = turnover * (float(cost_bps) / 10000.0)
+
+            # realized gross (missing returns treated as 0 to avoid bias / keep deterministic)
+            for c, w in cur_weights.items():
+                r = day_rets[c]
+                if r is not None:
+                    returns_count += 1
+                    gross += w * r
+                else:
+                    gross += 0.0
+
+            net = gross - cost_frac
+
+        # equity update
+        equity = equity * (1.0 + net)
+        peak = max(peak, equity)
+        drawdown = 0.0 if peak <= 0 else (peak - equity) / peak
+
+        acc.turnover.append(turnover)
+        acc.gross.append(gross)
+        acc.cost_frac.append(cost_frac)
+        acc.net.append(net)
+        acc.equity.append(equity)
+        acc.drawdown.append(drawdown)
+        acc.returns_count.append(returns_count)
+        acc.rets.append(day_rets)
+
+        prev_weights = cur_weights
+
+    return acc
+
+
+def _account_matrix(days: List[_DayPlan], panel: DailyPanel, cost_bps: float, init_cap: float) -> _Accounting:
+    """
+    Bulk accounting over the plans as a sparse (CSR-style) dates x codes
+    weight matrix: one cell per held (date, code), stored day by day in
+    weight order as row (day), idx (column among the codes ever held),
+    weight w and return r (NaN when missing).
+
+    Only held cells are stored (~holdings_on per day, not the whole
+    universe), gross / returns_count / overlap are per-day grouped sums
+    (bincount), turnover matches each cell against the previous day's cells by
+    a sorted (day, column) key, and equity / drawdown are a cumprod / running
+    max. Sums run in the same order as _account_loop, so the results are equal.
+    """
+    n = len(days)
+    col: Dict[str, int] = {}
+    counts = np.zeros(n, dtype=np.int64)
+    idx_l: List[int] = []
+    w_l: List[float] = []
+    r_l: List[Optional[float]] = []
+    rets: List[Dict[str, Optional[float]]] = []
+    for t, day in enumerate(days):
+        day_r = panel.rets(day.date, day.weights)
+        rets.append(dict(zip(day.weights, day_r)))
+        counts[t] = len(day_r)
+        idx_l.extend([col.setdefault(c, len(col)) for c in day.weights])
+        w_l.extend(day.weights.values())
+        r_l.extend(day_r)
+
+    idx = np.array(idx_l, dtype=np.int64)
+    w = np.array(w_l, dtype=float)
+    r = np.array(r_l, dtype=float)  # None -> NaN
+    row = np.repeat(np.arange(n), counts)
+
+    # realized gross (missing returns count as 0)
+    has_ret = ~np.isnan(r)
+    gross = np.bincount(row, weights=np.where(has_ret, w * np.nan_to_num(r), 0.0), minlength=n)
+    returns_count = np.bincount(row[has_ret], minlength=n)
+
+    # overlap with the previous day: cell (t, j) matches cell (t - 1, j)
+    overlap = np.zeros(n)
+    if len(idx):
+        width = len(col)
+        key = row * width + idx
+        next_key = (row + 1) * width + idx  # each cell as seen from the following day
+        order = np.argsort(next_key, kind="stable")
+        sorted_next = next_key[order]
+        j = np.minimum(np.searchsorted(sorted_next, key), len(sorted_next) - 1)
+        hit = sorted_next[j] == key
+        overlap = np.bincount(row, weights=np.where(hit, np.minimum(w, w[order][j]), 0.0), minlength=n)
+    cur_any = counts > 0
+    prev_any = np.concatenate([[False], cur_any[:-1]])
+    turnover = np.where(
+        prev_any & cur_any,
+        np.clip(1.0 - overlap, 0.0, 1.0),
+        np.where(prev_any | cur_any, 1.0, 0.0),
+    )
+
+    # RISK_ON with NO_PICKS: no turnover, no cost, no return
+    no_picks = np.array(
+        [day.risk_on and not day.weights and day.pick.status == "NO_PICKS" for day in days],
+        dtype=bool,
+    )
+    turnover[no_picks] = 0.0
+    cost_frac = turnover * (float(cost_bps) / 10000.0)
+    net = gross - cost_frac
+    net[no_picks] = 0.0
+
+    equity = np.cumprod(np.concatenate([[init_cap], 1.0 + net]))[1:]
+    peak = np.maximum.accumulate(np.concatenate([[init_cap], equity]))[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.where(peak <= 0, 0.0, (peak - equity) / peak)
+
+    return _Accounting(
+        turnover=turnover.tolist(),
+        gross=gross.tolist(),
+        cost_frac=cost_frac.tolist(),
+        net=net.tolist(),
+        equity=equity.tolist(),
+        drawdown=drawdown.tolist(),
+        returns_count=[int(x) for x in returns_count.tolist()],
+        rets=rets,
+    )
+
+
+def _rank_score_maps(rh: Optional[pd.DataFrame]) -> Tuple[Dict[str, int], Dict[str, float]]:
+    """rank + total_score by code from one ranking_history date (column-wise, no iterrows)."""
+    rank_map: Dict[str, int] = {}
+    score_map: Dict[str, float] = {}
+    if rh is None or len(rh) == 0 or "code" not in rh.columns:
+        return rank_map, score_map
+    codes = rh["code"].astype(str).tolist()
+    if "rank" in rh.columns:
+        for c, v in zip(codes, rh["rank"].tolist()):
+            if c:
+                try:
+                    rank_map[c] = int(float(v))
+                except Exception:
+                    pass
+    if "total_score" in rh.columns:
+        for c, v in zip(codes, rh["total_score"].tolist()):
+            if c:
+                score_map[c] = _to_float(v, math.nan)
+    return rank_map, score_map
+
+
+def run_backtest(
+    all_df: pd.DataFrame,
+    market_df: pd.DataFrame,
+    breadth_df: pd.DataFrame,
+    ranking_df: pd.DataFrame,
+    ranking_source: str = "RANKING_HISTORY",
+    breadth_field: str = "adv_ratio",
+    breadth_min: float = 0.50,
+    threshold: float = 70.0,
+    holdings_on: int = 15,
+    cost_bps: float = 25.0,
+    init_capital: float = 1_000_000.0,
+    debug_date: Optional[str] = None,
+    engine: str = "loop",
+) -> BacktestResult:
+    """
+    Daily v3 backtest over already-loaded frames (dates/codes as str); nothing is written.
+
+    Regime and picks are path-dependent and always run day by day. engine
+    selects how returns, turnover, cost and equity are computed:
+    "loop" (day by day, reference) or "matrix" (sparse bulk, _account_matrix).
+    """
+    if engine not in ("loop", "matrix"):
+        raise ValueError(f"Unknown engine: {engine}")
+
+    all_by_date = _build_index_by_date(all_df)
+    all_calendar = TradingCalendar(all_by_date.keys())
+    panel = DailyPanel(all_df, all_by_date)
+    market_by_date = _build_index_by_date(market_df) if len(market_df) > 0 else {}
+    breadth_by_date = _build_index_by_date(breadth_df) if len(breadth_df) > 0 else {}
     ranking_by_date = _build_index_by_date(ranking_df) if len(ranking_df) > 0 else {}
 
     # ---- backtest date range ----
     # Prefer market dates if present; else use all_stocks_daily dates.
     if len(market_df) > 0 and "date" in market_df.columns:
-        dates = _sorted_dates(market_df["date"].tolist())
+        dates = TradingCalendar(market_df["date"].tolist()).dates
     else:
-        dates = _sorted_dates(list(all_by_date.keys()))
+        dates = all_calendar.dates
 
     if not dates:
         raise SystemExit("No dates found to backtest.")
 
-    # ---- run ----
-    init_cap = float(args.init_capital)
-    equity = init_cap
-    peak = init_cap
-    prev_weights: Dict[str, float] = {}
-
-    backtest_rows: List[dict] = []
-    attrib_rows: List[dict] = []
-    holdings_rows: List[dict] = []
-    plan_rows: List[dict] = []
-
+    # ---- regime + picks (path-dependent) ----
+    days: List[_DayPlan] = []
     for i, d in enumerate(dates):
         prev_date = dates[i - 1] if i > 0 else d
 
         market_ok, trend_ok = _get_market_flags(market_by_date, d)
-        breadth_metric = _get_breadth_metric(breadth_by_date, d, args.breadth_field)
+        breadth_metric = _get_breadth_metric(breadth_by_date, d, breadth_field)
 
-        risk_on = bool(market_ok) and bool(trend_ok) and (not math.isnan(breadth_metric)) and (breadth_metric >= float(args.breadth_min))
+        risk_on = bool(market_ok) and bool(trend_ok) and (not math.isnan(breadth_metric)) and (breadth_metric >= float(breadth_min))
         risk_mode = "RISK_ON" if risk_on else "RISK_OFF"
 
-        target_holdings = int(args.holdings_on) if risk_on else 0
+        target_holdings = int(holdings_on) if risk_on else 0
 
         pick = _select_codes_for_prev_date(
             prev_date=prev_date,
             target_holdings=target_holdings,
-            threshold=float(args.threshold),
+            threshold=float(threshold),
             ranking_by_date=ranking_by_date,
             all_by_date=all_by_date,
+            calendar=all_calendar,
         )
 
         # weights
@@ -372,38 +633,43 @@ def main() -> int:
             for c in pick.codes:
                 cur_weights[str(c)] = w
 
-        # compute returns
-        returns_count = 0
-        gross = 0.0
-
-        # If NO_PICKS on RISK_ON => do NOT charge turnover/cost, do NOT pretend turnover.
-        if risk_on and len(cur_weights) == 0 and pick.status == "NO_PICKS":
-            turnover = 0.0
-            cost_frac = 0.0
-            net = 0.0
-        else:
-            turnover = _compute_turnover(prev_weights, cur_weights)
-            cost_frac = turnover * (float(args.cost_bps) / 10000.0)
+        days.append(_DayPlan(d, prev_date, market_ok, trend_ok, breadth_metric, risk_on, risk_mode, target_holdings, pick, cur_weights))
 
-            # realized gross (missing returns treated as 0 to avoid bias / keep deterministic)
-            for c, w in cur_weights.items():
-                r = _get_ret(all_by_date, d, c)
-                if r is not None:
-                    returns_count += 1
-                    gross += w * r
-                else:
-                    gross += 0.0
+    # ---- returns / turnover / cost / equity ----
+    init_cap = float(init_capital)
+    if engine == "matrix":
+        acc = _account_matrix(days, panel, cost_bps, init_cap)
+    else:
+        acc = _account_loop(days, panel, cost_bps, init_cap)
 
-            net = gross - cost_frac
+    # ---- exports ----
+    backtest_rows: List[dict] = []
+    attrib_rows: List[dict] = []
+    holdings_rows: List[dict] = []
+    plan_rows: List[dict] = []
 
-        # equity update
-        equity = equity * (1.0 + net)
-        peak = max(peak, equity)
-        drawdown = 0.0 if peak <= 0 else (peak - equity) / peak
+    for t, day in enumerate(days):
+        d = day.date
+        prev_date = day.prev_date
+        pick = day.pick
+        cur_weights = day.weights
+        market_ok = day.market_ok
+        trend_ok = day.trend_ok
+        breadth_metric = day.breadth_metric
+        risk_mode = day.risk_mode
+        target_holdings = day.target_holdings
+        day_rets = acc.rets[t]
+        returns_count = acc.returns_count[t]
+        turnover = acc.turnover[t]
+        gross = acc.gross[t]
+        cost_frac = acc.cost_frac[t]
+        net = acc.net[t]
+        equity = acc.equity[t]
+        drawdown = acc.drawdown[t]
 
         # exports: holdings detail
         for c, w in cur_weights.items():
-            r = _get_ret(all_by_date, d, c)
+            r = day_rets[c]
             contrib = 0.0 if r is None else (w * r)
             holdings_rows.append({
                 "date": d,
@@ -427,10 +693,10 @@ def main() -> int:
             "risk_mode": risk_mode,
             "market_ok": bool(market_ok),
             "trend_ok": bool(trend_ok),
-            "breadth_field": args.breadth_field,
+            "breadth_field": breadth_field,
             "breadth_metric": "" if math.isnan(breadth_metric) else breadth_metric,
-            "breadth_min": float(args.breadth_min),
-            "threshold": float(args.threshold),
+            "breadth_min": float(breadth_min),
+            "threshold": float(threshold),
             "holdings": picked_count,
             "picked_count": picked_count,
             "returns_count": returns_count,
@@ -453,10 +719,10 @@ def main() -> int:
                 "risk_mode": risk_mode,
                 "market_ok": bool(market_ok),
                 "trend_ok": bool(trend_ok),
-                "breadth_field": args.breadth_field,
+                "breadth_field": breadth_field,
                 "breadth_metric": "" if math.isnan(breadth_metric) else breadth_metric,
-                "breadth_min": float(args.breadth_min),
-                "threshold": float(args.threshold),
+                "breadth_min": float(breadth_min),
+                "threshold": float(threshold),
                 "rank": "",
                 "code": "",
                 "name": "",
@@ -470,29 +736,10 @@ def main() -> int:
             })
         else:
             # rank + total_score: best-effort from ranking_history on prev_date_used, else from all_stocks_daily
-            rh = ranking_by_date.get(pick.prev_date_used)
-            rank_map: Dict[str, int] = {}
-            score_map: Dict[str, float] = {}
-
-            if rh is not None and len(rh) > 0 and "code" in rh.columns:
-                tmp = rh.copy()
-                tmp["code"] = tmp["code"].astype(str)
-                if "rank" in tmp.columns:
-                    for _, rr in tmp.iterrows():
-                        c = str(rr.get("code", ""))
-                        if c:
-                            try:
-                                rank_map[c] = int(float(rr.get("rank")))
-                            except Exception:
-                                pass
-                if "total_score" in tmp.columns:
-                    for _, rr in tmp.iterrows():
-                        c = str(rr.get("code", ""))
-                        if c:
-                            score_map[c] = _to_float(rr.get("total_score", None), math.nan)
+            rank_map, score_map = _rank_score_maps(ranking_by_date.get(pick.prev_date_used))
 
             for c, w in cur_weights.items():
-                name, sector, src, ts = _lookup_meta(all_by_date, pick.prev_date_used, c)
+                name, sector, src, ts = panel.meta(pick.prev_date_used, c)
                 ts2 = score_map.get(c, ts)
                 plan_rows.append({
                     "date": d,
@@ -501,10 +748,10 @@ def main() -> int:
                     "risk_mode": risk_mode,
                     "market_ok": bool(market_ok),
                     "trend_ok": bool(trend_ok),
-                    "breadth_field": args.breadth_field,
+                    "breadth_field": breadth_field,
                     "breadth_metric": "" if math.isnan(breadth_metric) else breadth_metric,
-                    "breadth_min": float(args.breadth_min),
-                    "threshold": float(args.threshold),
+                    "breadth_min": float(breadth_min),
+                    "threshold": float(threshold),
                     "rank": rank_map.get(c, ""),
                     "code": c,
                     "name": name,
@@ -535,17 +782,17 @@ def main() -> int:
         })
 
         # debug print
-        if args.debug_date and str(args.debug_date) == str(d):
+        if debug_date and str(debug_date) == str(d):
             print("===== DEBUG_DATE =====")
             print(f"date={d} prev_date={prev_date} prev_date_used={pick.prev_date_used} risk_mode={risk_mode}")
-            print(f"market_ok={market_ok} trend_ok={trend_ok} breadth_field={args.breadth_field} breadth_metric={breadth_metric} breadth_min={args.breadth_min}")
-            print(f"threshold={args.threshold} target_holdings={target_holdings} selection_source={pick.source} status={pick.status}")
+            print(f"market_ok={market_ok} trend_ok={trend_ok} breadth_field={breadth_field} breadth_metric={breadth_metric} breadth_min={breadth_min}")
+            print(f"threshold={threshold} target_holdings={target_holdings} selection_source={pick.source} status={pick.status}")
             print(f"picked_codes({len(pick.codes)}): {','.join(pick.codes)}")
             if pick.codes:
                 # show returns breakdown
                 pairs = []
                 for c in pick.codes:
-                    r = _get_ret(all_by_date, d, c)
+                    r = panel.ret(d, c)
                     pairs.append((c, -999 if r is None else r))
                 # sort by ret desc
                 pairs2 = sorted(pairs, key=lambda t: t[1], reverse=True)
@@ -558,8 +805,6 @@ def main() -> int:
             print(f"returns_count={returns_count} gross_return={gross} cost_frac={cost_frac} net_return={net} turnover={turnover}")
             print("===== DEBUG_END =====")
 
-        prev_weights = cur_weights
-
     # ---- metrics ----
     total_return = (equity / init_cap - 1.0) if init_cap > 0 else 0.0
     # daily bars count
@@ -590,26 +835,93 @@ def main() -> int:
         "max_drawdown": mdd,
         "sharpe": sharpe,
         "bars": len(backtest_rows),
-        "breadth_field": args.breadth_field,
-        "breadth_min": float(args.breadth_min),
-        "cost_bps": float(args.cost_bps),
-        "holdings_on": int(args.holdings_on),
-        "threshold": float(args.threshold),
+        "breadth_field": breadth_field,
+        "breadth_min": float(breadth_min),
+        "cost_bps": float(cost_bps),
+        "holdings_on": int(holdings_on),
+        "threshold": float(threshold),
         "ranking_source": ranking_source,
     }
 
-    # ---- write outputs ----
-    _write_csv("reports/portfolio_backtest_v3.csv", backtest_rows)
-    _write_csv("reports/portfolio_attribution_v3.csv", attrib_rows)
-    _write_csv("reports/portfolio_holdings_v3.csv", holdings_rows)
-    _write_csv("reports/portfolio_plan_v3_daily.csv", plan_rows)
-    _write_json("reports/portfolio_backtest_v3_summary.json", summary)
-
-    print("OK: wrote -> reports/portfolio_backtest_v3.csv")
-    print("OK: wrote -> reports/portfolio_holdings_v3.csv")
-    print("OK: wrote -> reports/portfolio_attribution_v3.csv")
-    print("OK: wrote -> reports/portfolio_plan_v3_daily.csv")
-    print("OK: wrote -> reports/portfolio_backtest_v3_summary.json")
+    return BacktestResult(backtest_rows, attrib_rows, holdings_rows, plan_rows, summary)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser()
+    # compatibility / inputs
+    ap.add_argument("--ranking_history_csv", default="data/ranking_history.csv")
+    ap.add_argument("--in_csv", default=None, help="(compat) deprecated; ignored if ranking_history_csv exists")
+    ap.add_argument("--market_csv", default="data/market_snapshot_taiex.csv")
+    ap.add_argument("--breadth_history_csv", default="data/breadth_history.csv")
+    # strategy params
+    ap.add_argument("--breadth_field", default="adv_ratio")
+    ap.add_argument("--breadth_min", type=float, default=0.50)
+    ap.add_argument("--threshold", type=float, default=70.0)
+    ap.add_argument("--holdings_on", type=int, default=15)
+    ap.add_argument("--cost_bps", type=float, default=25.0)
+    ap.add_argument("--init_capital", type=float, default=1_000_000.0)
+    ap.add_argument("--debug_date", default=None)
+    ap.add_argument("--engine", choices=["loop", "matrix"], default="loop", help="matrix = sparse bulk return/turnover/equity")
+
+    return ap.parse_args(argv)
+
+
+def backtest_from_args(
+    args: argparse.Namespace,
+    all_df: Optional[pd.DataFrame] = None,
+    frames: Optional[Dict[str, pd.DataFrame]] = None,
+) -> BacktestResult:
+    with stage("load_inputs") as st:
+        all_df, market_df, breadth_df, ranking_df, ranking_source = _load_inputs(args, all_df=all_df, frames=frames)
+        st.rows_out = len(all_df) + len(market_df) + len(breadth_df) + len(ranking_df)
+    with stage("run_backtest", rows_in=len(all_df)) as st:
+        res = run_backtest(
+            all_df,
+            market_df,
+            breadth_df,
+            ranking_df,
+            ranking_source=ranking_source,
+            breadth_field=args.breadth_field,
+            breadth_min=float(args.breadth_min),
+            threshold=float(args.threshold),
+            holdings_on=int(args.holdings_on),
+            cost_bps=float(args.cost_bps),
+            init_capital=float(args.init_capital),
+            debug_date=args.debug_date,
+            engine=args.engine,
+        )
+        st.rows_out = len(res.backtest_rows)
+    return res
+
+
+def write_outputs(res: BacktestResult, out_dir: str = "reports") -> None:
+    with stage("write_outputs") as st:
+        for name, rows in (
+            ("portfolio_backtest_v3.csv", res.backtest_rows),
+            ("portfolio_attribution_v3.csv", res.attrib_rows),
+            ("portfolio_holdings_v3.csv", res.holdings_rows),
+            ("portfolio_plan_v3_daily.csv", res.plan_rows),
+        ):
+            _write_csv(os.path.join(out_dir, name), rows)
+            st.wrote(os.path.join(out_dir, name))
+        _write_json(os.path.join(out_dir, "portfolio_backtest_v3_summary.json"), res.summary)
+        st.wrote(os.path.join(out_dir, "portfolio_backtest_v3_summary.json"))
+        st.rows_in = len(res.backtest_rows) + len(res.attrib_rows) + len(res.holdings_rows) + len(res.plan_rows)
+
+    print(f"OK: wrote -> {out_dir}/portfolio_backtest_v3.csv")
+    print(f"OK: wrote -> {out_dir}/portfolio_holdings_v3.csv")
+    print(f"OK: wrote -> {out_dir}/portfolio_attribution_v3.csv")
+    print(f"OK: wrote -> {out_dir}/portfolio_plan_v3_daily.csv")
+    print(f"OK: wrote -> {out_dir}/portfolio_backtest_v3_summary.json")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    with traced_run("backtest_portfolio_v3"):
+        res = backtest_from_args(args)
+
+        # ---- write outputs ----
+        write_outputs(res)
     return 0
 
 
@@ -0,0 +1,95 @@
+﻿from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.adapters.market_data import MarketDataResult, SymbolSeries, load_prices_from_universe
+from src.core.engine import InvestmentEngine
+from src.domain.config import AppConfig
+from src.services.backtest import run_backtest
+
+
+def synthetic_panel(symbols: int, days: int, seed: int = 7, gap_prob: float = 0.02) -> MarketDataResult:
+    """Random-walk closes on weekdays; each symbol randomly skips ~gap_prob of days."""
+    rng = random.Random(seed)
+    cal = []
+    d = date(2015, 1, 1)
+    while len(cal) < days:
+        if d.weekday() < 5:
+            cal.append(d.isoformat())
+        d += timedelta(days=1)
+
+    series = {}
+    for k in range(symbols):
+        px = rng.uniform(20.0, 800.0)
+        ds, cs = [], array("d")
+        for key in cal:
+            px = max(1.0, round(px * (1.0 + rng.gauss(0.0, 0.02)), 2))
+            if rng.random() < gap_prob:
+                continue
+            ds.append(key)
+            cs.append(px)
+        series[f"S{k:04d}"] = SymbolSeries(ds, cs)
+    return MarketDataResult(series)
+
+
+def _run(md: MarketDataResult, cfg: AppConfig, mode: str):
+    t0 = time.perf_counter()
+    report = run_backtest(
+        md=md,
+        engine=InvestmentEngine(cfg),
+        cfg=cfg,
+        start_cash=float(cfg.total_capital),
+        log_equity_path=None,
+        log_metrics_path=None,
+        log_trades_path=None,
+        engine_mode=mode,
+    )
+    return report, time.perf_counter() - t0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Loop vs vectorized run_backtest: parity check + bars/sec")
+    ap.add_argument("--symbols", type=int, default=50)
+    ap.add_argument("--days", type=int, default=1000)
+    ap.add_argument("--universe", action="store_true", help="use data/universe_stock.csv + data/history instead")
+    ap.add_argument("--ma_short", type=int, default=5)
+    ap.add_argument("--ma_long", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    md = load_prices_from_universe() if args.universe else synthetic_panel(args.symbols, args.days, args.seed)
+    cfg = AppConfig(ma_short=args.ma_short, ma_long=args.ma_long)
+    bars = len(md.dates()) * len(md.symbols())
+
+    loop_report, loop_sec = _run(md, cfg, "loop")
+    vec_report, vec_sec = _run(md, cfg, "vectorized")
+
+    same = (
+        loop_report.metrics == vec_report.metrics
+        and loop_report.equity == vec_report.equity
+        and loop_report.fills == vec_report.fills
+    )
+
+    print(f"panel: symbols={len(md.symbols())} dates={len(md.dates())} bars={bars}")
+    print(f"  loop       seconds={loop_sec:.3f} bars/sec={bars / max(loop_sec, 1e-9):,.0f}")
+    print(f"  vectorized seconds={vec_sec:.3f} bars/sec={bars / max(vec_sec, 1e-9):,.0f}")
+    print(f"  speedup={loop_sec / max(vec_sec, 1e-9):.1f}x parity={'OK' if same else 'MISMATCH'}")
+    if not same:
+        print("ERROR: vectorized report differs from loop report")
+        return 1
+    print("OK: bench_backtest_engine done")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
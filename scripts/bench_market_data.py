@@ -0,0 +1,73 @@
+﻿from __future__ import annotations
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.market_data import MarketData
+
+
+def _list_copy_windows(md: MarketData):
+    # previous behaviour: closes_upto returned self.closes[: idx + 1] (fresh list per bar)
+    closes = list(md.closes)
+    for i in range(len(md.dates)):
+        yield lambda i=i: closes[: i + 1]
+
+
+def _view_windows(md: MarketData):
+    for d in md.dates:
+        yield lambda d=d: md.closes_upto(d)
+
+
+def _walk_seconds(make_windows, md: MarketData) -> float:
+    t0 = time.perf_counter()
+    acc = 0.0
+    for get in make_windows(md):
+        acc += get()[-1]
+    return time.perf_counter() - t0
+
+
+def _walk_allocations(make_windows, md: MarketData) -> tuple[int, int]:
+    """(bytes allocated, allocation events) summed over every closes_upto call."""
+    total_bytes = 0
+    events = 0
+    tracemalloc.start()
+    for get in make_windows(md):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        w = get()
+        _, peak = tracemalloc.get_traced_memory()
+        if peak > base:
+            total_bytes += peak - base
+            events += 1
+        del w
+    tracemalloc.stop()
+    return total_bytes, events
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="closes_upto allocation benchmark: list copy vs memoryview")
+    ap.add_argument("--csv", default="data/taiex_daily.csv")
+    args = ap.parse_args()
+
+    md = MarketData.from_csv(args.csv)
+    bars = len(md.dates)
+
+    print(f"csv={args.csv} bars={bars}")
+    for name, make in [("before:list_copy", _list_copy_windows), ("after:memoryview", _view_windows)]:
+        secs = _walk_seconds(make, md)
+        nbytes, events = _walk_allocations(make, md)
+        print(f"  {name:<18} seconds={secs:.4f} allocations={events} bytes_allocated={nbytes:,}")
+
+    print("OK: bench_market_data done")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
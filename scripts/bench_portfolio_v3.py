@@ -0,0 +1,159 @@
+﻿from __future__ import annotations
+
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+SCRIPTS = Path(__file__).resolve().parent
+if str(SCRIPTS) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS))
+
+import backtest_portfolio_v3 as v3  # noqa: E402
+
+
+def _weekdays(start: date, count: int) -> list[str]:
+    out = []
+    d = start
+    while len(out) < count:
+        if d.weekday() < 5:
+            out.append(d.isoformat())
+        d += timedelta(days=1)
+    return out
+
+
+def synthetic_inputs(stocks: int = 2000, years: int = 5, seed: int = 7, ranking_top: int = 60):
+    """
+    (all_df, market_df, breadth_df, ranking_df) shaped like the data/ CSVs v3 reads.
+    Each stock randomly misses ~1% of days; ranking_history keeps the top
+    `ranking_top` scores per date.
+    """
+    rng = random.Random(seed)
+    dates = _weekdays(date(2020, 1, 1), years * 250)
+    codes = [f"{1000 + k}" for k in range(stocks)]
+    sectors = ["Semis", "Finance", "Shipping", "Biotech", "Retail", "Steel"]
+
+    rows = {"date": [], "code": [], "name": [], "sector": [], "change_percent": [], "total_score": [], "volume": [], "source": []}
+    for d in dates:
+        for k, c in enumerate(codes):
+            if rng.random() < 0.01:
+                continue
+            rows["date"].append(d)
+            rows["code"].append(c)
+            rows["name"].append(f"Stock{c}")
+            rows["sector"].append(sectors[k % len(sectors)])
+            rows["change_percent"].append(round(rng.gauss(0.05, 2.0), 2))
+            rows["total_score"].append(round(rng.uniform(0.0, 100.0), 1))
+            rows["volume"].append(float(rng.randint(1_000, 5_000_000)))
+            rows["source"].append("SYN")
+    all_df = pd.DataFrame(rows)
+
+    market_df = pd.DataFrame({
+        "date": dates,
+        "market_ok": [rng.random() < 0.8 for _ in dates],
+        "trend_ok": [rng.random() < 0.8 for _ in dates],
+    })
+    breadth_df = pd.DataFrame({"date": dates, "adv_ratio": [rng.uniform(0.3, 0.8) for _ in dates]})
+
+    top = all_df.sort_values(["date", "total_score", "code"], ascending=[True, False, True])
+    ranking_df = top.groupby("date", sort=False).head(ranking_top).copy()
+    ranking_df["rank"] = ranking_df.groupby("date").cumcount() + 1
+    ranking_df = ranking_df[["date", "rank", "code", "name", "total_score"]].reset_index(drop=True)
+    return all_df, market_df, breadth_df, ranking_df
+
+
+def _filter_ret(all_by_date: dict, d: str, code: str) -> Optional[float]:
+    # previous lookup: boolean filter over the date's sub-frame on every call
+    df = all_by_date.get(d)
+    if df is None or len(df) == 0:
+        return None
+    m = df[df["code"].astype(str) == str(code)]
+    if len(m) == 0:
+        return None
+    r = v3._to_float(m.iloc[0].get("change_percent", None), math.nan)
+    return None if math.isnan(r) else r / 100.0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="backtest_portfolio_v3 on a synthetic panel: lookup + loop/matrix full-run timings")
+    ap.add_argument("--stocks", type=int, default=2000)
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--holdings", type=int, default=15)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--filter_days", type=int, default=50, help="days timed with the old filter lookup (it is slow)")
+    ap.add_argument("--write_dir", default="", help="also write data/*.csv inputs under this directory")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    all_df, market_df, breadth_df, ranking_df = synthetic_inputs(args.stocks, args.years, args.seed)
+    print(f"panel: stocks={args.stocks} dates={all_df['date'].nunique()} rows={len(all_df)} build_seconds={time.perf_counter() - t0:.1f}")
+
+    if args.write_dir:
+        data = Path(args.write_dir) / "data"
+        data.mkdir(parents=True, exist_ok=True)
+        all_df.to_csv(data / "all_stocks_daily.csv", index=False, encoding="utf-8")
+        market_df.to_csv(data / "market_snapshot_taiex.csv", index=False, encoding="utf-8")
+        breadth_df.to_csv(data / "breadth_history.csv", index=False, encoding="utf-8")
+        ranking_df.to_csv(data / "ranking_history.csv", index=False, encoding="utf-8")
+        print(f"OK: wrote -> {data}")
+
+    # same access pattern as the backtest: `holdings` codes per day
+    rng = random.Random(args.seed)
+    codes = sorted(all_df["code"].unique().tolist())
+    dates = sorted(all_df["date"].unique().tolist())
+    probes = [(d, c) for d in dates for c in rng.sample(codes, args.holdings)]
+
+    t0 = time.perf_counter()
+    all_by_date = v3._build_index_by_date(all_df)
+    t1 = time.perf_counter()
+    panel = v3.DailyPanel(all_df)
+    t2 = time.perf_counter()
+    print(f"  index build: by_date={t1 - t0:.2f}s DailyPanel={t2 - t1:.2f}s")
+
+    n_filter = min(len(probes), args.filter_days * args.holdings)
+    t0 = time.perf_counter()
+    old = [_filter_ret(all_by_date, d, c) for d, c in probes[:n_filter]]
+    filter_us = (time.perf_counter() - t0) / max(1, n_filter) * 1e6
+    t0 = time.perf_counter()
+    new = [panel.ret(d, c) for d, c in probes]
+    cold_us = (time.perf_counter() - t0) / max(1, len(probes)) * 1e6
+    t0 = time.perf_counter()
+    new = [panel.ret(d, c) for d, c in probes]
+    panel_us = (time.perf_counter() - t0) / max(1, len(probes)) * 1e6
+    same = old == new[:n_filter]
+    print(
+        f"  lookup: filter={filter_us:.1f}us DailyPanel(first touch per date)={cold_us:.2f}us "
+        f"DailyPanel={panel_us:.2f}us speedup={filter_us / max(panel_us, 1e-9):,.0f}x parity={'OK' if same else 'MISMATCH'}"
+    )
+
+    results = {}
+    for engine in ("loop", "matrix"):
+        t0 = time.perf_counter()
+        res = v3.run_backtest(all_df, market_df, breadth_df, ranking_df, holdings_on=args.holdings, engine=engine)
+        results[engine] = res
+        print(f"  run_backtest[{engine}]: seconds={time.perf_counter() - t0:.1f} final_equity={res.summary['final_equity']:.2f}")
+
+    # the matrix engine sums in the loop's order, so rows must match exactly
+    loop_res, matrix_res = results["loop"], results["matrix"]
+    engines_same = (loop_res.backtest_rows == matrix_res.backtest_rows
+                    and loop_res.holdings_rows == matrix_res.holdings_rows)
+    print(f"  matrix vs loop: rows={'identical' if engines_same else 'DIFFERENT'}")
+
+    if not same:
+        print("ERROR: DailyPanel lookups differ from the filter lookups")
+        return 1
+    if not engines_same:
+        print("ERROR: matrix engine rows differ from the loop engine")
+        return 1
+    print("OK: bench_portfolio_v3 done")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.adapters.market_data import load_prices_from_dir
+from src.market_data import MarketData
+
+
+def write_synthetic_history(out_dir: Path, symbols: int, days: int, seed: int = 7, ohlcv: bool = False) -> None:
+    """data/history-style "date","close" files (or stooq-style Date,Open,High,Low,Close,Volume)."""
+    rng = random.Random(seed)
+    cal = []
+    d = date(2015, 1, 1)
+    while len(cal) < days:
+        if d.weekday() < 5:
+            cal.append(d.isoformat())
+        d += timedelta(days=1)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for k in range(symbols):
+        px = rng.uniform(20.0, 800.0)
+        lines = ["Date,Open,High,Low,Close,Volume" if ohlcv else '"date","close"']
+        for key in cal:
+            px = max(1.0, round(px * (1.0 + rng.gauss(0.0, 0.02)), 2))
+            if ohlcv:
+                lines.append(f"{key},{px},{px * 1.01:.2f},{px * 0.99:.2f},{px},{rng.randint(1000, 900000)}")
+            else:
+                lines.append(f'"{key}","{px}"')
+        (out_dir / f"S{k:04d}.csv").write_text("\n".join(lines) + "\n", encoding="utf-8-sig")
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Price history: CSV parse vs .npy sidecar cache (load_prices_from_dir)")
+    ap.add_argument("--symbols", type=int, default=2000)
+    ap.add_argument("--days", type=int, default=1000)
+    ap.add_argument("--dir", default="", help="existing history dir (default: synthetic files in a temp dir)")
+    ap.add_argument("--ohlcv", action="store_true", help="synthetic files in stooq OHLCV layout")
+    args = ap.parse_args()
+
+    tmp = None
+    if args.dir:
+        hist = Path(args.dir)
+    else:
+        tmp = Path(tempfile.mkdtemp(prefix="bench_price_cache_"))
+        hist = tmp / "history"
+        write_synthetic_history(hist, args.symbols, args.days, ohlcv=args.ohlcv)
+
+    try:
+        shutil.rmtree(hist / "_npcache", ignore_errors=True)
+        parsed, parse_sec = _timed(lambda: load_prices_from_dir(hist, use_cache=False))
+        _, build_sec = _timed(lambda: load_prices_from_dir(hist))
+        cached, warm_sec = _timed(lambda: load_prices_from_dir(hist))
+
+        same = parsed.symbols() == cached.symbols() and all(
+            parsed.series[s].dates == cached.series[s].dates and parsed.series[s].closes == cached.series[s].closes
+            for s in parsed.symbols()
+        )
+        first = sorted(hist.glob("*.csv"))[:50]
+        same = same and all(
+            MarketData.from_csv(p, use_cache=False) == MarketData.from_csv(p) for p in first
+        )
+
+        bars = sum(len(s.dates) for s in parsed.series.values())
+        print(f"history: dir={hist} symbols={len(parsed.symbols())} bars={bars:,}")
+        print(f"  csv parse    seconds={parse_sec:.2f}")
+        print(f"  cache build  seconds={build_sec:.2f}")
+        print(f"  cache warm   seconds={warm_sec:.2f} speedup={parse_sec / max(warm_sec, 1e-9):.1f}x parity={'OK' if same else 'MISMATCH'}")
+        if not same:
+            print("ERROR: cached load differs from CSV parse")
+            return 1
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print("OK: bench_price_cache done")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
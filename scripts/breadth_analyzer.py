@@ -16,23 +16,55 @@ Breadth definition (v0.9):
 
 from __future__ import annotations
 import argparse
+import csv
+import io
 import json
 import os
+import sys
 from typing import Optional, Tuple
 
 import pandas as pd
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS not in sys.path:
+    sys.path.insert(0, SCRIPTS)
+
+from trading_calendar import last_csv_date, offset_after_date
+from universe_store import load_universe
+
+CSV_DTYPE = {"code": str, "date": str, "source": str}
 
 def _read_csv(path: str) -> pd.DataFrame:
     # avoid DtypeWarning: set low_memory=False + explicit dtype for code/date/source
     return pd.read_csv(
         path,
-        dtype={"code": str, "date": str, "source": str},
+        dtype=CSV_DTYPE,
         low_memory=False,
         encoding="utf-8-sig",
     )
 
+def _read_csv_after(path: str, after: str) -> pd.DataFrame:
+    """Rows dated > after, read from the tail of a date-ordered CSV (full read if it cannot seek)."""
+    off = offset_after_date(path, after)
+    if off is None:
+        df = _read_csv(path)
+        return df[df["date"].astype(str) > str(after)]
+    with open(path, "rb") as f:
+        cols = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        f.seek(off)
+        tail = f.read()
+    if not tail.strip():
+        return pd.DataFrame(columns=cols)
+    return pd.read_csv(
+        io.BytesIO(tail),
+        header=None,
+        names=cols,
+        dtype=CSV_DTYPE,
+        low_memory=False,
+        encoding="utf-8",
+    )
+
 def _clip_range(df: pd.DataFrame, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
     if start:
         df = df[df["date"] >= str(start)]
@@ -40,12 +72,35 @@ def _clip_range(df: pd.DataFrame, start: Optional[str], end: Optional[str]) -> p
         df = df[df["date"] <= str(end)]
     return df
 
-def build_breadth_history(in_csv: str, score_threshold: float, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
-    df = _read_csv(in_csv)
+def build_breadth_history(
+    in_csv: str,
+    score_threshold: float,
+    start: Optional[str],
+    end: Optional[str],
+    after: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Full mode reads only the needed columns/months from the columnar store;
+    after: only dates > after, read from the end of in_csv (incremental mode).
+    """
+    if after is None:
+        df = load_universe(start, end, columns=["date", "code", "total_score", "change_percent"], csv_path=in_csv)
+    else:
+        df = _read_csv_after(in_csv, after)
     need = {"date","code","total_score","change_percent"}
     if not need.issubset(set(df.columns)):
         raise ValueError(f"{in_csv} must contain columns: {sorted(list(need))}")
 
+    return breadth_from_frame(df, score_threshold, start, end)
+
+def breadth_from_frame(
+    df: pd.DataFrame,
+    score_threshold: float,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> pd.DataFrame:
+    """Date-level breadth rows of a universe frame (date/total_score/change_percent; not modified)."""
+    df = df[["date", "total_score", "change_percent"]]
     df["date"] = df["date"].astype(str)
     df = _clip_range(df, start, end)
 
@@ -53,15 +108,20 @@ def build_breadth_history(in_csv: str, score_threshold: float, start: Optional[s
     df["change_percent"] = pd.to_numeric(df["change_percent"], errors="coerce")
 
     # valid rows
-    v = df.dropna(subset=["total_score"]).copy()
+    v = df.dropna(subset=["total_score"])
 
-    # group by date
-    g = v.groupby("date", sort=True)
+    # group by date; boolean columns summed per group instead of per-group lambdas
+    flags = pd.DataFrame({
+        "date": v["date"],
+        "score_ge": (v["total_score"] >= score_threshold).astype(int),
+        "adv": (v["change_percent"] > 0).astype(int),
+    })
+    g = flags.groupby("date", sort=True)
     out = pd.DataFrame({
         "date": g.size().index.astype(str),
         "n": g.size().values.astype(int),
-        "n_score_ge": g.apply(lambda x: int((x["total_score"] >= score_threshold).sum())).values.astype(int),
-        "n_adv": g.apply(lambda x: int((pd.to_numeric(x["change_percent"], errors="coerce") > 0).sum())).values.astype(int),
+        "n_score_ge": g["score_ge"].sum().values.astype(int),
+        "n_adv": g["adv"].sum().values.astype(int),
     })
 
     out["breadth_ratio"] = (out["n_score_ge"] / out["n"]).astype(float)
@@ -88,21 +148,29 @@ def main():
     ap.add_argument("--score_threshold", type=float, default=70.0)
     ap.add_argument("--start", default="")
     ap.add_argument("--end", default="")
+    ap.add_argument("--incremental", action="store_true", help="append only dates newer than the last date in --out_history")
     args = ap.parse_args()
 
     start = args.start.strip() or None
     end = args.end.strip() or None
 
-    hist = build_breadth_history(args.in_csv, args.score_threshold, start, end)
+    out_history = os.path.join(ROOT, args.out_history)
+    after = last_csv_date(out_history) if args.incremental else None
+
+    hist = build_breadth_history(args.in_csv, args.score_threshold, start, end, after=after)
 
-    os.makedirs(os.path.dirname(os.path.join(ROOT, args.out_history)), exist_ok=True)
-    hist.to_csv(os.path.join(ROOT, args.out_history), index=False, encoding="utf-8-sig")
+    os.makedirs(os.path.dirname(out_history), exist_ok=True)
+    if after is None:
+        hist.to_csv(out_history, index=False, encoding="utf-8-sig")
+    elif not hist.empty:
+        # plain utf-8 when appending: the BOM belongs only at the start of the file
+        hist.to_csv(out_history, index=False, header=False, mode="a", encoding="utf-8")
 
     # optional latest snapshot
     if args.out_csv and args.out_json:
         write_latest_snapshot(hist, os.path.join(ROOT, args.out_csv), os.path.join(ROOT, args.out_json))
 
-    print(f"OK: wrote -> {os.path.join(ROOT, args.out_history)} rows={len(hist)}")
+    print(f"OK: wrote -> {out_history} rows={len(hist)}")
     if not hist.empty:
         print("tail:")
         print(hist.tail(5).to_string(index=False))
@@ -7,6 +7,8 @@ FIXES:
 2) TPEx is OPTIONAL: if TPEx endpoint/format changes, still output TWSE rows.
 3) Save raw snapshots for TWSE/TPEx to data/cache for debugging.
 4) IMPORTANT: universe_stock.csv may be UTF-8 BOM (PowerShell) -> use utf-8-sig + header fallback.
+5) Downloads go through the shared HTTP cache (data/cache/http, scripts/http_cache.py), so a past
+   trading date is fetched once no matter which script asked for it. --force bypasses it.
 """
 from __future__ import annotations
 
@@ -15,10 +17,14 @@ import csv
 import datetime as dt
 import json
 import os
+import sys
 import time
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from http_cache import HttpCache  # noqa: E402
+
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA = os.path.join(ROOT, "data")
 CACHE = os.path.join(DATA, "cache")
@@ -113,7 +119,24 @@ def load_universe_stock(path: str) -> list[dict]:
             })
     return rows
 
-def http_get_json(url: str, timeout: int = 20, referer: str = "") -> dict:
+def _json_or_none(body: bytes):
+    try:
+        return json.loads(body.decode("utf-8", errors="replace"))
+    except Exception:
+        return None
+
+def _twse_cacheable(body: bytes) -> bool:
+    js = _json_or_none(body)
+    return isinstance(js, dict) and bool(js.get("data"))
+
+def _tpex_cacheable(body: bytes) -> bool:
+    try:
+        return bool(parse_tpex_map(_json_or_none(body)))
+    except RuntimeError:
+        return False
+
+def http_get_json(url: str, timeout: int = 20, referer: str = "", cache: HttpCache | None = None,
+                  as_of: dt.date | None = None, accept=None) -> dict:
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) InvestmentAssistant/1.0",
         "Accept": "application/json,text/plain,*/*",
@@ -121,28 +144,44 @@ def http_get_json(url: str, timeout: int = 20, referer: str = "") -> dict:
     if referer:
         headers["Referer"] = referer
 
-    req = Request(url, headers=headers, method="GET")
-    try:
-        with urlopen(req, timeout=timeout) as resp:
-            raw = resp.read().decode("utf-8", errors="replace")
-    except (HTTPError, URLError) as e:
-        raise RuntimeError(f"HTTP failed: {repr(e)}")
+    def fetch(extra: dict):
+        req = Request(url, headers={**headers, **extra}, method="GET")
+        try:
+            with urlopen(req, timeout=timeout) as resp:
+                return resp.status, resp.read(), dict(resp.headers.items())
+        except HTTPError as e:
+            if e.code == 304:
+                return 304, b"", dict(e.headers.items())
+            raise RuntimeError(f"HTTP failed: {repr(e)}")
+        except URLError as e:
+            raise RuntimeError(f"HTTP failed: {repr(e)}")
+
+    if cache is None:
+        body = fetch({})[1]
+    else:
+        body = cache.fetch(url, None, fetch, as_of=as_of, accept=accept).body
+    raw = body.decode("utf-8", errors="replace")
 
     try:
         return json.loads(raw)
     except Exception as e:
         raise RuntimeError(f"JSON parse failed: {repr(e)}; head={raw[:120]!r}")
 
-def fetch_twse_stock_day_all(date_yyyymmdd: str, timeout: int = 20) -> dict:
+def _yyyymmdd_date(s: str) -> dt.date:
+    return dt.date(int(s[0:4]), int(s[4:6]), int(s[6:8]))
+
+def fetch_twse_stock_day_all(date_yyyymmdd: str, timeout: int = 20, cache: HttpCache | None = None) -> dict:
     url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=json&date={date_yyyymmdd}"
-    return http_get_json(url, timeout=timeout, referer="https://www.twse.com.tw/")
+    return http_get_json(url, timeout=timeout, referer="https://www.twse.com.tw/",
+                         cache=cache, as_of=_yyyymmdd_date(date_yyyymmdd), accept=_twse_cacheable)
 
-def fetch_tpex_stock_day_all(date_yyyymmdd: str, timeout: int = 20) -> dict:
+def fetch_tpex_stock_day_all(date_yyyymmdd: str, timeout: int = 20, cache: HttpCache | None = None) -> dict:
     y = int(date_yyyymmdd[0:4]); m = int(date_yyyymmdd[4:6]); d = int(date_yyyymmdd[6:8])
     roc_y = y - 1911
     roc = f"{roc_y}/{m:02d}/{d:02d}"
     url = f"https://www.tpex.org.tw/web/stock/aftertrading/daily_close_quotes/stk_quote_result.php?l=zh-tw&d={roc}"
-    return http_get_json(url, timeout=timeout, referer="https://www.tpex.org.tw/")
+    return http_get_json(url, timeout=timeout, referer="https://www.tpex.org.tw/",
+                         cache=cache, as_of=_yyyymmdd_date(date_yyyymmdd), accept=_tpex_cacheable)
 
 def parse_twse_map(js: dict) -> dict[str, dict]:
     data = js.get("data")
@@ -228,6 +267,7 @@ def main() -> int:
 
     ensure_dir(CACHE_TWSE)
     ensure_dir(CACHE_TPEX)
+    http_cache = None if args.force else HttpCache()
 
     # TWSE
     twse_raw_path = os.path.join(CACHE_TWSE, f"_twse_stock_day_all_{yyyymmdd}.json")
@@ -235,7 +275,7 @@ def main() -> int:
         with open(twse_raw_path, "r", encoding="utf-8") as f:
             twse_js = json.load(f)
     else:
-        twse_js = fetch_twse_stock_day_all(yyyymmdd, timeout=args.timeout)
+        twse_js = fetch_twse_stock_day_all(yyyymmdd, timeout=args.timeout, cache=http_cache)
         dump_json(twse_raw_path, twse_js)
     twse_map = parse_twse_map(twse_js)
 
@@ -249,7 +289,7 @@ def main() -> int:
             with open(tpex_raw_path, "r", encoding="utf-8") as f:
                 tpex_js = json.load(f)
         else:
-            tpex_js = fetch_tpex_stock_day_all(yyyymmdd, timeout=args.timeout)
+            tpex_js = fetch_tpex_stock_day_all(yyyymmdd, timeout=args.timeout, cache=http_cache)
             dump_json(tpex_raw_path, tpex_js)
         tpex_map = parse_tpex_map(tpex_js)
     except Exception as e:
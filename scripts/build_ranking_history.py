@@ -10,46 +10,64 @@ Columns: date,rank,code,name,sector,total_score,source
 
 from __future__ import annotations
 import os
+import sys
 import argparse
-from typing import Optional, Dict
+from typing import Optional
 
 import pandas as pd
 
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS not in sys.path:
+    sys.path.insert(0, SCRIPTS)
+ROOT = os.path.dirname(SCRIPTS)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
 
-def _read_csv(path: str) -> pd.DataFrame:
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
-
-    dtype: Dict[str, object] = {
-        "date": str,
-        "code": str,
-        "name": str,
-        "sector": str,
-        "source": str,
-    }
-
-    try:
-        return pd.read_csv(path, dtype=dtype, low_memory=False)
-    except UnicodeDecodeError:
-        return pd.read_csv(path, encoding="utf-8-sig", dtype=dtype, low_memory=False)
+from trading_calendar import TradingCalendar, last_csv_date
+from universe_store import load_universe
+from src.utils.instrument import stage, traced_run
 
 
 def _to_float_series(s: pd.Series) -> pd.Series:
     return pd.to_numeric(s, errors="coerce")
 
 
-def build_history(
-    in_csv: str,
-    out_csv: str,
-    top: int,
-    threshold: float,
-) -> pd.DataFrame:
-    df = _read_csv(in_csv)
+OUT_COLUMNS = ["date", "rank", "code", "name", "sector", "total_score", "source"]
 
+
+def _rank_days(df: pd.DataFrame, top: int, threshold: float) -> pd.DataFrame:
+    """
+    TopN per date in one pass: filter, one stable sort by
+    (date asc, total_score desc, code asc), then rank = position within date.
+    """
+    day = df.dropna(subset=["total_score"])
+    day = day[day["total_score"] >= float(threshold)]
+    if len(day) == 0:
+        return pd.DataFrame(columns=OUT_COLUMNS)
+
+    day = day.sort_values(["date", "total_score", "code"], ascending=[True, False, True], kind="mergesort")
+    rank = day.groupby("date", sort=False).cumcount().to_numpy() + 1
+    day = day.assign(rank=rank)
+    day = day[day["rank"] <= int(top)]
+    return day[OUT_COLUMNS].reset_index(drop=True)
+
+
+def rank_history(df: pd.DataFrame, top: int, threshold: float, last: Optional[str] = None) -> pd.DataFrame:
+    """
+    TopN rows of every date in df (a universe frame, not modified); with last,
+    only dates after it.
+    """
     if "total_score" not in df.columns:
         raise ValueError("Missing column: total_score")
 
+    df = df[[c for c in ["date", "code", "name", "sector", "total_score", "source"] if c in df.columns]]
     df["date"] = df["date"].astype(str)
+    cal = TradingCalendar(df["date"].unique().tolist())
+    if last is not None:
+        first_new = cal.next_after(last)
+        df = df[df["date"] >= first_new] if first_new is not None else df.iloc[0:0]
+    df = df[df["date"].isin(cal.dates)].copy()
+
     df["code"] = df["code"].astype(str).str.strip()
     df["total_score"] = _to_float_series(df["total_score"])
 
@@ -58,33 +76,56 @@ def build_history(
         if c not in df.columns:
             df[c] = ""
 
-    # group by date
-    dates = sorted(df["date"].dropna().unique().tolist())
-
-    rows = []
-    for d in dates:
-        day = df[df["date"] == d].copy()
-        day = day.dropna(subset=["total_score"])
-        day = day[day["total_score"] >= float(threshold)]
+    return _rank_days(df, top, threshold)
 
-        if len(day) == 0:
-            continue
 
-        day = day.sort_values(["total_score", "code"], ascending=[False, True]).head(int(top))
-        day = day.reset_index(drop=True)
-        day["rank"] = day.index + 1
+def build_history(
+    in_csv: str,
+    out_csv: str,
+    top: int,
+    threshold: float,
+    incremental: bool = False,
+) -> pd.DataFrame:
+    """
+    Rank every date of in_csv and write out_csv; returns the rows written.
+
+    incremental=True: only dates after the last date already in out_csv are
+    ranked and appended (full rebuild when out_csv is missing/empty).
+    """
+    last = last_csv_date(out_csv) if incremental else None
+
+    if not os.path.exists(in_csv):
+        raise FileNotFoundError(in_csv)
+    # columnar store: only the columns written out, and only months >= last when incremental
+    cols = ["date", "code", "name", "sector", "total_score", "source"]
+    with stage("load_universe") as st:
+        df = load_universe(start=last, columns=cols, csv_path=in_csv, float32_scores=False)
+        st.rows_out = len(df)
+
+    with stage("rank_history", rows_in=len(df)) as st:
+        out_df = rank_history(df, top, threshold, last=last)
+        st.rows_out = len(out_df)
+
+    with stage("write_history", rows_in=len(out_df)) as st:
+        size0 = os.path.getsize(out_csv) if last is not None and os.path.exists(out_csv) else 0
+        os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+        if last is not None:
+            if len(out_df) > 0:
+                out_df.to_csv(out_csv, index=False, header=False, mode="a", encoding="utf-8")
+        else:
+            out_df.to_csv(out_csv, index=False, encoding="utf-8")
+        st.wrote(os.path.getsize(out_csv) - size0 if os.path.exists(out_csv) else 0)
 
-        out = day[["date", "rank", "code", "name", "sector", "total_score", "source"]].copy()
-        rows.append(out)
+    return out_df
 
-    out_df = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(
-        columns=["date", "rank", "code", "name", "sector", "total_score", "source"]
-    )
 
-    os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
-    out_df.to_csv(out_csv, index=False, encoding="utf-8")
+def print_written(out_csv: str, out_df: pd.DataFrame) -> None:
+    print(f"OK: wrote -> {os.path.abspath(out_csv)} (rows={len(out_df)})")
 
-    return out_df
+    if len(out_df) > 0:
+        tail = out_df.tail(8)
+        print("tail:")
+        print(tail.to_string(index=False))
 
 
 def main(argv: Optional[list[str]] = None) -> int:
@@ -93,15 +134,12 @@ def main(argv: Optional[list[str]] = None) -> int:
     ap.add_argument("--out_csv", default="data/ranking_history.csv")
     ap.add_argument("--top", type=int, default=200)
     ap.add_argument("--threshold", type=float, default=70.0)
+    ap.add_argument("--incremental", action="store_true", help="append only dates newer than the last date in --out_csv")
     args = ap.parse_args(argv)
 
-    out_df = build_history(args.in_csv, args.out_csv, args.top, args.threshold)
-    print(f"OK: wrote -> {os.path.abspath(args.out_csv)} (rows={len(out_df)})")
-
-    if len(out_df) > 0:
-        tail = out_df.tail(8)
-        print("tail:")
-        print(tail.to_string(index=False))
+    with traced_run("build_ranking_history"):
+        out_df = build_history(args.in_csv, args.out_csv, args.top, args.threshold, incremental=args.incremental)
+    print_written(args.out_csv, out_df)
     return 0
 
 
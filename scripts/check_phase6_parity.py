@@ -0,0 +1,112 @@
+﻿from __future__ import annotations
+
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+SCRIPTS = Path(__file__).resolve().parent
+if str(SCRIPTS) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS))
+
+import phase6_backtest_singlepos as phase6  # noqa: E402
+
+
+def _grid() -> list[dict]:
+    """Parameter sets that exercise every exit path of the state machine."""
+    out = []
+    for cooldown, slip, sl, sl_mode, ts, ts_mode, tp, exit_mode in itertools.product(
+        [0, 3],
+        [0.0, 5.0],
+        [0.0, 0.05],
+        ["close", "low"],
+        [0.0, 0.08],
+        ["close", "low"],
+        [0.0, 0.10],
+        ["both", "trend", "signal"],
+    ):
+        if sl == 0.0 and sl_mode == "low":
+            continue
+        if ts == 0.0 and ts_mode == "low":
+            continue
+        out.append(
+            dict(
+                cooldown_bars=cooldown,
+                slippage_bps=slip,
+                stop_loss=sl,
+                stop_loss_mode=sl_mode,
+                trailing_stop=ts,
+                trailing_mode=ts_mode,
+                take_profit=tp,
+                exit_mode=exit_mode,
+            )
+        )
+    return out
+
+
+def _csv_bytes(res: phase6.SinglePosResult) -> tuple[str, str]:
+    # exactly what phase6 main() writes
+    return (
+        pd.DataFrame(res.trades).to_csv(index=False),
+        res.equity.to_csv(index=False),
+    )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Phase6 parity: array kernel vs original iterrows loop (byte-identical CSVs)")
+    ap.add_argument(
+        "--in",
+        dest="inputs",
+        nargs="+",
+        default=["data/phase5_signals_2330.csv", "data/phase5_signals_0050.csv"],
+    )
+    ap.add_argument("--no_numba", action="store_true", help="check the pure-Python kernel even if numba is installed")
+    args = ap.parse_args()
+
+    use_numba = False if args.no_numba else None
+    kernel = "numba" if (use_numba is None and phase6._compiled_kernel() is not None) else "python"
+
+    grid = _grid()
+    failures = 0
+    checked = 0
+    rows_sec = 0.0
+    array_sec = 0.0
+    for path in args.inputs:
+        p = Path(path)
+        if not p.exists():
+            print(f"SKIP: missing {p}")
+            continue
+        df = pd.read_csv(p)
+        for params in grid:
+            t0 = time.perf_counter()
+            ref = phase6.backtest_singlepos(df.copy(), engine="rows", **params)
+            t1 = time.perf_counter()
+            got = phase6.backtest_singlepos(df.copy(), engine="array", use_numba=use_numba, **params)
+            t2 = time.perf_counter()
+            rows_sec += t1 - t0
+            array_sec += t2 - t1
+            checked += 1
+            if _csv_bytes(ref) != _csv_bytes(got):
+                failures += 1
+                print(f"MISMATCH: {p} {params}")
+
+    if checked == 0:
+        print("ERROR: no input files found")
+        return 1
+
+    print(
+        f"checked={checked} mismatches={failures} kernel={kernel} "
+        f"rows_seconds={rows_sec:.2f} array_seconds={array_sec:.2f} speedup={rows_sec / max(array_sec, 1e-9):.1f}x"
+    )
+    if failures:
+        print("ERROR: array engine differs from the iterrows reference")
+        return 1
+    print("OK: phase6 parity")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
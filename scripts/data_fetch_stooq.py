@@ -4,14 +4,22 @@ import argparse
 import csv
 import datetime as dt
 import json
+import os
 import re
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import requests
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from http_cache import HttpCache  # noqa: E402
+from http_client import HostLimiter, get_with_retry, make_session  # noqa: E402
+
 
 # ----------------------------
 # Helpers
@@ -96,6 +104,28 @@ def read_existing_last_date(path: Path) -> Optional[dt.date]:
         return None
 
 
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+def http_get(url: str, timeout: int, headers: dict, cache: Optional[HttpCache] = None,
+             as_of: Optional[dt.date] = None, accept=None,
+             limiter: Optional[HostLimiter] = None) -> requests.Response:
+    """Single GET (no retries here; callers keep their own) through the shared session and cache."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = make_session(pool_size=16)
+    try:
+        return get_with_retry(_SESSION, url, headers=headers, timeout=timeout, retries=0,
+                              limiter=limiter, cache=cache, as_of=as_of, accept=accept)
+    except requests.HTTPError as e:
+        # callers judge error bodies themselves (e.g. yahoo chart.error)
+        if e.response is None:
+            raise
+        return e.response
+
+
 def count_rows(path: Path) -> int:
     if not path.exists():
         return 0
@@ -114,19 +144,24 @@ class FetchResult:
 # ----------------------------
 # Providers
 # ----------------------------
-def fetch_stooq(symbol: str, timeout: int) -> FetchResult:
+def fetch_stooq(symbol: str, timeout: int, cache: Optional[HttpCache] = None,
+                limiter: Optional[HostLimiter] = None) -> FetchResult:
     sym = normalize_symbol(symbol).lower()
     url = f"https://stooq.com/q/d/l/?s={sym}.tw&i=d"
 
     print(f"[Fetch:stooq] GET {url}")
     try:
-        r = requests.get(
+        r = http_get(
             url,
             timeout=timeout,
             headers={
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) InvestmentAssistant/1.0",
                 "Accept": "text/csv,*/*",
             },
+            cache=cache,
+            limiter=limiter,
+            # full history up to today: revalidated after the cache TTL
+            accept=lambda b: looks_like_csv_header(b[:64].decode("utf-8", errors="replace")),
         )
     except Exception as e:
         return FetchResult(False, "stooq", [], f"request_failed:{type(e).__name__}")
@@ -170,9 +205,22 @@ def fetch_stooq(symbol: str, timeout: int) -> FetchResult:
     return FetchResult(True, "stooq", rows, "")
 
 
-def _twse_request_json(url: str, timeout: int) -> Tuple[Optional[dict], str]:
+def _twse_month_ok(body: bytes) -> bool:
+    txt = body.decode("utf-8", errors="replace")
+    lb = txt.find("{")
+    rb = txt.rfind("}")
+    try:
+        j = json.loads(txt[lb : rb + 1]) if 0 <= lb < rb else None
+    except ValueError:
+        return False
+    return isinstance(j, dict) and "OK" in str(j.get("stat", "")).upper() and bool(j.get("data"))
+
+
+def _twse_request_json(url: str, timeout: int, cache: Optional[HttpCache] = None,
+                       as_of: Optional[dt.date] = None,
+                       limiter: Optional[HostLimiter] = None) -> Tuple[Optional[dict], str]:
     try:
-        r = requests.get(
+        r = http_get(
             url,
             timeout=timeout,
             headers={
@@ -181,6 +229,10 @@ def _twse_request_json(url: str, timeout: int) -> Tuple[Optional[dict], str]:
                 "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
                 "Referer": "https://www.twse.com.tw/",
             },
+            cache=cache,
+            as_of=as_of,
+            accept=_twse_month_ok,
+            limiter=limiter,
         )
     except Exception as e:
         return None, f"request_failed:{type(e).__name__}"
@@ -205,10 +257,80 @@ def _twse_request_json(url: str, timeout: int) -> Tuple[Optional[dict], str]:
         return None, "json_decode_failed"
 
 
-def fetch_twse(symbol: str, months: int, timeout: int, throttle_sec: float = 0.25, retries: int = 2) -> FetchResult:
+def _month_last_day(y: int, m: int) -> dt.date:
+    return (dt.date(y + (m == 12), m % 12 + 1, 1)) - dt.timedelta(days=1)
+
+
+def _fetch_twse_month(sym: str, y: int, m: int, today: dt.date, timeout: int, retries: int,
+                      cache: Optional[HttpCache], limiter: Optional[HostLimiter],
+                      stop: Optional[threading.Event]) -> Tuple[list, str]:
+    """(rows, last_err) for one month; rows empty on failure."""
+    date_yyyymm01 = f"{y}{m:02d}01"
+    urls = [
+        f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&date={date_yyyymm01}&stockNo={sym}",
+        f"https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY?response=json&date={date_yyyymm01}&stockNo={sym}",
+    ]
+    # a finished month never changes: cached for good once fetched after it ended
+    as_of = min(_month_last_day(y, m), today)
+    last_err = ""
+
+    for u in urls:
+        for attempt in range(retries + 1):
+            if stop is not None and stop.is_set():
+                return [], "cancelled"
+            j, err = _twse_request_json(u, timeout=timeout, cache=cache, as_of=as_of, limiter=limiter)
+            if j is not None:
+                stat = str(j.get("stat", "")).strip()
+                data = j.get("data", None)
+
+                if stat and ("OK" not in stat.upper()):
+                    last_err = f"stat:{stat}"
+                    break
+                if not data or not isinstance(data, list):
+                    last_err = "no_data_array"
+                    break
+
+                rows = []
+                for item in data:
+                    if not isinstance(item, list) or len(item) < 9:
+                        continue
+                    try:
+                        d = parse_roc_date(str(item[0]).strip()).isoformat()
+                        o = float(str(item[3]).replace(",", ""))
+                        h = float(str(item[4]).replace(",", ""))
+                        l = float(str(item[5]).replace(",", ""))
+                        c = float(str(item[6]).replace(",", ""))
+                        v = float(str(item[1]).replace(",", ""))
+                    except Exception:
+                        continue
+                    rows.append((d, o, h, l, c, v))
+
+                if rows:
+                    return rows, ""
+
+                last_err = "parsed_zero_rows"
+                break
+
+            last_err = err
+            time.sleep(0.4 * (attempt + 1))
+
+    return [], last_err
+
+
+def fetch_twse(symbol: str, months: int, timeout: int, throttle_sec: float = 0.25, retries: int = 2,
+               cache: Optional[HttpCache] = None, workers: int = 1, limiter: Optional[HostLimiter] = None,
+               stop: Optional[threading.Event] = None) -> FetchResult:
+    """
+    Month-by-month STOCK_DAY history. Months are fetched by `workers` threads;
+    requests to www.twse.com.tw are paced by `limiter` (default: one request
+    per throttle_sec; pass a shared one to pace several symbols together).
+    Cache hits take no token. Setting `stop` abandons the remaining months.
+    """
     sym = normalize_symbol(symbol)
     start = months_ago_first_day(months)
     today = dt.date.today()
+    if limiter is None and throttle_sec > 0:
+        limiter = HostLimiter(1.0 / throttle_sec)
 
     ym_list: list[tuple[int, int]] = []
     y, m = start.year, start.month
@@ -219,68 +341,27 @@ def fetch_twse(symbol: str, months: int, timeout: int, throttle_sec: float = 0.2
             y += 1
             m = 1
 
-    rows: list[tuple[str, float, float, float, float, float]] = []
-    any_ok = False
+    def one(ym: tuple[int, int]) -> Tuple[list, str]:
+        return _fetch_twse_month(sym, ym[0], ym[1], today, timeout, retries, cache, limiter, stop)
 
-    for (y, m) in ym_list:
-        date_yyyymm01 = f"{y}{m:02d}01"
-        urls = [
-            f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&date={date_yyyymm01}&stockNo={sym}",
-            f"https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY?response=json&date={date_yyyymm01}&stockNo={sym}",
-        ]
-
-        month_ok = False
-        last_err = ""
-
-        for u in urls:
-            for attempt in range(retries + 1):
-                j, err = _twse_request_json(u, timeout=timeout)
-                if j is not None:
-                    stat = str(j.get("stat", "")).strip()
-                    data = j.get("data", None)
-
-                    if stat and ("OK" not in stat.upper()):
-                        last_err = f"stat:{stat}"
-                        break
-                    if not data or not isinstance(data, list):
-                        last_err = "no_data_array"
-                        break
-
-                    parsed_this_month = 0
-                    for item in data:
-                        if not isinstance(item, list) or len(item) < 9:
-                            continue
-                        try:
-                            d = parse_roc_date(str(item[0]).strip()).isoformat()
-                            o = float(str(item[3]).replace(",", ""))
-                            h = float(str(item[4]).replace(",", ""))
-                            l = float(str(item[5]).replace(",", ""))
-                            c = float(str(item[6]).replace(",", ""))
-                            v = float(str(item[1]).replace(",", ""))
-                        except Exception:
-                            continue
-                        rows.append((d, o, h, l, c, v))
-                        parsed_this_month += 1
-
-                    if parsed_this_month > 0:
-                        any_ok = True
-                        month_ok = True
-                        break
-
-                    last_err = "parsed_zero_rows"
-                    break
+    if workers > 1 and len(ym_list) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(ym_list))) as pool:
+            results = list(pool.map(one, ym_list))
+    else:
+        results = [one(ym) for ym in ym_list]
 
-                last_err = err
-                time.sleep(0.4 * (attempt + 1))
+    if stop is not None and stop.is_set():
+        return FetchResult(False, "twse", [], "cancelled")
 
-            if month_ok:
-                break
-
-        if not month_ok:
+    rows: list[tuple[str, float, float, float, float, float]] = []
+    any_ok = False
+    for (y, m), (month_rows, last_err) in zip(ym_list, results):
+        if month_rows:
+            rows.extend(month_rows)
+            any_ok = True
+        else:
             print(f"[Fetch:twse] error {y}{m:02d}: {last_err}")
 
-        time.sleep(throttle_sec)
-
     if rows:
         rows = list({r[0]: r for r in rows}.values())
         rows.sort(key=lambda x: x[0])
@@ -291,7 +372,8 @@ def fetch_twse(symbol: str, months: int, timeout: int, throttle_sec: float = 0.2
     return FetchResult(True, "twse", rows, "")
 
 
-def _yahoo_chart_json(ticker: str, start: int, end: int, timeout: int) -> Tuple[Optional[dict], str]:
+def _yahoo_chart_json(ticker: str, start: int, end: int, timeout: int,
+                      limiter: Optional[HostLimiter] = None) -> Tuple[Optional[dict], str]:
     url = (
         f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
         f"?period1={start}&period2={end}&interval=1d&events=history"
@@ -299,13 +381,15 @@ def _yahoo_chart_json(ticker: str, start: int, end: int, timeout: int) -> Tuple[
     print(f"[Fetch:yahoo] GET {url}")
 
     try:
-        r = requests.get(
+        # not cached: period2 is "now", so the URL never repeats
+        r = http_get(
             url,
             timeout=timeout,
             headers={
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) InvestmentAssistant/1.0",
                 "Accept": "application/json,text/plain,*/*",
             },
+            limiter=limiter,
         )
     except Exception as e:
         return None, f"request_failed:{type(e).__name__}"
@@ -327,7 +411,7 @@ def _yahoo_chart_json(ticker: str, start: int, end: int, timeout: int) -> Tuple[
         return None, "json_decode_failed"
 
 
-def fetch_yahoo(symbol: str, months: int, timeout: int) -> FetchResult:
+def fetch_yahoo(symbol: str, months: int, timeout: int, limiter: Optional[HostLimiter] = None) -> FetchResult:
     sym = normalize_symbol(symbol)
     ticker = f"{sym}.TW"
 
@@ -335,7 +419,7 @@ def fetch_yahoo(symbol: str, months: int, timeout: int) -> FetchResult:
     start_date = dt.date.today() - dt.timedelta(days=int(months * 31))
     start = int(time.mktime(start_date.timetuple()))
 
-    j, err = _yahoo_chart_json(ticker, start=start, end=end, timeout=timeout)
+    j, err = _yahoo_chart_json(ticker, start=start, end=end, timeout=timeout, limiter=limiter)
     if j is None:
         return FetchResult(False, "yahoo", [], err)
 
@@ -419,92 +503,198 @@ def fetch_yahoo(symbol: str, months: int, timeout: int) -> FetchResult:
 # ----------------------------
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Fetch TW OHLCV data (providers chain)")
-    ap.add_argument("--symbol", required=True)
-    ap.add_argument("--out", required=True)
+    ap.add_argument("--symbol", default="")
+    ap.add_argument("--out", default="")
     ap.add_argument("--months", type=int, default=36)
     ap.add_argument("--timeout", type=int, default=15)
 
     ap.add_argument("--providers", default="stooq,yahoo,twse", help="Comma list: stooq,yahoo,twse")
     ap.add_argument("--force", action="store_true")
     ap.add_argument("--min_rows", type=int, default=200)
+    ap.add_argument("--no_cache", action="store_true", help="Bypass the shared HTTP response cache (data/cache/http)")
+
+    ap.add_argument("--mode", choices=["chain", "race"], default="chain",
+                    help="chain: providers in order, first ok wins; race: all at once, first one passing the acceptance rules wins")
+    ap.add_argument("--twse_workers", type=int, default=1, help="Concurrent month requests for the twse provider")
+    ap.add_argument("--rate", type=float, default=4.0, help="Max requests/sec per host (shared by all symbols)")
+
+    # batch mode: one process for a whole symbol list
+    ap.add_argument("--symbols", default="", help="Comma list of symbols (batch mode)")
+    ap.add_argument("--symbols_file", default="", help="Text/CSV file, symbol in the first column (batch mode)")
+    ap.add_argument("--out_dir", default="", help="Batch output dir: <out_dir>/<SYMBOL>.csv")
+    ap.add_argument("--workers", type=int, default=4, help="Symbols fetched concurrently in batch mode")
+
+    args = ap.parse_args()
+    batch = bool(args.symbols or args.symbols_file)
+    if batch and not args.out_dir:
+        ap.error("batch mode (--symbols/--symbols_file) needs --out_dir")
+    if not batch and not (args.symbol and args.out):
+        ap.error("--symbol and --out are required (or use --symbols/--symbols_file with --out_dir)")
+    return args
+
+
+def read_symbols(symbols: str, symbols_file: str) -> List[str]:
+    raw = [x for x in str(symbols or "").split(",")]
+    if symbols_file:
+        with open(symbols_file, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.reader(f):
+                if row and not row[0].strip().startswith("#"):
+                    raw.append(row[0])
+    out: List[str] = []
+    seen = set()
+    for x in raw:
+        s = normalize_symbol(x)
+        # skips blanks and header cells such as "code"/"symbol"
+        if not s or not s[0].isdigit() or s in seen:
+            continue
+        seen.add(s)
+        out.append(s)
+    return out
 
-    return ap.parse_args()
 
+def rejection(res: FetchResult, sym: str, out: Path, existing_last: Optional[dt.date], existing_rows: int,
+              min_rows: int, force: bool) -> str:
+    """Acceptance rules for a successful fetch; returns the message to print, "" when accepted."""
+    rows = res.rows
+    if not rows:
+        return f"[ERROR] fetched empty rows for {sym} via={res.provider}"
 
-def main() -> int:
-    args = parse_args()
-    sym = normalize_symbol(args.symbol)
-    out = Path(args.out)
-    months = int(args.months)
-    timeout = int(args.timeout)
-    min_rows = int(args.min_rows)
-    force = bool(args.force)
+    last_date = dt.date.fromisoformat(rows[-1][0])
+    fetched_n = len(rows)
 
+    if (not force) and fetched_n < min_rows:
+        return f"[WARN] fetch rejected for {sym} (too_few_rows:{fetched_n} < {min_rows}); keeping existing file: {out}"
+
+    # prevent stale/partial overwrite unless force
+    if (not force) and existing_last is not None:
+        if last_date < existing_last:
+            return f"[WARN] fetch rejected for {sym} (stale_last:{last_date} < existing_last:{existing_last}); keeping existing file: {out}"
+        if fetched_n < existing_rows:
+            return f"[WARN] fetch rejected for {sym} (partial_rows:{fetched_n} < existing_rows:{existing_rows}); keeping existing file: {out}"
+    return ""
+
+
+def _provider_call(p: str, sym: str, months: int, timeout: int, cache: Optional[HttpCache],
+                   limiter: Optional[HostLimiter], twse_workers: int,
+                   stop: Optional[threading.Event] = None) -> Optional[Callable[[], FetchResult]]:
+    if p == "stooq":
+        return lambda: fetch_stooq(sym, timeout=timeout, cache=cache, limiter=limiter)
+    if p == "yahoo":
+        return lambda: fetch_yahoo(sym, months=months, timeout=timeout, limiter=limiter)
+    if p == "twse":
+        def run() -> FetchResult:
+            print(f"[Fetch:twse] fallback for {sym}, months={months}")
+            return fetch_twse(sym, months=months, timeout=timeout, cache=cache, workers=twse_workers,
+                              limiter=limiter, stop=stop)
+        return run
+    print(f"[WARN] unknown provider ignored: {p}")
+    return None
+
+
+def fetch_symbol(sym: str, out: Path, providers: List[str], months: int, timeout: int, min_rows: int,
+                 force: bool, mode: str, cache: Optional[HttpCache], limiter: Optional[HostLimiter],
+                 twse_workers: int) -> int:
     existing_last = read_existing_last_date(out)
     existing_rows = count_rows(out)
 
-    providers = [p.strip().lower() for p in str(args.providers).split(",") if p.strip()]
-    if not providers:
-        providers = ["stooq", "yahoo", "twse"]
-
     last_fail = ""
     res: Optional[FetchResult] = None
 
-    for p in providers:
-        if p == "stooq":
-            res = fetch_stooq(sym, timeout=timeout)
-            if res.ok:
+    if mode == "race":
+        # every provider at once; completion order decides, acceptance rules filter
+        stop = threading.Event()
+        calls = [(p, _provider_call(p, sym, months, timeout, cache, limiter, twse_workers, stop)) for p in providers]
+        calls = [(p, c) for p, c in calls if c is not None]
+        pool = ThreadPoolExecutor(max_workers=max(1, len(calls)))
+        try:
+            futs = {pool.submit(c): p for p, c in calls}
+            for fut in as_completed(futs):
+                p = futs[fut]
+                r = fut.result()
+                if not r.ok:
+                    print(f"[Fetch:{p}] failed: {r.reason}")
+                    last_fail = f"{p}:{r.reason}"
+                    continue
+                msg = rejection(r, sym, out, existing_last, existing_rows, min_rows, force)
+                if msg:
+                    print(f"{msg} (race: {p})")
+                    last_fail = f"{p}:rejected"
+                    continue
+                res = r
                 break
-            print(f"[Fetch:stooq] failed: {res.reason}")
-            last_fail = f"stooq:{res.reason}"
-
-        elif p == "yahoo":
-            res = fetch_yahoo(sym, months=months, timeout=timeout)
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+        if res is None:
+            print(f"[ERROR] fetch failed for {sym}: {last_fail or 'no_provider_succeeded'}")
+            return 1
+    else:
+        for p in providers:
+            call = _provider_call(p, sym, months, timeout, cache, limiter, twse_workers)
+            if call is None:
+                continue
+            res = call()
             if res.ok:
                 break
-            print(f"[Fetch:yahoo] failed: {res.reason}")
-            last_fail = f"yahoo:{res.reason}"
+            print(f"[Fetch:{p}] failed: {res.reason}")
+            last_fail = f"{p}:{res.reason}"
 
-        elif p == "twse":
-            print(f"[Fetch:twse] fallback for {sym}, months={months}")
-            res = fetch_twse(sym, months=months, timeout=timeout)
-            if res.ok:
-                break
-            print(f"[Fetch:twse] failed: {res.reason}")
-            last_fail = f"twse:{res.reason}"
+        if res is None or not res.ok:
+            print(f"[ERROR] fetch failed for {sym}: {last_fail or 'no_provider_succeeded'}")
+            return 1
 
-        else:
-            print(f"[WARN] unknown provider ignored: {p}")
+        msg = rejection(res, sym, out, existing_last, existing_rows, min_rows, force)
+        if msg:
+            print(msg)
+            return 1
 
-    if res is None or not res.ok:
-        print(f"[ERROR] fetch failed for {sym}: {last_fail or 'no_provider_succeeded'}")
-        return 1
+    write_ohlcv_csv(out, res.rows)
+    print(f"OK fetched {sym} -> {out} rows={len(res.rows)} via={res.provider}")
+    return 0
 
-    rows = res.rows
-    if not rows:
-        print(f"[ERROR] fetched empty rows for {sym} via={res.provider}")
-        return 1
 
-    last_date = dt.date.fromisoformat(rows[-1][0])
-    fetched_n = len(rows)
+def main() -> int:
+    args = parse_args()
+    months = int(args.months)
+    timeout = int(args.timeout)
+    min_rows = int(args.min_rows)
+    force = bool(args.force)
+    cache = None if args.no_cache else HttpCache()
+    # one bucket per host, shared by every provider/symbol/thread of this run
+    limiter = HostLimiter(args.rate) if args.rate and args.rate > 0 else None
 
-    # acceptance rules
-    if (not force) and fetched_n < min_rows:
-        print(f"[WARN] fetch rejected for {sym} (too_few_rows:{fetched_n} < {min_rows}); keeping existing file: {out}")
-        return 1
+    providers = [p.strip().lower() for p in str(args.providers).split(",") if p.strip()]
+    if not providers:
+        providers = ["stooq", "yahoo", "twse"]
 
-    # prevent stale/partial overwrite unless force
-    if (not force) and existing_last is not None:
-        if last_date < existing_last:
-            print(f"[WARN] fetch rejected for {sym} (stale_last:{last_date} < existing_last:{existing_last}); keeping existing file: {out}")
-            return 1
-        if fetched_n < existing_rows:
-            print(f"[WARN] fetch rejected for {sym} (partial_rows:{fetched_n} < existing_rows:{existing_rows}); keeping existing file: {out}")
-            return 1
+    kw = dict(providers=providers, months=months, timeout=timeout, min_rows=min_rows, force=force,
+              mode=args.mode, cache=cache, limiter=limiter, twse_workers=max(1, int(args.twse_workers)))
 
-    write_ohlcv_csv(out, rows)
-    print(f"OK fetched {sym} -> {out} rows={fetched_n} via={res.provider}")
-    return 0
+    if not (args.symbols or args.symbols_file):
+        return fetch_symbol(normalize_symbol(args.symbol), Path(args.out), **kw)
+
+    symbols = read_symbols(args.symbols, args.symbols_file)
+    if not symbols:
+        print("[ERROR] batch: no symbols")
+        return 1
+    out_dir = Path(args.out_dir)
+    print(f"[BATCH] symbols={len(symbols)} workers={args.workers} mode={args.mode} -> {out_dir}")
+
+    failed: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, int(args.workers))) as pool:
+        futs = {pool.submit(fetch_symbol, sym, out_dir / f"{sym}.csv", **kw): sym for sym in symbols}
+        for fut in as_completed(futs):
+            sym = futs[fut]
+            try:
+                rc = fut.result()
+            except Exception as e:
+                print(f"[ERROR] batch {sym}: {type(e).__name__}: {e}")
+                rc = 1
+            if rc != 0:
+                failed.append(sym)
+
+    print(f"OK batch done ok={len(symbols) - len(failed)} failed={len(failed)}" + (f" ({','.join(sorted(failed))})" if failed else ""))
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
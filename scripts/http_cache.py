@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+http_cache.py
+
+Content-addressed cache of raw HTTP responses, shared by the fetch scripts
+(exchange backfill, build_all_stocks_daily_from_universe, data_fetch_stooq).
+
+Layout: data/cache/http/
+- meta/<kk>/<key>.json   one per request; key = sha1(url + sorted params)
+- blobs/<bb>/<sha256>    response bodies, stored once per distinct content
+
+Freshness rules, driven by the `as_of` date the caller says a response covers:
+- a body fetched after the as_of day ended (Taipei) is complete and
+  immutable -> served without any request
+- anything else (fetched during/before the as_of day, or as_of unknown) is
+  fresh for `ttl` seconds, then revalidated with If-None-Match /
+  If-Modified-Since (a 304 keeps the cached body). A month fetched mid-month
+  is therefore refetched once the month is over, not frozen half-filled.
+
+Bodies are only stored when the caller's `accept(body)` agrees (so an empty
+"no data" answer for a past date is not frozen). The cache is bounded by
+`max_bytes`; least recently used entries are evicted first. Cache I/O errors
+never fail a fetch: the request just goes to the network.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+DEFAULT_ROOT = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")), "data", "cache", "http")
+DEFAULT_TTL = 600.0
+DEFAULT_MAX_BYTES = 1 << 30
+TZ_TAIPEI = dt.timezone(dt.timedelta(hours=8))
+
+# fetch(extra_headers) -> (status, body, response headers)
+FetchFn = Callable[[Dict[str, str]], Tuple[int, bytes, Dict[str, str]]]
+
+
+def day_end_ts(d: dt.date) -> float:
+    """Epoch seconds when day d ends in Taipei (midnight starting the next day)."""
+    return dt.datetime.combine(d + dt.timedelta(days=1), dt.time(), tzinfo=TZ_TAIPEI).timestamp()
+
+
+def _covers(fetched_at: float, as_of: Optional[dt.date]) -> bool:
+    """True when a body fetched at fetched_at already holds all of as_of's data."""
+    return as_of is not None and fetched_at >= day_end_ts(as_of)
+
+
+def request_key(url: str, params: Optional[dict] = None) -> str:
+    q = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha1(f"GET {url}?{q}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    body: bytes
+    headers: Dict[str, str]
+    from_cache: bool
+
+
+class HttpCache:
+    def __init__(self, root: str = DEFAULT_ROOT, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES,
+                 clock: Callable[[], float] = time.time):
+        self.root = root
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None  # bytes of blobs, computed on first put
+
+    # ---------- paths ----------
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.root, "meta", key[:2], key + ".json")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    # ---------- entries ----------
+
+    def _load(self, key: str) -> Optional[Tuple[dict, bytes]]:
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._blob_path(meta["sha256"]), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta, body
+
+    def _save_meta(self, key: str, meta: dict) -> None:
+        self._write_atomic(self._meta_path(key), json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def _store(self, key: str, url: str, params: Optional[dict], body: bytes, headers: Dict[str, str],
+               as_of: Optional[dt.date]) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self._blob_path(digest)
+        added = 0
+        if not os.path.exists(blob):
+            self._write_atomic(blob, body)
+            added = len(body)
+        h = {k.lower(): v for k, v in headers.items()}
+        now = self._clock()
+        meta = {
+            "url": url,
+            "params": {str(k): str(v) for k, v in (params or {}).items()},
+            "sha256": digest,
+            "size": len(body),
+            "fetched_at": now,
+            "immutable": _covers(now, as_of),
+            "etag": h.get("etag"),
+            "last_modified": h.get("last-modified"),
+            "content_type": h.get("content-type"),
+        }
+        self._save_meta(key, meta)
+        with self._lock:
+            if self._total is not None:
+                self._total += added
+        if added:
+            self.evict()
+
+    def _touch(self, key: str) -> None:
+        try:
+            os.utime(self._meta_path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, url: str, params: Optional[dict] = None) -> None:
+        try:
+            os.remove(self._meta_path(request_key(url, params)))
+        except OSError:
+            pass
+
+    # ---------- fetch ----------
+
+    def fetch(self, url: str, params: Optional[dict], fetch: FetchFn, as_of: Optional[dt.date] = None,
+              accept: Optional[Callable[[bytes], bool]] = None) -> CachedResponse:
+        """
+        Cached GET. `fetch` performs the real request with the extra
+        (conditional) headers it is given; non-200 answers are returned as-is
+        and never stored.
+        """
+        key = request_key(url, params)
+        hit = self._load(key)
+
+        extra: Dict[str, str] = {}
+        if hit is not None:
+            meta, body = hit
+            cached = CachedResponse(200, body, {"content-type": meta.get("content_type") or ""}, True)
+            # immutable is decided by when the body was fetched, never by the caller's as_of alone
+            fetched_at = float(meta.get("fetched_at", 0))
+            if meta.get("immutable") or _covers(fetched_at, as_of) or self._clock() - fetched_at < self.ttl:
+                self._touch(key)
+                return cached
+            if meta.get("etag"):
+                extra["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                extra["If-Modified-Since"] = meta["last_modified"]
+
+        status, body, headers = fetch(extra)
+
+        if status == 304 and hit is not None:
+            now = self._clock()
+            meta["fetched_at"] = now
+            meta["immutable"] = _covers(now, as_of)
+            try:
+                self._save_meta(key, meta)
+            except OSError:
+                pass
+            return cached
+
+        if status == 200 and (accept is None or accept(body)):
+            try:
+                self._store(key, url, params, body, headers, as_of)
+            except OSError:
+                pass
+        return CachedResponse(status, body, dict(headers), False)
+
+    # ---------- eviction ----------
+
+    def _scan(self) -> Tuple[list, Dict[str, int]]:
+        """([(last_used, key, sha256)], {sha256: size})"""
+        entries = []
+        blobs: Dict[str, int] = {}
+        meta_root = os.path.join(self.root, "meta")
+        for dirpath, _, files in os.walk(meta_root):
+            for fn in files:
+                if not fn.endswith(".json"):
+                    continue
+                p = os.path.join(dirpath, fn)
+                try:
+                    with open(p, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    entries.append((os.path.getmtime(p), fn[:-5], meta["sha256"]))
+                except (OSError, ValueError, KeyError):
+                    continue
+        blob_root = os.path.join(self.root, "blobs")
+        for dirpath, _, files in os.walk(blob_root):
+            for fn in files:
+                if fn.endswith(".tmp"):
+                    continue
+                try:
+                    blobs[fn] = os.path.getsize(os.path.join(dirpath, fn))
+                except OSError:
+                    continue
+        return entries, blobs
+
+    def evict(self) -> None:
+        """Drop least recently used entries (and unreferenced blobs) until under max_bytes."""
+        with self._lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return
+            entries, blobs = self._scan()
+            refs: Dict[str, int] = {}
+            for _, _, digest in entries:
+                refs[digest] = refs.get(digest, 0) + 1
+            # blobs no entry points to (replaced content) go first
+            for digest in [d for d in blobs if d not in refs]:
+                self._remove_blob(digest, blobs)
+            total = sum(blobs.values())
+            for _, key, digest in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._meta_path(key))
+                except OSError:
+                    continue
+                refs[digest] -= 1
+                if refs[digest] == 0 and digest in blobs:
+                    total -= self._remove_blob(digest, blobs)
+            self._total = total
+
+    def _remove_blob(self, digest: str, blobs: Dict[str, int]) -> int:
+        size = blobs.pop(digest, 0)
+        try:
+            os.remove(self._blob_path(digest))
+        except OSError:
+            return 0
+        return size
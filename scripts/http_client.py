@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+http_client.py
+
+Shared HTTP plumbing for the fetch/backfill scripts:
+- TokenBucket / HostLimiter: per-host request rate limits (thread-safe)
+- make_session(): one requests.Session with a keep-alive connection pool
+- get_with_retry(): GET through the limiter, retrying connection errors,
+  429 and 5xx with jittered exponential backoff (Retry-After honoured);
+  optionally served from / stored in an http_cache.HttpCache
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from http_cache import HttpCache
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """`rate` tokens/sec, bursts up to `capacity`; acquire() blocks until a token is free."""
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """One TokenBucket per URL host, created on first use."""
+
+    def __init__(self, rate: float, capacity: float = 1.0, per_host: Optional[Dict[str, float]] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.per_host = dict(per_host or {})
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        with self._lock:
+            b = self._buckets.get(host)
+            if b is None:
+                b = TokenBucket(self.per_host.get(host, self.rate), self.capacity)
+                self._buckets[host] = b
+            return b
+
+    def acquire(self, url: str) -> None:
+        self.bucket(url).acquire()
+
+
+def make_session(pool_size: int = 8, headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max(1, pool_size), pool_maxsize=max(1, pool_size))
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    if headers:
+        s.headers.update(headers)
+    return s
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    v = resp.headers.get("Retry-After")
+    if not v:
+        return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        return None
+
+
+def _get_uncached(
+    session: requests.Session,
+    url: str,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None,
+    timeout: float = 25,
+    limiter: Optional[HostLimiter] = None,
+    retries: int = 3,
+    backoff: float = 0.5,
+    max_backoff: float = 30.0,
+) -> requests.Response:
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(url)
+        try:
+            resp = session.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= retries:
+                raise
+            delay = None
+        else:
+            if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                resp.raise_for_status()
+                return resp
+            delay = _retry_after(resp)
+        if delay is None:
+            delay = random.uniform(0.0, min(max_backoff, backoff * (2 ** attempt)))
+        time.sleep(delay)
+        attempt += 1
+
+
+def _as_response(url: str, status: int, body: bytes, headers: Dict[str, str], from_cache: bool) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body
+    resp.headers = CaseInsensitiveDict(headers)
+    resp.url = url
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp.from_cache = from_cache
+    return resp
+
+
+def get_with_retry(
+    session: requests.Session,
+    url: str,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None,
+    timeout: float = 25,
+    limiter: Optional[HostLimiter] = None,
+    retries: int = 3,
+    backoff: float = 0.5,
+    max_backoff: float = 30.0,
+    cache: Optional[HttpCache] = None,
+    as_of: Optional[dt.date] = None,
+    accept: Optional[Callable[[bytes], bool]] = None,
+) -> requests.Response:
+    """
+    GET url, waiting on limiter's bucket for the host before every attempt.
+    Retries connection errors/timeouts and RETRY_STATUS responses up to
+    `retries` times, sleeping uniform(0, min(max_backoff, backoff * 2**n))
+    (or Retry-After when the server sends one). Other HTTP errors raise at once.
+
+    With a cache, responses are looked up/stored there (see http_cache for the
+    as_of/accept rules); cache hits make no request and take no token.
+    """
+    kw = dict(timeout=timeout, limiter=limiter, retries=retries, backoff=backoff, max_backoff=max_backoff)
+    if cache is None:
+        return _get_uncached(session, url, params=params, headers=headers, **kw)
+
+    def fetch(extra: Dict[str, str]):
+        h = dict(headers or {})
+        h.update(extra)
+        r = _get_uncached(session, url, params=params, headers=h, **kw)
+        return r.status_code, r.content, dict(r.headers)
+
+    c = cache.fetch(url, params, fetch, as_of=as_of, accept=accept)
+    return _as_response(url, c.status, c.body, c.headers, c.from_cache)
@@ -11,12 +11,22 @@ Args (kept compatible with run_dashboard.ps1):
   --in <csv>
   --outdir <dir>
   --sector_map <csv> (optional, not required)
+  --scan auto|full (optional, default auto)
+
+--scan auto streams: the latest date is read from the file tail and only that
+day's rows are parsed (one pass, memory bounded by one day, not by history).
+It relies on the CSV being date-ordered (append-only), and falls back to the
+full read when a newer row shows up behind the tail block or when the
+universe store manifest (universe_store.py) disagrees about the latest date.
 """
 
 import argparse, csv, json, os, re, sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import defaultdict
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from trading_calendar import last_csv_date, offset_after_date  # noqa: E402
+
 DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
 def norm(s):
@@ -74,67 +84,8 @@ def safe_float(v, default=0.0):
   except Exception:
     return default
 
-def main():
-  ap = argparse.ArgumentParser()
-  ap.add_argument("--in", dest="inp", required=True)
-  ap.add_argument("--outdir", required=True)
-  ap.add_argument("--sector_map", default="")
-  args = ap.parse_args()
-
-  inp = args.inp
-  outdir = args.outdir
-
-  if not os.path.exists(inp):
-    print(f"Input not found: {inp}", file=sys.stderr)
-    return 2
-
-  os.makedirs(outdir, exist_ok=True)
-
-  # read CSV
-  rows = []
-  with open(inp, "r", encoding="utf-8-sig", newline="") as f:
-    r = csv.DictReader(f)
-    if not r.fieldnames:
-      print("No header found in input CSV.", file=sys.stderr)
-      return 3
-    date_key = find_date_key(r.fieldnames)
-    for row in r:
-      rows.append(row)
-
-  if not rows:
-    print("No rows in input CSV.", file=sys.stderr)
-    return 4
-
-  # find latest date
-  dates = []
-  for row in rows:
-    d = parse_date(row.get(date_key, ""))
-    if d:
-      dates.append(d)
-
-  if not dates:
-    # show debug clues
-    sample = rows[0].get(date_key, "")
-    print("No date found in input CSV.", file=sys.stderr)
-    print(f"[DEBUG] date_key={date_key!r} sample_value={sample!r}", file=sys.stderr)
-    print(f"[DEBUG] header={list(rows[0].keys())}", file=sys.stderr)
-    return 5
-
-  latest = max(dates)
-  latest_s = latest.strftime("%Y-%m-%d")
-
-  # filter rows for latest date (allow raw string match too)
-  latest_rows = []
-  for row in rows:
-    d = parse_date(row.get(date_key, ""))
-    if d and d == latest:
-      latest_rows.append(row)
-
-  if not latest_rows:
-    print("Date parsed but zero rows matched latest date (unexpected).", file=sys.stderr)
-    return 6
-
-  # compute sector heat (avg total_score by sector)
+def summarize(latest_rows, latest_s):
+  """(market_snapshot, sector_heat) from the latest day's rows, in file order (any iterable)."""
   by_sector_sum = defaultdict(float)
   by_sector_cnt = defaultdict(int)
 
@@ -148,8 +99,7 @@ def main():
         return k
     return default
 
-  score_key = pick_key(latest_rows[0], score_keys, "total_score")
-  sector_key = pick_key(latest_rows[0], sector_keys, "sector")
+  score_key = sector_key = None
 
   # snapshot stats
   n = 0
@@ -158,6 +108,9 @@ def main():
   score_sum = 0.0
 
   for row in latest_rows:
+    if score_key is None:
+      score_key = pick_key(row, score_keys, "total_score")
+      sector_key = pick_key(row, sector_keys, "sector")
     n += 1
     sc = safe_float(row.get(score_key), 0.0)
     score_sum += sc
@@ -168,6 +121,9 @@ def main():
     by_sector_sum[sec] += sc
     by_sector_cnt[sec] += 1
 
+  if n == 0:
+    return None, None
+
   avg_score = score_sum / n if n else 0.0
   sector_items = []
   for sec, cnt in by_sector_cnt.items():
@@ -190,6 +146,134 @@ def main():
     "sector_key": sector_key,
     "version": "market_pack_v1_robust"
   }
+  return market_snapshot, {"date": latest_s, "items": sector_items, "version": "sector_heat_v1_robust"}
+
+def _store_latest_date(inp):
+  """Latest date from a fresh universe_store manifest (<csv dir>/store/<stem>/), else None."""
+  inp = os.path.abspath(inp)
+  stem = os.path.splitext(os.path.basename(inp))[0]
+  mpath = os.path.join(os.path.dirname(inp), "store", stem, "_manifest.json")
+  try:
+    with open(mpath, "r", encoding="utf-8") as f:
+      m = json.load(f)
+    st = os.stat(inp)
+  except (OSError, ValueError):
+    return None
+  if m.get("size") != st.st_size or m.get("mtime_ns") != st.st_mtime_ns or not m.get("partitions"):
+    return None
+  return max(p["max_date"] for p in m["partitions"].values())
+
+def stream_latest(inp):
+  """
+  (latest_s, snapshot, sector_heat) reading only the tail of a date-ordered
+  CSV; None when the file does not look date-ordered or its last row has no
+  YYYY-MM-DD date (e.g. a trailing "TOTAL" line); the caller then does a full read.
+  """
+  with open(inp, "r", encoding="utf-8-sig", newline="") as f:
+    fieldnames = next(csv.reader([f.readline()]), None)
+  if not fieldnames:
+    return None
+  date_key = find_date_key(fieldnames)
+  date_col = date_key.lstrip("\ufeff").strip().lower()
+
+  latest = parse_date(last_csv_date(inp, date_col))
+  if latest is None:
+    return None
+  latest_s = latest.strftime("%Y-%m-%d")
+  known = _store_latest_date(inp)
+  if known is not None and known != latest_s:
+    return None
+  off = offset_after_date(inp, (latest - timedelta(days=1)).strftime("%Y-%m-%d"), date_col)
+  if off is None:
+    return None
+
+  newer = []
+
+  def latest_rows(f):
+    for row in csv.DictReader(f, fieldnames=fieldnames):
+      d = parse_date(row.get(date_key, ""))
+      if d is None or d < latest:
+        continue
+      if d > latest:
+        newer.append(d)
+        return
+      yield row
+
+  # off is a line start (byte offset; a valid seek position for utf-8 text)
+  with open(inp, "r", encoding="utf-8", newline="") as f:
+    f.seek(off)
+    snap, heat = summarize(latest_rows(f), latest_s)
+  if newer or snap is None:
+    return None
+  return latest_s, snap, heat
+
+def main():
+  ap = argparse.ArgumentParser()
+  ap.add_argument("--in", dest="inp", required=True)
+  ap.add_argument("--outdir", required=True)
+  ap.add_argument("--sector_map", default="")
+  ap.add_argument("--scan", choices=["auto", "full"], default="auto",
+                  help="auto: stream the latest day from the file tail (falls back to full); full: read every row")
+  args = ap.parse_args()
+
+  inp = args.inp
+  outdir = args.outdir
+
+  if not os.path.exists(inp):
+    print(f"Input not found: {inp}", file=sys.stderr)
+    return 2
+
+  os.makedirs(outdir, exist_ok=True)
+
+  streamed = stream_latest(inp) if args.scan == "auto" else None
+  if streamed is not None:
+    latest_s, market_snapshot, sector_heat = streamed
+  else:
+    # read CSV
+    rows = []
+    with open(inp, "r", encoding="utf-8-sig", newline="") as f:
+      r = csv.DictReader(f)
+      if not r.fieldnames:
+        print("No header found in input CSV.", file=sys.stderr)
+        return 3
+      date_key = find_date_key(r.fieldnames)
+      for row in r:
+        rows.append(row)
+
+    if not rows:
+      print("No rows in input CSV.", file=sys.stderr)
+      return 4
+
+    # find latest date
+    dates = []
+    for row in rows:
+      d = parse_date(row.get(date_key, ""))
+      if d:
+        dates.append(d)
+
+    if not dates:
+      # show debug clues
+      sample = rows[0].get(date_key, "")
+      print("No date found in input CSV.", file=sys.stderr)
+      print(f"[DEBUG] date_key={date_key!r} sample_value={sample!r}", file=sys.stderr)
+      print(f"[DEBUG] header={list(rows[0].keys())}", file=sys.stderr)
+      return 5
+
+    latest = max(dates)
+    latest_s = latest.strftime("%Y-%m-%d")
+
+    # filter rows for latest date (allow raw string match too)
+    latest_rows = []
+    for row in rows:
+      d = parse_date(row.get(date_key, ""))
+      if d and d == latest:
+        latest_rows.append(row)
+
+    if not latest_rows:
+      print("Date parsed but zero rows matched latest date (unexpected).", file=sys.stderr)
+      return 6
+
+    market_snapshot, sector_heat = summarize(latest_rows, latest_s)
 
   out_snapshot = os.path.join(outdir, f"market_snapshot_{latest_s}.json")
   out_sector   = os.path.join(outdir, f"sector_heat_{latest_s}.json")
@@ -197,7 +281,7 @@ def main():
   with open(out_snapshot, "w", encoding="utf-8") as f:
     json.dump(market_snapshot, f, ensure_ascii=False, indent=2)
   with open(out_sector, "w", encoding="utf-8") as f:
-    json.dump({"date": latest_s, "items": sector_items, "version": "sector_heat_v1_robust"}, f, ensure_ascii=False, indent=2)
+    json.dump(sector_heat, f, ensure_ascii=False, indent=2)
 
   print(out_sector)
   print(out_snapshot)
@@ -206,4 +290,4 @@ def main():
   return 0
 
 if __name__ == "__main__":
-  sys.exit(main())
\ No newline at end of file
+  sys.exit(main())
@@ -1,11 +1,19 @@
 ﻿from __future__ import annotations
 
 import argparse
+import itertools
 from pathlib import Path
+from typing import Optional
+import numpy as np
 import pandas as pd
 
+TREND_MODES = ("fast", "slow", "both")
 
-def parse_args() -> argparse.Namespace:
+# (rsi_period, buy_rsi, sell_rsi, trend)
+Setting = tuple[int, float, float, str]
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="inp", required=True)
     ap.add_argument("--out", required=True)
@@ -20,7 +28,15 @@ def parse_args() -> argparse.Namespace:
     # trend gating: fast / slow / both
     ap.add_argument("--trend", choices=["fast", "slow", "both"], default="both")
 
-    return ap.parse_args()
+    # multi-setting mode: any of these switches to one long-format file with
+    # every (rsi_period, buy_rsi, sell_rsi, trend) combination where buy < sell;
+    # an unset list falls back to the single value above
+    ap.add_argument("--rsi_periods", default="", help="comma list, e.g. 14,20")
+    ap.add_argument("--buy_levels", default="", help="comma list, e.g. 35,40,45")
+    ap.add_argument("--sell_levels", default="", help="comma list, e.g. 55,60")
+    ap.add_argument("--trends", default="", help="comma list of fast/slow/both")
+
+    return ap.parse_args(argv)
 
 
 def rsi(series: pd.Series, period: int) -> pd.Series:
@@ -38,33 +54,29 @@ def rsi(series: pd.Series, period: int) -> pd.Series:
     return out
 
 
-def main() -> int:
-    args = parse_args()
-
-    inp = Path(args.inp)
-    if not inp.exists():
-        raise SystemExit(f"Input not found: {inp}")
-
-    df = pd.read_csv(inp)
-
-    need_cols = {"date", "open", "high", "low", "close"}
-    if not need_cols.issubset(set(df.columns)):
-        raise SystemExit(f"Missing OHLC columns. Need={sorted(need_cols)} got={df.columns.tolist()}")
-
-    # normalize types
+def add_indicators(df: pd.DataFrame, rsi_period: int = 14, sma_fast: int = 50, sma_slow: int = 200) -> pd.DataFrame:
+    """close -> numeric, plus sma_fast / sma_slow / rsi columns (in place, returns df)."""
     df["close"] = pd.to_numeric(df["close"], errors="coerce")
 
-    sma_fast_n = int(args.sma_fast)
-    sma_slow_n = int(args.sma_slow)
+    sma_fast_n = int(sma_fast)
+    sma_slow_n = int(sma_slow)
 
     df["sma_fast"] = df["close"].rolling(sma_fast_n, min_periods=sma_fast_n).mean()
     df["sma_slow"] = df["close"].rolling(sma_slow_n, min_periods=sma_slow_n).mean()
 
-    df["rsi"] = rsi(df["close"], int(args.rsi_period))
+    df["rsi"] = rsi(df["close"], int(rsi_period))
+    return df
+
 
+def add_signals(df: pd.DataFrame, buy_rsi: float = 50.0, sell_rsi: float = 60.0, trend: str = "both") -> pd.DataFrame:
+    """
+    Gate + RSI crossing signals on a frame that already has add_indicators columns
+    (in place, returns df). Indicators do not depend on the thresholds, so a
+    parameter scan can compute them once per RSI period and call this per combo.
+    """
     # === Trend gate ===
     # gate_trend_ok: used to allow entries only when in up-trend
-    trend_mode = args.trend
+    trend_mode = trend
     if trend_mode == "fast":
         df["gate_trend_ok"] = (df["close"] >= df["sma_fast"])
     elif trend_mode == "slow":
@@ -77,8 +89,8 @@ def main() -> int:
     df["trend_break"] = (df["close"] < df["sma_fast"])
 
     # === RSI crossing signals (row-level booleans) ===
-    buy_thr = float(args.buy_rsi)
-    sell_thr = float(args.sell_rsi)
+    buy_thr = float(buy_rsi)
+    sell_thr = float(sell_rsi)
 
     r = df["rsi"]
     r_prev = r.shift(1)
@@ -94,6 +106,142 @@ def main() -> int:
     for c in ["gate_trend_ok", "trend_break", "buy_signal", "sell_signal"]:
         df[c] = df[c].fillna(False).astype(bool)
 
+    return df
+
+
+def signal_arrays(
+    df: pd.DataFrame,
+    settings: list[Setting],
+    sma_fast: int = 50,
+    sma_slow: int = 200,
+) -> dict[str, np.ndarray]:
+    """
+    add_indicators + add_signals for many settings at once.
+
+    Each distinct RSI period is computed once (n x periods); thresholds and
+    trend gates are broadcast over an n x len(settings) grid. Column j of every
+    2-D result equals what add_signals produces for settings[j]. trend_break
+    does not depend on the setting and is 1-D.
+    """
+    close = pd.to_numeric(df["close"], errors="coerce")
+    c = close.to_numpy(dtype=float)
+    sf = close.rolling(int(sma_fast), min_periods=int(sma_fast)).mean().to_numpy(dtype=float)
+    ss = close.rolling(int(sma_slow), min_periods=int(sma_slow)).mean().to_numpy(dtype=float)
+
+    with np.errstate(invalid="ignore"):
+        gate_fast = c >= sf
+        gate_slow = c >= ss
+        trend_break = c < sf
+    gates = {"fast": gate_fast, "slow": gate_slow, "both": gate_fast & gate_slow}
+
+    n = c.shape[0]
+    periods = sorted({int(st[0]) for st in settings})
+    col_of = {p: k for k, p in enumerate(periods)}
+    rsi_by_period = np.empty((n, len(periods)))
+    for k, p in enumerate(periods):
+        rsi_by_period[:, k] = pd.to_numeric(rsi(close, p), errors="coerce").to_numpy(dtype=float)
+
+    r = rsi_by_period[:, [col_of[int(st[0])] for st in settings]]
+    r_prev = np.full_like(r, np.nan)
+    r_prev[1:] = r[:-1]
+    buy = np.array([float(st[1]) for st in settings])
+    sell = np.array([float(st[2]) for st in settings])
+    gate = np.empty((n, len(settings)), dtype=bool)
+    for j, st in enumerate(settings):
+        gate[:, j] = gates.get(st[3], gates["both"])
+
+    with np.errstate(invalid="ignore"):
+        buy_signal = gate & (r_prev < buy) & (r >= buy)
+        sell_signal = (r_prev > sell) & (r <= sell)
+
+    return {
+        "rsi": r,
+        "gate_trend_ok": gate,
+        "trend_break": trend_break,
+        "buy_signal": buy_signal,
+        "sell_signal": sell_signal,
+    }
+
+
+def multi_signals(
+    df: pd.DataFrame,
+    settings: list[Setting],
+    sma_fast: int = 50,
+    sma_slow: int = 200,
+) -> pd.DataFrame:
+    """Long format: one block of len(df) rows per setting, keyed by the setting columns."""
+    arr = signal_arrays(df, settings, sma_fast, sma_slow)
+    n = len(df)
+    k = len(settings)
+    return pd.DataFrame(
+        {
+            "date": np.tile(df["date"].to_numpy(), k),
+            "rsi_period": np.repeat([int(st[0]) for st in settings], n),
+            "buy_rsi": np.repeat([float(st[1]) for st in settings], n),
+            "sell_rsi": np.repeat([float(st[2]) for st in settings], n),
+            "trend": np.repeat([str(st[3]) for st in settings], n),
+            "rsi": arr["rsi"].T.ravel(),
+            "gate_trend_ok": arr["gate_trend_ok"].T.ravel(),
+            "trend_break": np.tile(arr["trend_break"], k),
+            "buy_signal": arr["buy_signal"].T.ravel(),
+            "sell_signal": arr["sell_signal"].T.ravel(),
+        }
+    )
+
+
+def _multi_settings(args: argparse.Namespace) -> list[Setting]:
+    def _list(s: str, cast, default):
+        vals = [cast(x.strip()) for x in s.split(",") if x.strip()]
+        return vals or [default]
+
+    periods = _list(args.rsi_periods, int, int(args.rsi_period))
+    buys = _list(args.buy_levels, float, float(args.buy_rsi))
+    sells = _list(args.sell_levels, float, float(args.sell_rsi))
+    trends = _list(args.trends, str, args.trend)
+    bad = [t for t in trends if t not in TREND_MODES]
+    if bad:
+        raise SystemExit(f"Unknown --trends {bad}; choose from {list(TREND_MODES)}")
+    return [st for st in itertools.product(periods, buys, sells, trends) if st[1] < st[2]]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+
+    inp = Path(args.inp)
+    if not inp.exists():
+        raise SystemExit(f"Input not found: {inp}")
+
+    df = pd.read_csv(inp)
+
+    need_cols = {"date", "open", "high", "low", "close"}
+    if not need_cols.issubset(set(df.columns)):
+        raise SystemExit(f"Missing OHLC columns. Need={sorted(need_cols)} got={df.columns.tolist()}")
+
+    sma_fast_n = int(args.sma_fast)
+    sma_slow_n = int(args.sma_slow)
+
+    if args.rsi_periods or args.buy_levels or args.sell_levels or args.trends:
+        settings = _multi_settings(args)
+        if not settings:
+            raise SystemExit("No settings with buy_rsi < sell_rsi")
+        sig = multi_signals(df, settings, sma_fast_n, sma_slow_n)
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        sig.to_csv(out, index=False, encoding="utf-8")
+        print(
+            f"OK Phase5 wrote: {out} rows={len(sig)} settings={len(settings)} "
+            f"buySignals={int(sig['buy_signal'].sum())} sellSignals={int(sig['sell_signal'].sum())} "
+            f"SMA({sma_fast_n},{sma_slow_n})"
+        )
+        return 0
+
+    trend_mode = args.trend
+    buy_thr = float(args.buy_rsi)
+    sell_thr = float(args.sell_rsi)
+
+    add_indicators(df, int(args.rsi_period), sma_fast_n, sma_slow_n)
+    add_signals(df, buy_thr, sell_thr, trend_mode)
+
     out = Path(args.out)
     out.parent.mkdir(parents=True, exist_ok=True)
     df.to_csv(out, index=False, encoding="utf-8")
@@ -5,12 +5,24 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Literal
 
+import numpy as np
 import pandas as pd
 
 StopMode = Literal["close", "low"]
 TrailingMode = Literal["close", "low"]
 ExitMode = Literal["both", "trend", "signal"]
 TrendExit = Literal["sma_fast", "sma_slow"]
+Engine = Literal["array", "rows"]
+
+# _singlepos_kernel exit codes -> exit_reason strings (0 = no exit that bar)
+_EXIT_REASONS = {
+    0: "",
+    1: "stop_loss_{stop}",
+    2: "trailing_stop_{trail}",
+    3: "take_profit",
+    4: "trend_break",
+    5: "signal",
+}
 
 
 @dataclass
@@ -24,7 +36,16 @@ class Position:
     trail_level: float
 
 
-def parse_args() -> argparse.Namespace:
+@dataclass
+class SinglePosResult:
+    trades: list[dict]
+    equity: pd.DataFrame
+    buy_col: str
+    sell_col: str
+    trend_col: str
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="inp", required=True)
     ap.add_argument("--out_trades", required=True)
@@ -50,9 +71,12 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--sell_fee", type=float, default=0.001425)
     ap.add_argument("--sell_tax", type=float, default=0.003)
 
+    ap.add_argument("--engine", choices=["array", "rows"], default="array", help="rows = original iterrows loop")
+    ap.add_argument("--no_numba", action="store_true", help="pure-Python array kernel even if numba is installed")
+
     # Debug
     ap.add_argument("--debug_signal_scan", action="store_true", help="Print signal candidate counts")
-    return ap.parse_args()
+    return ap.parse_args(argv)
 
 
 def _to_float(x) -> float:
@@ -141,62 +165,43 @@ def _pick_best_signal_col(df: pd.DataFrame, canonical: str, candidates: list[str
     return best_name
 
 
-def main() -> int:
-    args = parse_args()
-
-    inp = Path(args.inp)
-    if not inp.exists():
-        raise SystemExit(f"Input not found: {inp}")
-
-    df = pd.read_csv(inp)
-
-    need_cols = {"date", "open", "high", "low", "close"}
-    if not need_cols.issubset(set(df.columns)):
-        raise SystemExit(f"Missing OHLC columns in input. Need={sorted(need_cols)} got={df.columns.tolist()}")
-
-    debug_scan = bool(getattr(args, "debug_signal_scan", False))
-
-    # === Signal column auto-alignment (Phase5 may output different names) ===
-    buy_col = _pick_best_signal_col(
-        df,
-        canonical="buy_signal",
-        candidates=["buy_signal", "buy", "signal_buy", "entry_signal", "enter", "long_entry", "entry", "buySignal"],
-        debug=debug_scan,
-    )
-    sell_col = _pick_best_signal_col(
-        df,
-        canonical="sell_signal",
-        candidates=["sell_signal", "sell", "signal_sell", "exit_signal", "exit", "long_exit", "sellSignal"],
-        debug=debug_scan,
-    )
-    trend_col = _pick_best_signal_col(
-        df,
-        canonical="trend_break",
-        candidates=["trend_break", "trend_exit", "trend_fail", "trend_down", "gate_trend_break", "trendBreak"],
-        debug=debug_scan,
-    )
-
-    cash = float(args.initial_cash)
+def _run_rows(
+    df: pd.DataFrame,
+    buy_col: str,
+    sell_col: str,
+    trend_col: str,
+    initial_cash: float,
+    cooldown_bars: int,
+    slippage_bps: float,
+    stop_loss: float,
+    stop_loss_mode: StopMode,
+    trailing_stop: float,
+    trailing_mode: TrailingMode,
+    take_profit: float,
+    exit_mode: ExitMode,
+    buy_fee: float,
+    sell_fee: float,
+    sell_tax: float,
+) -> tuple[list[dict], pd.DataFrame]:
+    """Reference implementation: one pandas row at a time (engine="rows")."""
+    cash = float(initial_cash)
     pos: Optional[Position] = None
     cooldown = 0
 
     trades: list[dict] = []
     equity_rows: list[dict] = []
 
-    stop_loss = float(args.stop_loss)
-    trailing_stop = float(args.trailing_stop)
-    stop_mode: StopMode = args.stop_loss_mode
-    trail_mode: TrailingMode = args.trailing_mode
-
-    buy_fee = float(args.buy_fee)
-    sell_fee = float(args.sell_fee)
-    sell_tax = float(args.sell_tax)
+    stop_loss = float(stop_loss)
+    trailing_stop = float(trailing_stop)
+    stop_mode: StopMode = stop_loss_mode
+    trail_mode: TrailingMode = trailing_mode
 
-    slippage = float(args.slippage_bps) / 10000.0
-    take_profit = float(args.take_profit)
+    buy_fee = float(buy_fee)
+    sell_fee = float(sell_fee)
+    sell_tax = float(sell_tax)
 
-    exit_mode: ExitMode = args.exit_mode
-    trend_exit: TrendExit = args.trend_exit  # reserved, kept for interface compatibility
+    slippage = float(slippage_bps) / 10000.0
+    take_profit = float(take_profit)
 
     def mark_price_for_stop(irow: pd.Series) -> float:
         return _to_float(irow["low"] if stop_mode == "low" else irow["close"])
@@ -312,7 +317,7 @@ def main() -> int:
         )
 
         pos = None
-        cooldown = int(args.cooldown_bars)
+        cooldown = int(cooldown_bars)
 
     for _, r in df.iterrows():
         date = str(r["date"])
@@ -363,20 +368,427 @@ def main() -> int:
             }
         )
 
+    return trades, pd.DataFrame(equity_rows)
+
+
+def _singlepos_kernel(
+    close,
+    mark_stop,
+    mark_trail,
+    buy,
+    sell,
+    trend,
+    initial_cash,
+    cooldown_bars,
+    slippage,
+    stop_loss,
+    trailing_stop,
+    take_profit,
+    trend_exit_on,
+    signal_exit_on,
+    buy_fee,
+    sell_fee,
+    sell_tax,
+    eq_equity,
+    eq_cash,
+    eq_position,
+    eq_shares,
+    eq_entry,
+    eq_stop,
+    eq_trail,
+    eq_reason,
+    tr_entry_i,
+    tr_exit_i,
+    tr_entry_px,
+    tr_exit_px,
+    tr_shares,
+    tr_cash,
+    tr_reason,
+):
+    """
+    The _run_rows state machine over plain sequences (lists or NumPy arrays),
+    writing into caller-provided per-bar (eq_*) and per-trade (tr_*) buffers.
+    Same float operations in the same order, so results match bit for bit.
+    Exit reasons are codes (see _EXIT_REASONS). Returns the number of trades.
+    Plain Python on purpose: numba.njit compiles it unchanged when available.
+    """
+    n = len(close)
+    cash = initial_cash
+    in_pos = False
+    entry_i = 0
+    entry_px = 0.0
+    shares = 0
+    max_fav = 0.0
+    stop_level = 0.0
+    trail_level = 0.0
+    cooldown = 0
+    k = 0
+
+    for i in range(n):
+        c = close[i]
+        reason = 0
+
+        if cooldown > 0 and not in_pos:
+            cooldown -= 1
+
+        if in_pos:
+            # update_risk_lines
+            stop_level = entry_px * (1.0 - stop_loss) if stop_loss > 0 else 0.0
+            if trailing_stop > 0:
+                ref = mark_trail[i]
+                if ref == ref:
+                    max_fav = max(max_fav, ref)
+                trail_level = max_fav * (1.0 - trailing_stop)
+            else:
+                trail_level = 0.0
+
+            # should_exit (NaN != NaN, so `x == x` is notna)
+            m = mark_stop[i]
+            t = mark_trail[i]
+            if stop_loss > 0 and stop_level > 0 and m == m and m <= stop_level:
+                reason = 1
+            elif trailing_stop > 0 and trail_level > 0 and t == t and t <= trail_level:
+                reason = 2
+            elif take_profit > 0 and c == c and c >= entry_px * (1.0 + take_profit):
+                reason = 3
+            elif trend_exit_on and trend[i]:
+                reason = 4
+            elif signal_exit_on and sell[i]:
+                reason = 5
+
+            # do_sell
+            if reason != 0 and c == c and c > 0:
+                px_exec = c * (1.0 - slippage)
+                gross = shares * px_exec
+                fees = gross * (sell_fee + sell_tax)
+                net = gross - fees
+                cash += net
+
+                tr_entry_i[k] = entry_i
+                tr_exit_i[k] = i
+                tr_entry_px[k] = entry_px
+                tr_exit_px[k] = px_exec
+                tr_shares[k] = shares
+                tr_cash[k] = cash
+                tr_reason[k] = reason
+                k += 1
+
+                in_pos = False
+                cooldown = cooldown_bars
+
+        # do_buy
+        if not in_pos and cooldown == 0 and buy[i] and c == c and c > 0:
+            px_exec = c * (1.0 + slippage)
+            sh = int(cash / (px_exec * (1.0 + buy_fee)))
+            if sh > 0:
+                cost = sh * px_exec * (1.0 + buy_fee)
+                cash -= cost
+
+                ref = mark_trail[i]
+                if ref != ref or ref <= 0:
+                    ref = px_exec
+
+                in_pos = True
+                entry_i = i
+                entry_px = px_exec
+                shares = sh
+                max_fav = ref
+
+                stop_level = entry_px * (1.0 - stop_loss) if stop_loss > 0 else 0.0
+                if trailing_stop > 0:
+                    ref = mark_trail[i]
+                    if ref == ref:
+                        max_fav = max(max_fav, ref)
+                    trail_level = max_fav * (1.0 - trailing_stop)
+                else:
+                    trail_level = 0.0
+                cooldown = 0
+
+        if in_pos and c == c:
+            eq_equity[i] = cash + shares * c
+            eq_position[i] = 1
+            eq_shares[i] = shares
+            eq_entry[i] = entry_px
+            eq_stop[i] = stop_level
+            eq_trail[i] = trail_level
+        else:
+            eq_equity[i] = cash
+            eq_position[i] = 0
+            eq_shares[i] = 0
+            eq_entry[i] = 0.0
+            eq_stop[i] = 0.0
+            eq_trail[i] = 0.0
+        eq_cash[i] = cash
+        eq_reason[i] = reason
+
+    return k
+
+
+_JIT_KERNEL = None
+
+
+def _compiled_kernel():
+    """numba.njit(_singlepos_kernel) when numba is installed, else None."""
+    global _JIT_KERNEL
+    if _JIT_KERNEL is None:
+        try:
+            import numba
+        except ImportError:
+            _JIT_KERNEL = False
+        else:
+            _JIT_KERNEL = numba.njit(cache=True)(_singlepos_kernel)
+    return _JIT_KERNEL or None
+
+
+def _bool_array(series: pd.Series) -> np.ndarray:
+    """_to_bool over a whole column, once."""
+    if series.dtype == bool:
+        return series.to_numpy()
+    return np.fromiter((_to_bool(v) for v in series.tolist()), dtype=bool, count=len(series))
+
+
+def _float_array(series: pd.Series) -> np.ndarray:
+    """_to_float over a whole column, once (unparseable -> NaN)."""
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+
+
+def _run_arrays(
+    df: pd.DataFrame,
+    buy_col: str,
+    sell_col: str,
+    trend_col: str,
+    initial_cash: float,
+    cooldown_bars: int,
+    slippage_bps: float,
+    stop_loss: float,
+    stop_loss_mode: StopMode,
+    trailing_stop: float,
+    trailing_mode: TrailingMode,
+    take_profit: float,
+    exit_mode: ExitMode,
+    buy_fee: float,
+    sell_fee: float,
+    sell_tax: float,
+    use_numba: Optional[bool] = None,
+) -> tuple[list[dict], pd.DataFrame]:
+    """
+    Typed columns are built once, the state machine runs over them
+    (_singlepos_kernel, numba-compiled when available), and only the output
+    frames are assembled in pandas. Output is identical to _run_rows.
+    """
+    n = len(df)
+    dates = [str(d) for d in df["date"].tolist()]
+    close = _float_array(df["close"])
+    low = _float_array(df["low"]) if "low" in df.columns else close
+    mark_stop = low if stop_loss_mode == "low" else close
+    mark_trail = low if trailing_mode == "low" else close
+    buy = _bool_array(df[buy_col])
+    sell = _bool_array(df[sell_col])
+    trend = _bool_array(df[trend_col])
+
+    kernel = _compiled_kernel() if use_numba is not False else None
+    if use_numba and kernel is None:
+        raise ImportError("use_numba=True needs numba (pip install numba)")
+
+    if kernel is not None:
+        eq_f = np.zeros((6, n))
+        eq_i = np.zeros((3, n), dtype=np.int64)
+        tr_f = np.zeros((3, n))
+        tr_i = np.zeros((4, n), dtype=np.int64)
+        args = (close, mark_stop, mark_trail, buy, sell, trend)
+    else:
+        # plain lists index much faster than ndarrays from Python
+        eq_f = [[0.0] * n for _ in range(6)]
+        eq_i = [[0] * n for _ in range(3)]
+        tr_f = [[0.0] * n for _ in range(3)]
+        tr_i = [[0] * n for _ in range(4)]
+        args = (close.tolist(), mark_stop.tolist(), mark_trail.tolist(), buy.tolist(), sell.tolist(), trend.tolist())
+        kernel = _singlepos_kernel
+
+    k = kernel(
+        *args,
+        float(initial_cash),
+        int(cooldown_bars),
+        float(slippage_bps) / 10000.0,
+        float(stop_loss),
+        float(trailing_stop),
+        float(take_profit),
+        exit_mode in ("both", "trend"),
+        exit_mode in ("both", "signal"),
+        float(buy_fee),
+        float(sell_fee),
+        float(sell_tax),
+        eq_f[0], eq_f[1], eq_i[0], eq_i[1], eq_f[2], eq_f[3], eq_f[4], eq_i[2],
+        tr_i[0], tr_i[1], tr_f[0], tr_f[1], tr_i[2], tr_f[2], tr_i[3],
+    )
+
+    def _col(buf, m: int) -> list:
+        return buf.tolist()[:m] if isinstance(buf, np.ndarray) else buf[:m]
+
+    reasons = {code: name.format(stop=stop_loss_mode, trail=trailing_mode) for code, name in _EXIT_REASONS.items()}
+
+    trades: list[dict] = []
+    entry_i, exit_i, shares_t, reason_t = (_col(b, k) for b in tr_i)
+    entry_px, exit_px, cash_t = (_col(b, k) for b in tr_f)
+    for t in range(k):
+        trades.append(
+            {
+                "entry_date": dates[entry_i[t]],
+                "exit_date": dates[exit_i[t]],
+                "entry_price": round(entry_px[t], 6),
+                "exit_price": round(exit_px[t], 6),
+                "shares": int(shares_t[t]),
+                "gross_pnl": round((exit_px[t] - entry_px[t]) * shares_t[t], 6),
+                "net_cashflow_exit": round(cash_t[t], 6),
+                "return_pct": (exit_px[t] / entry_px[t]) - 1.0,
+                "exit_reason": reasons[reason_t[t]],
+            }
+        )
+
+    if n == 0:
+        return trades, pd.DataFrame()
+
+    equity, cash, entry, stop, trail = (_col(b, n) for b in eq_f[:5])
+    position, shares, reason = (_col(b, n) for b in eq_i)
+    equity_df = pd.DataFrame(
+        {
+            "date": dates,
+            "equity": [round(v, 6) for v in equity],
+            "cash": [round(v, 6) for v in cash],
+            "position": position,
+            "shares": shares,
+            "entry_price": [round(v, 6) for v in entry],
+            "stop_level": [round(v, 6) for v in stop],
+            "trail_level": [round(v, 6) for v in trail],
+            "exit_reason_today": [reasons[c] for c in reason],
+        }
+    )
+    return trades, equity_df
+
+
+def backtest_singlepos(
+    df: pd.DataFrame,
+    initial_cash: float = 1_000_000.0,
+    cooldown_bars: int = 0,
+    slippage_bps: float = 0.0,
+    stop_loss: float = 0.0,
+    stop_loss_mode: StopMode = "close",
+    trailing_stop: float = 0.0,
+    trailing_mode: TrailingMode = "close",
+    take_profit: float = 0.0,
+    exit_mode: ExitMode = "both",
+    trend_exit: TrendExit = "sma_fast",
+    buy_fee: float = 0.001425,
+    sell_fee: float = 0.001425,
+    sell_tax: float = 0.003,
+    debug_signal_scan: bool = False,
+    engine: Engine = "array",
+    use_numba: Optional[bool] = None,
+) -> SinglePosResult:
+    """
+    Single-position backtest over a Phase5 signal frame (date/OHLC + signal columns).
+    Same rows main() writes to the trades / equity CSVs; nothing touches disk.
+
+    engine="array" (default) runs the typed-array kernel, numba-compiled when
+    numba is installed (use_numba=False forces pure Python); engine="rows" is
+    the original iterrows loop, kept as the parity reference.
+    """
+    debug_scan = bool(debug_signal_scan)
+
+    # === Signal column auto-alignment (Phase5 may output different names) ===
+    buy_col = _pick_best_signal_col(
+        df,
+        canonical="buy_signal",
+        candidates=["buy_signal", "buy", "signal_buy", "entry_signal", "enter", "long_entry", "entry", "buySignal"],
+        debug=debug_scan,
+    )
+    sell_col = _pick_best_signal_col(
+        df,
+        canonical="sell_signal",
+        candidates=["sell_signal", "sell", "signal_sell", "exit_signal", "exit", "long_exit", "sellSignal"],
+        debug=debug_scan,
+    )
+    trend_col = _pick_best_signal_col(
+        df,
+        canonical="trend_break",
+        candidates=["trend_break", "trend_exit", "trend_fail", "trend_down", "gate_trend_break", "trendBreak"],
+        debug=debug_scan,
+    )
+
+    params = dict(
+        initial_cash=float(initial_cash),
+        cooldown_bars=int(cooldown_bars),
+        slippage_bps=float(slippage_bps),
+        stop_loss=float(stop_loss),
+        stop_loss_mode=stop_loss_mode,
+        trailing_stop=float(trailing_stop),
+        trailing_mode=trailing_mode,
+        take_profit=float(take_profit),
+        exit_mode=exit_mode,
+        buy_fee=float(buy_fee),
+        sell_fee=float(sell_fee),
+        sell_tax=float(sell_tax),
+    )
+    # trend_exit: reserved, kept for interface compatibility
+    if engine == "rows":
+        trades, equity = _run_rows(df, buy_col, sell_col, trend_col, **params)
+    elif engine == "array":
+        trades, equity = _run_arrays(df, buy_col, sell_col, trend_col, use_numba=use_numba, **params)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    return SinglePosResult(trades, equity, buy_col, sell_col, trend_col)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+
+    inp = Path(args.inp)
+    if not inp.exists():
+        raise SystemExit(f"Input not found: {inp}")
+
+    df = pd.read_csv(inp)
+
+    need_cols = {"date", "open", "high", "low", "close"}
+    if not need_cols.issubset(set(df.columns)):
+        raise SystemExit(f"Missing OHLC columns in input. Need={sorted(need_cols)} got={df.columns.tolist()}")
+
+    res = backtest_singlepos(
+        df,
+        initial_cash=float(args.initial_cash),
+        cooldown_bars=int(args.cooldown_bars),
+        slippage_bps=float(args.slippage_bps),
+        stop_loss=float(args.stop_loss),
+        stop_loss_mode=args.stop_loss_mode,
+        trailing_stop=float(args.trailing_stop),
+        trailing_mode=args.trailing_mode,
+        take_profit=float(args.take_profit),
+        exit_mode=args.exit_mode,
+        trend_exit=args.trend_exit,
+        buy_fee=float(args.buy_fee),
+        sell_fee=float(args.sell_fee),
+        sell_tax=float(args.sell_tax),
+        debug_signal_scan=bool(getattr(args, "debug_signal_scan", False)),
+        engine=args.engine,
+        use_numba=False if args.no_numba else None,
+    )
+    trades = res.trades
+
     out_trades = Path(args.out_trades)
     out_equity = Path(args.out_equity)
     out_trades.parent.mkdir(parents=True, exist_ok=True)
     out_equity.parent.mkdir(parents=True, exist_ok=True)
 
     pd.DataFrame(trades).to_csv(out_trades, index=False, encoding="utf-8")
-    pd.DataFrame(equity_rows).to_csv(out_equity, index=False, encoding="utf-8")
+    res.equity.to_csv(out_equity, index=False, encoding="utf-8")
 
-    print(f"OK Phase6 wrote: {out_equity} rows={len(equity_rows)}")
+    print(f"OK Phase6 wrote: {out_equity} rows={len(res.equity)}")
     print(
         f"OK Phase6 wrote: {out_trades} trades={len(trades)} cooldown_bars={args.cooldown_bars} "
-        f"single_position=True exit_mode={exit_mode} trend_exit={trend_exit} "
-        f"stop_loss={stop_loss} stop_loss_mode={stop_mode} trailing_stop={trailing_stop} trailing_mode={trail_mode} "
-        f"slippage_bps={args.slippage_bps} (signal_cols: buy={buy_col}, sell={sell_col}, trend={trend_col})"
+        f"single_position=True exit_mode={args.exit_mode} trend_exit={args.trend_exit} "
+        f"stop_loss={float(args.stop_loss)} stop_loss_mode={args.stop_loss_mode} "
+        f"trailing_stop={float(args.trailing_stop)} trailing_mode={args.trailing_mode} "
+        f"slippage_bps={args.slippage_bps} (signal_cols: buy={res.buy_col}, sell={res.sell_col}, trend={res.trend_col})"
     )
     return 0
 
@@ -2,6 +2,7 @@
 
 import argparse
 from pathlib import Path
+from typing import Optional
 import pandas as pd
 
 
@@ -34,33 +35,18 @@ def safe_read_trades(path: Path) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--equity", default="data/phase6_equity_2330.csv")
-    ap.add_argument("--trades", default="data/phase6_trades_2330.csv")
-    ap.add_argument("--out", default="reports/report_2330.md")
-    args = ap.parse_args()
-
-    equity_path = Path(args.equity)
-    trades_path = Path(args.trades)
-    out_path = Path(args.out)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-
-    eq = pd.read_csv(equity_path)
-    tr = safe_read_trades(trades_path)
-
-    eq["equity"] = pd.to_numeric(eq["equity"], errors="coerce")
-    eq = eq.dropna(subset=["equity"]).copy()
-    if eq.empty:
-        raise SystemExit("Equity file has no valid rows")
-
+def compute_metrics(eq: pd.DataFrame, tr: pd.DataFrame) -> dict:
+    """
+    Report metrics from a Phase6 equity frame and trades frame (fractions, not %).
+    `eq` must already hold numeric, non-empty `equity`.
+    """
     start_equity = float(eq["equity"].iloc[0])
     end_equity = float(eq["equity"].iloc[-1])
     total_return = (end_equity / start_equity) - 1.0 if start_equity > 0 else 0.0
 
-    eq["ret"] = eq["equity"].pct_change().fillna(0.0)
-    vol = float(eq["ret"].std()) if len(eq) > 1 else 0.0
-    sharpe = float((eq["ret"].mean() / vol) * (252 ** 0.5)) if vol > 0 else 0.0
+    ret = eq["equity"].pct_change().fillna(0.0)
+    vol = float(ret.std()) if len(eq) > 1 else 0.0
+    sharpe = float((ret.mean() / vol) * (252 ** 0.5)) if vol > 0 else 0.0
 
     mdd = max_drawdown(eq["equity"])
 
@@ -83,22 +69,39 @@ def main() -> int:
     else:
         avg_hold = 0.0
 
+    return {
+        "start_equity": start_equity,
+        "end_equity": end_equity,
+        "total_return": total_return,
+        "max_drawdown": mdd,
+        "sharpe": sharpe,
+        "trade_count": trade_count,
+        "win_rate": win_rate,
+        "avg_trade": avg_trade,
+        "avg_hold_days": avg_hold,
+        "max_lose_streak": max_lose_streak,
+    }
+
+
+def render_report(eq: pd.DataFrame, tr: pd.DataFrame, m: dict) -> str:
+    trade_count = m["trade_count"]
+
     md = []
     md.append("# 2330 RSI Single-Position Backtest Report")
     md.append("")
     md.append(f"- Period: {eq['date'].iloc[0]} → {eq['date'].iloc[-1]}")
-    md.append(f"- Start Equity: {start_equity:,.0f}")
-    md.append(f"- End Equity: {end_equity:,.0f}")
-    md.append(f"- Total Return: {total_return*100:.2f}%")
-    md.append(f"- Max Drawdown: {mdd*100:.2f}%")
-    md.append(f"- Sharpe (rough): {sharpe:.2f}")
+    md.append(f"- Start Equity: {m['start_equity']:,.0f}")
+    md.append(f"- End Equity: {m['end_equity']:,.0f}")
+    md.append(f"- Total Return: {m['total_return']*100:.2f}%")
+    md.append(f"- Max Drawdown: {m['max_drawdown']*100:.2f}%")
+    md.append(f"- Sharpe (rough): {m['sharpe']:.2f}")
     md.append("")
     md.append("## Trades")
     md.append(f"- Trade Count: {trade_count}")
-    md.append(f"- Win Rate: {win_rate*100:.2f}%")
-    md.append(f"- Avg Trade Return: {avg_trade*100:.2f}%")
-    md.append(f"- Avg Holding Days: {avg_hold:.2f}")
-    md.append(f"- Max Losing Streak (trades): {max_lose_streak}")
+    md.append(f"- Win Rate: {m['win_rate']*100:.2f}%")
+    md.append(f"- Avg Trade Return: {m['avg_trade']*100:.2f}%")
+    md.append(f"- Avg Holding Days: {m['avg_hold_days']:.2f}")
+    md.append(f"- Max Losing Streak (trades): {m['max_lose_streak']}")
     md.append("")
 
     if trade_count > 0:
@@ -118,7 +121,31 @@ def main() -> int:
         md.append("> No trades generated under this parameter set.")
         md.append("")
 
-    out_path.write_text("\n".join(md), encoding="utf-8")
+    return "\n".join(md)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--equity", default="data/phase6_equity_2330.csv")
+    ap.add_argument("--trades", default="data/phase6_trades_2330.csv")
+    ap.add_argument("--out", default="reports/report_2330.md")
+    args = ap.parse_args(argv)
+
+    equity_path = Path(args.equity)
+    trades_path = Path(args.trades)
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    eq = pd.read_csv(equity_path)
+    tr = safe_read_trades(trades_path)
+
+    eq["equity"] = pd.to_numeric(eq["equity"], errors="coerce")
+    eq = eq.dropna(subset=["equity"]).copy()
+    if eq.empty:
+        raise SystemExit("Equity file has no valid rows")
+
+    m = compute_metrics(eq, tr)
+    out_path.write_text(render_report(eq, tr, m), encoding="utf-8")
     print(f"OK Phase7 wrote: {out_path}")
     return 0
 
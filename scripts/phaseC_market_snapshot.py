@@ -1,7 +1,14 @@
-import argparse, json, os
+import argparse, json, os, sys
 from datetime import datetime
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from universe_store import load_universe
+from phaseC_range import InputsManifest, day_fingerprints
+
+COLUMNS = ["date","code","name","sector","change_percent","total_score"]
+SORT_KEYS = ["heat_score","avg_total_score","avg_change_percent","count"]
+
 def safe_float(x, default=0.0):
     try:
         if x is None: return default
@@ -28,34 +35,44 @@ def load_indices(indices_path):
     with open(indices_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def compute_sector_heat(day_df, top_n=5):
-    d = day_df.copy()
+def sector_stats(df):
+    """Per (date, sector) heat stats for every date in df, from one groupby."""
+    d = df[["date","sector","change_percent","total_score"]].copy()
+    d["date"] = d["date"].astype(str)
     d["sector"] = d["sector"].fillna("Unknown").astype(str).str.strip()
     d.loc[d["sector"]=="", "sector"] = "Unknown"
     d["change_percent"] = pd.to_numeric(d["change_percent"], errors="coerce")
     d["total_score"] = pd.to_numeric(d["total_score"], errors="coerce")
     d = d.dropna(subset=["change_percent", "total_score"])
 
-    d["dir"] = d["change_percent"].apply(lambda v: "up" if v > 0 else ("down" if v < 0 else "flat"))
+    d["up"] = d["change_percent"] > 0
+    d["down"] = d["change_percent"] < 0
+    d["flat"] = ~(d["up"] | d["down"])
 
-    g = (d.groupby("sector", dropna=False)
+    g = (d.groupby(["date","sector"], dropna=False)
            .agg(
                count=("sector","size"),
                avg_total_score=("total_score","mean"),
                avg_change_percent=("change_percent","mean"),
-               up=("dir", lambda s: int((s=="up").sum())),
-               down=("dir", lambda s: int((s=="down").sum())),
-               flat=("dir", lambda s: int((s=="flat").sum()))
+               up=("up","sum"),
+               down=("down","sum"),
+               flat=("flat","sum")
            )
            .reset_index())
 
     # Heat score (simple, stable): score-weighted + change boost
     g["heat_score"] = g["avg_total_score"] * 1.0 + (g["avg_change_percent"] * 5.0)
+    return g
 
-    g = g.sort_values(["heat_score","avg_total_score","avg_change_percent","count"], ascending=[False,False,False,False])
+def compute_sector_heat(day_df, top_n=5):
+    return rank_sector_heat(sector_stats(day_df).drop(columns="date"), top_n)
+
+def rank_sector_heat(g, top_n=5):
+    """(top, weak, sorted g) from one date's sector stats."""
+    g = g.sort_values(SORT_KEYS, ascending=[False,False,False,False])
 
     top = g.head(top_n).copy()
-    weak = g.tail(top_n).sort_values(["heat_score","avg_total_score","avg_change_percent","count"], ascending=[True,True,True,False]).copy()
+    weak = g.tail(top_n).sort_values(SORT_KEYS, ascending=[True,True,True,False]).copy()
 
     def pack(df_):
         out = []
@@ -75,8 +92,10 @@ def compute_sector_heat(day_df, top_n=5):
     return pack(top), pack(weak), g
 
 def compute_metrics(day_df, indices_obj, sector_full_df):
+    return metrics_for(len(day_df), indices_obj, sector_full_df)
+
+def metrics_for(total, indices_obj, sector_full_df):
     # heat_concentration_top3: top3 sectors by count / total
-    total = len(day_df)
     conc = 0.0
     if total > 0 and sector_full_df is not None and not sector_full_df.empty:
         top3 = sector_full_df.sort_values("count", ascending=False).head(3)["count"].sum()
@@ -102,13 +121,26 @@ def compute_metrics(day_df, indices_obj, sector_full_df):
         "index_divergence": round(div, 4) if div is not None else None
     }
 
+def breadth_counts(df):
+    """DataFrame indexed by date: rows (all), total/adv/dec (rows with a numeric change_percent)."""
+    cp = pd.to_numeric(df["change_percent"], errors="coerce")
+    b = pd.DataFrame({
+        "date": df["date"].astype(str).to_numpy(),
+        "rows": 1,
+        "total": cp.notna().to_numpy(),
+        "adv": (cp > 0).to_numpy(),
+        "dec": (cp < 0).to_numpy(),
+    })
+    return b.groupby("date", sort=True).sum().astype(int)
+
 def compute_tape_summary(day_df, hot_sectors, weak_sectors):
-    d = day_df.copy()
-    d["change_percent"] = pd.to_numeric(d["change_percent"], errors="coerce")
-    d = d.dropna(subset=["change_percent"])
-    total = int(len(d))
-    adv = int((d["change_percent"] > 0).sum())
-    dec = int((d["change_percent"] < 0).sum())
+    c = breadth_counts(day_df)
+    if c.empty:
+        return tape_summary(0, 0, 0, hot_sectors, weak_sectors)
+    r = c.iloc[0]
+    return tape_summary(int(r["total"]), int(r["adv"]), int(r["dec"]), hot_sectors, weak_sectors)
+
+def tape_summary(total, adv, dec, hot_sectors, weak_sectors):
     adv_ratio = (adv / total) if total else 0.0
 
     # Band + suggested position (Chinese, stable)
@@ -141,9 +173,40 @@ def compute_tape_summary(day_df, hot_sectors, weak_sectors):
         "suggested_position": round(float(suggested_position), 4)
     }
 
+def snapshot_payload(date, indices_obj, metrics, tape, hot, weak):
+    return {
+        "date": date,
+        "indices": indices_obj,
+        "metrics": metrics,
+        "tape_summary": tape,
+        "sector_heat": {
+            "top": hot,
+            "weak": weak
+        },
+        "source": "phaseC_market_snapshot",
+        "generated_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+    }
+
+def indices_path_for(outdir, date):
+    return os.path.join(outdir, f"indices_{date}.json")
+
+def write_snapshot(outdir, date, indices_obj, payload):
+    snap_path = os.path.join(outdir, f"market_snapshot_{date}.json")
+    write_json(snap_path, payload)
+
+    # also (re)write indices file as UTF-8 if exists (normalize encoding)
+    # (only when it has content)
+    if isinstance(indices_obj, dict) and len(indices_obj) > 0:
+        write_json(indices_path_for(outdir, date), indices_obj)
+    return snap_path
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--date", default="", help="YYYY-MM-DD")
+    ap.add_argument("--range", nargs=2, metavar=("START", "END"), default=None,
+                    help="Every date in [START, END] from one load; writes <outdir>/market_snapshot_<date>.json")
+    ap.add_argument("--incremental", action="store_true",
+                    help="--range: skip dates whose snapshot exists and whose inputs (rows, indices file) are unchanged")
     ap.add_argument("--outdir", default="reports")
     ap.add_argument("--csv", default=os.path.join("data","all_stocks_daily.csv"))
     ap.add_argument("--top_sectors", type=int, default=5)
@@ -152,57 +215,71 @@ def main():
     ap.add_argument("--top", default=None)
     args = ap.parse_args()
 
-    date = args.date.strip() or datetime.now().strftime("%Y-%m-%d")
+    if args.range:
+        start, end = (x.strip() for x in args.range)
+    else:
+        start = end = args.date.strip() or datetime.now().strftime("%Y-%m-%d")
     outdir = args.outdir
 
     if not os.path.exists(args.csv):
         raise SystemExit(f"CSV not found: {args.csv}")
 
-    # CSV: tolerate BOM + mixed types
-    df = pd.read_csv(args.csv, encoding="utf-8-sig", low_memory=False)
-    need = {"date","code","name","sector","change_percent","total_score"}
+    # columnar store: only the months of [start, end] and the columns used below
+    df = load_universe(start, end, columns=COLUMNS, csv_path=args.csv, float32_scores=False)
+    need = set(COLUMNS)
     missing = [c for c in need if c not in df.columns]
     if missing:
         raise SystemExit(f"CSV missing columns: {missing}")
 
-    day = df[df["date"].astype(str) == date].copy()
-    if day.empty:
-        raise SystemExit(f"No rows for date={date} in {args.csv}")
+    if not args.range:
+        day = df[df["date"].astype(str) == start].copy()
+        if day.empty:
+            raise SystemExit(f"No rows for date={start} in {args.csv}")
+        df = day
+    elif df.empty:
+        raise SystemExit(f"No rows for dates {start}..{end} in {args.csv}")
 
-    # Indices: prefer existing indices file if present
-    indices_path = os.path.join(outdir, f"indices_{date}.json")
-    indices_obj = load_indices(indices_path)
+    dates = sorted(df["date"].astype(str).unique())
 
+    # Indices: prefer existing indices file if present
     # If not present, still emit placeholder indices block (keeps schema stable)
-    if indices_obj is None:
-        indices_obj = {}
-
-    hot, weak, sector_full = compute_sector_heat(day, top_n=args.top_sectors)
-    metrics = compute_metrics(day, indices_obj, sector_full)
-    tape = compute_tape_summary(day, hot, weak)
-
-    payload = {
-        "date": date,
-        "indices": indices_obj,
-        "metrics": metrics,
-        "tape_summary": tape,
-        "sector_heat": {
-            "top": hot,
-            "weak": weak
-        },
-        "source": "phaseC_market_snapshot",
-        "generated_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-    }
-
-    snap_path = os.path.join(outdir, f"market_snapshot_{date}.json")
-    write_json(snap_path, payload)
-
-    # also (re)write indices file as UTF-8 if exists (normalize encoding)
-    # (only when it has content)
-    if isinstance(indices_obj, dict) and len(indices_obj) > 0:
-        write_json(indices_path, indices_obj)
-
-    print(snap_path)
+    indices = {}
+    for date in dates:
+        indices[date] = load_indices(indices_path_for(outdir, date)) or {}
+
+    manifest = None
+    fps = {}
+    if args.range and args.incremental:
+        manifest = InputsManifest(outdir, "market_snapshot", {"source_csv": os.path.normpath(args.csv), "top_sectors": args.top_sectors})
+        extra = {d: json.dumps(indices[d], sort_keys=True, ensure_ascii=False).encode("utf-8") for d in dates}
+        fps = day_fingerprints(df, COLUMNS, extra)
+
+    g_all = sector_stats(df)
+    sectors = dict(iter(g_all.groupby("date", sort=True)))
+    counts = breadth_counts(df)
+
+    wrote = skipped = 0
+    for date in dates:
+        snap_path = os.path.join(outdir, f"market_snapshot_{date}.json")
+        if manifest is not None and manifest.up_to_date(date, fps[date], snap_path):
+            skipped += 1
+            continue
+        g = sectors.get(date, g_all.iloc[0:0]).drop(columns="date")
+        c = counts.loc[date]
+        hot, weak, sector_full = rank_sector_heat(g, top_n=args.top_sectors)
+        metrics = metrics_for(int(c["rows"]), indices[date], sector_full)
+        tape = tape_summary(int(c["total"]), int(c["adv"]), int(c["dec"]), hot, weak)
+
+        payload = snapshot_payload(date, indices[date], metrics, tape, hot, weak)
+        print(write_snapshot(outdir, date, indices[date], payload))
+        wrote += 1
+        if manifest is not None:
+            manifest.record(date, fps[date])
+
+    if manifest is not None:
+        manifest.save()
+    if args.range:
+        print(f"OK: market_snapshot {start}..{end} wrote={wrote} skipped={skipped}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+phaseC_range.py
+
+Shared plumbing for the --range mode of phaseC_sector_heat.py and
+phaseC_market_snapshot.py:
+- day_fingerprints(): one hash per date over that date's input rows
+- InputsManifest: <outdir>/.<name>_inputs.json, the fingerprint each written
+  report was built from, so --incremental can skip dates whose report exists
+  and whose inputs (and parameters) did not change
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_VERSION = 1
+
+
+def day_fingerprints(df: pd.DataFrame, columns: Sequence[str], extra: Optional[Dict[str, bytes]] = None) -> Dict[str, str]:
+    """{date: sha1 of that date's rows (columns, in file order) + extra[date]}."""
+    if df.empty:
+        return {}
+    cols = [c for c in columns if c in df.columns]
+    # hash values as text so float32/float64 or categorical/str storage does not matter
+    row_hash = pd.util.hash_pandas_object(df[cols].astype(str), index=False).to_numpy(dtype=np.uint64)
+    dates = df["date"].astype(str).to_numpy()
+    out: Dict[str, str] = {}
+    order = np.argsort(dates, kind="stable")
+    sd = dates[order]
+    bounds = np.flatnonzero(sd[1:] != sd[:-1]) + 1
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(sd)]):
+        d = str(sd[lo])
+        h = hashlib.sha1(row_hash[order[lo:hi]].tobytes())
+        if extra and d in extra:
+            h.update(extra[d])
+        out[d] = h.hexdigest()
+    return out
+
+
+class InputsManifest:
+    def __init__(self, outdir: str, name: str, params: dict):
+        self.path = os.path.join(outdir, f".{name}_inputs.json")
+        self.params = params
+        self.dates: Dict[str, str] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                m = json.load(f)
+        except (OSError, ValueError):
+            return
+        if m.get("version") == MANIFEST_VERSION and m.get("params") == params:
+            self.dates = dict(m.get("dates") or {})
+
+    def up_to_date(self, date: str, fingerprint: str, out_path: str) -> bool:
+        return self.dates.get(date) == fingerprint and os.path.exists(out_path)
+
+    def record(self, date: str, fingerprint: str) -> None:
+        self.dates[date] = fingerprint
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "params": self.params, "dates": self.dates},
+                      f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
@@ -2,41 +2,36 @@ import argparse, json, os, sys
 from datetime import datetime
 import pandas as pd
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--date", required=True, help="YYYY-MM-DD")
-    ap.add_argument("--csv", default=os.path.join("data","all_stocks_daily.csv"))
-    ap.add_argument("--out", default="")
-    ap.add_argument("--top", type=int, default=5)
-    ap.add_argument("--min_count", type=int, default=10)
-    args = ap.parse_args()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from universe_store import load_universe
+from phaseC_range import InputsManifest, day_fingerprints
 
-    date = args.date.strip()
-    if not date:
-        raise SystemExit("date required")
+COLUMNS = ["date", "sector", "change_percent", "total_score"]
 
-    csv_path = args.csv
-    if not os.path.exists(csv_path):
-        raise SystemExit(f"CSV not found: {csv_path}")
 
-    df = pd.read_csv(csv_path, low_memory=False)
-    # expected columns: date, code, name, sector, change_percent, total_score
-    need = {"date","sector","change_percent","total_score"}
-    miss = [c for c in need if c not in df.columns]
-    if miss:
-        raise SystemExit(f"CSV missing columns: {miss}")
-
-    d = df[df["date"].astype(str) == date].copy()
-    if d.empty:
-        raise SystemExit(f"No rows for date={date} in {csv_path}")
-
-    # sanitize
+def sanitize(df):
+    d = df.copy()
+    d["date"] = d["date"].astype(str)
     d["sector"] = d["sector"].fillna("Unknown").astype(str).str.strip()
     d.loc[d["sector"]=="", "sector"] = "Unknown"
     d["change_percent"] = pd.to_numeric(d["change_percent"], errors="coerce")
     d["total_score"] = pd.to_numeric(d["total_score"], errors="coerce")
-    d = d.dropna(subset=["change_percent","total_score"])
+    return d.dropna(subset=["change_percent","total_score"])
+
+
+def sector_stats(d):
+    """count / avg_change / avg_score for every (date, sector), one groupby over the whole range."""
+    return (d.groupby(["date", "sector"], dropna=False)
+              .agg(
+                  count=("sector","size"),
+                  avg_change=("change_percent","mean"),
+                  avg_score=("total_score","mean")
+              )
+              .reset_index())
+
 
+def day_payload(date, d, g_all, csv_path, top, min_count):
+    """Payload for one date: d = that date's sanitized rows, g_all = that date's sector_stats rows."""
     # breadth
     adv = int((d["change_percent"] > 0).sum())
     dec = int((d["change_percent"] < 0).sum())
@@ -59,29 +54,17 @@ def main():
     bot_mean = float(d_sorted.tail(bot_n)["change_percent"].mean()) if total else 0.0
 
     # sector heat
-    g = (d.groupby("sector", dropna=False)
-           .agg(
-               count=("sector","size"),
-               avg_change=("change_percent","mean"),
-               avg_score=("total_score","mean")
-           )
-           .reset_index())
-
-    g = g[g["count"] >= args.min_count].copy()
+    g = g_all[g_all["count"] >= min_count].copy()
     if g.empty:
         # fallback: no min_count filter
-        g = (d.groupby("sector", dropna=False)
-               .agg(count=("sector","size"),
-                    avg_change=("change_percent","mean"),
-                    avg_score=("total_score","mean"))
-               .reset_index())
+        g = g_all.copy()
 
     # ranking: score first, then change
     g["avg_change"] = g["avg_change"].astype(float)
     g["avg_score"] = g["avg_score"].astype(float)
 
-    hot = g.sort_values(["avg_score","avg_change","count"], ascending=[False,False,False]).head(args.top)
-    weakz = g.sort_values(["avg_score","avg_change","count"], ascending=[True,True,False]).head(args.top)
+    hot = g.sort_values(["avg_score","avg_change","count"], ascending=[False,False,False]).head(top)
+    weakz = g.sort_values(["avg_score","avg_change","count"], ascending=[True,True,False]).head(top)
 
     def pack(df_):
         out = []
@@ -94,7 +77,7 @@ def main():
             })
         return out
 
-    payload = {
+    return {
         "date": date,
         "source_csv": os.path.normpath(csv_path),
         "generated_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
@@ -121,15 +104,89 @@ def main():
         }
     }
 
-    out_path = args.out.strip()
-    if not out_path:
-        out_path = os.path.join("reports", f"sector_heat_{date}.json")
 
+def write_payload(out_path, payload):
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
 
-    print(out_path)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--date", default="", help="YYYY-MM-DD")
+    ap.add_argument("--range", nargs=2, metavar=("START", "END"), default=None,
+                    help="Every date in [START, END] from one load; writes <outdir>/sector_heat_<date>.json")
+    ap.add_argument("--csv", default=os.path.join("data","all_stocks_daily.csv"))
+    ap.add_argument("--out", default="")
+    ap.add_argument("--outdir", default="reports", help="Output dir for --range")
+    ap.add_argument("--incremental", action="store_true",
+                    help="--range: skip dates whose report exists and whose input rows are unchanged")
+    ap.add_argument("--top", type=int, default=5)
+    ap.add_argument("--min_count", type=int, default=10)
+    args = ap.parse_args()
+
+    if args.range:
+        start, end = (x.strip() for x in args.range)
+    else:
+        start = end = args.date.strip()
+        if not start:
+            raise SystemExit("date required")
+
+    csv_path = args.csv
+    if not os.path.exists(csv_path):
+        raise SystemExit(f"CSV not found: {csv_path}")
+
+    # columnar store: only the months of [start, end] and the columns used below
+    df = load_universe(start, end, columns=COLUMNS, csv_path=csv_path, float32_scores=False)
+    # expected columns: date, code, name, sector, change_percent, total_score
+    need = set(COLUMNS)
+    miss = [c for c in need if c not in df.columns]
+    if miss:
+        raise SystemExit(f"CSV missing columns: {miss}")
+
+    if not args.range:
+        df = df[df["date"].astype(str) == start]
+        if df.empty:
+            raise SystemExit(f"No rows for date={start} in {csv_path}")
+        d = sanitize(df)
+        payload = day_payload(start, d, sector_stats(d).drop(columns="date"), csv_path, args.top, args.min_count)
+        out_path = args.out.strip() or os.path.join("reports", f"sector_heat_{start}.json")
+        write_payload(out_path, payload)
+        print(out_path)
+        return
+
+    if df.empty:
+        raise SystemExit(f"No rows for dates {start}..{end} in {csv_path}")
+
+    manifest = None
+    fps = {}
+    if args.incremental:
+        params = {"source_csv": os.path.normpath(csv_path), "top": args.top, "min_count": args.min_count}
+        manifest = InputsManifest(args.outdir, "sector_heat", params)
+        fps = day_fingerprints(df, COLUMNS)
+
+    d_all = sanitize(df)
+    g_all = sector_stats(d_all)
+    days = dict(iter(d_all.groupby("date", sort=True)))
+    sectors = dict(iter(g_all.groupby("date", sort=True)))
+
+    wrote = skipped = 0
+    for date in sorted(df["date"].astype(str).unique()):
+        out_path = os.path.join(args.outdir, f"sector_heat_{date}.json")
+        if manifest is not None and manifest.up_to_date(date, fps[date], out_path):
+            skipped += 1
+            continue
+        d = days.get(date, d_all.iloc[0:0])
+        g = sectors.get(date, g_all.iloc[0:0])
+        write_payload(out_path, day_payload(date, d, g.drop(columns="date"), csv_path, args.top, args.min_count))
+        print(out_path)
+        wrote += 1
+        if manifest is not None:
+            manifest.record(date, fps[date])
+
+    if manifest is not None:
+        manifest.save()
+    print(f"OK: sector_heat {start}..{end} wrote={wrote} skipped={skipped}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
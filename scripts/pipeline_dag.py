@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+pipeline_dag.py
+
+In-process pipeline runner shared by weekly_pipeline.py, run_pipeline.py and
+weekly_pipeline_2330.py:
+- Step: a function plus the files it reads (inputs) and writes (outputs),
+  the steps it must wait for (deps) and the parameters that shape its result
+- Pipeline.run(): runs steps as soon as their deps are done, independent
+  steps concurrently on a thread pool
+- Context: in-memory artifacts handed from step to step (ctx.put / ctx.get),
+  so e.g. the universe DataFrame is loaded once, not once per child process
+- make-like skipping: a step whose input contents (sha1), code and params
+  match its last successful run, and whose outputs still exist unchanged, is
+  not run again; "code" = the step's script files plus every project module
+  they import (code_files), so editing e.g. phase7_report.py reruns phase7
+- run manifest (<manifest_path>, JSON): per-step status, timing, input hashes;
+  also the state the next run's skip check reads
+- each step that runs is an instrument stage (src/utils/instrument.py), so
+  IA_TRACE=1 adds its CPU/RSS/bytes to reports/trace.jsonl
+
+File hashes are cached by (size, mtime_ns) in the manifest, like the .npy
+price cache, so unchanged inputs are not re-read on every run.
+"""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCRIPTS = os.path.join(ROOT, "scripts")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.utils.instrument import stage
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class Step:
+    name: str
+    fn: Callable[["Context"], Any]
+    inputs: Sequence[str] = ()
+    outputs: Sequence[str] = ()
+    deps: Sequence[str] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    cache: bool = True  # False: always run (e.g. steps with side effects outside outputs)
+    code: Sequence[str] = ()  # source files producing the outputs (imports are followed)
+
+
+class Context:
+    """Artifacts shared between steps; get() loads (once, thread-safe) what no step has put yet."""
+
+    def __init__(self):
+        self._items: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+
+    def get(self, key: str, loader: Optional[Callable[[], Any]] = None) -> Any:
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+            if loader is None:
+                raise KeyError(key)
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                if key in self._items:
+                    return self._items[key]
+            value = loader()
+            self.put(key, value)
+            return value
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            return key in self._items
+
+
+def _sha1_file(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _params_hash(params: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _module_file(name: str, base_dirs: Sequence[str]) -> Optional[str]:
+    rel = name.replace(".", os.sep)
+    for base in base_dirs:
+        for cand in (os.path.join(base, rel + ".py"), os.path.join(base, rel, "__init__.py")):
+            if os.path.isfile(cand):
+                return os.path.abspath(cand)
+    return None
+
+
+def _imported_files(path: str) -> List[str]:
+    """Project files (under ROOT) imported anywhere in path, including function-level imports."""
+    try:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError, ValueError):
+        return []
+    here = os.path.dirname(os.path.abspath(path))
+    bases = [here, SCRIPTS, ROOT]
+    names: List[Tuple[str, Sequence[str]]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [(a.name, bases) for a in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                pkg = here
+                for _ in range(node.level - 1):
+                    pkg = os.path.dirname(pkg)
+                mod, base = node.module or "", [pkg]
+            else:
+                mod, base = node.module or "", bases
+            if mod:
+                names.append((mod, base))
+            # `from pkg import module`
+            names += [(f"{mod}.{a.name}" if mod else a.name, base) for a in node.names if a.name != "*"]
+    out: List[str] = []
+    for name, base in names:
+        parts = name.split(".")
+        # package __init__ files run too: src.utils.instrument -> src/__init__.py, src/utils/__init__.py
+        for k in range(1, len(parts) + 1):
+            f = _module_file(".".join(parts[:k]), base)
+            if f is not None and f.startswith(ROOT + os.sep):
+                out.append(f)
+    return out
+
+
+def code_files(paths: Sequence[str]) -> List[str]:
+    """paths plus every project module they import, transitively (sorted, absolute)."""
+    seen: set = set()
+    todo = [os.path.abspath(p) for p in paths]
+    while todo:
+        p = todo.pop()
+        if p in seen or not os.path.isfile(p):
+            continue
+        seen.add(p)
+        todo.extend(f for f in _imported_files(p) if f not in seen)
+    return sorted(seen)
+
+
+def _now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat()
+
+
+class Pipeline:
+    def __init__(self, name: str, steps: Sequence[Step], manifest_path: str, workers: int = 4,
+                 keep_going: bool = False, force: bool = False):
+        """
+        keep_going=True: a failed step does not stop its dependents (they run on
+        whatever the failed step left on disk), like the old WARN-and-continue
+        subprocess runner; False: dependents are marked "blocked".
+        """
+        self.name = name
+        self.steps = list(steps)
+        self.by_name = {s.name: s for s in self.steps}
+        if len(self.by_name) != len(self.steps):
+            raise ValueError("duplicate step names")
+        for s in self.steps:
+            for d in s.deps:
+                if d not in self.by_name:
+                    raise ValueError(f"step {s.name}: unknown dep {d}")
+        self._check_acyclic()
+        self.manifest_path = manifest_path
+        self.workers = max(1, int(workers))
+        self.keep_going = keep_going
+        self.force = force
+        self._hash_lock = threading.Lock()
+        self._prev = self._load_manifest()
+        self._code = {s.name: code_files(s.code) for s in self.steps if s.code}
+        self._file_hashes: Dict[str, dict] = dict(self._prev.get("files") or {})
+
+    def _check_acyclic(self) -> None:
+        state: Dict[str, int] = {}
+
+        def visit(n: str, path: List[str]) -> None:
+            if state.get(n) == 2:
+                return
+            if state.get(n) == 1:
+                raise ValueError("dependency cycle: " + " -> ".join(path + [n]))
+            state[n] = 1
+            for d in self.by_name[n].deps:
+                visit(d, path + [n])
+            state[n] = 2
+
+        for s in self.steps:
+            visit(s.name, [])
+
+    # ---------- manifest / hashing ----------
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                m = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return m if m.get("version") == MANIFEST_VERSION else {}
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """sha1 of path's content (None = missing), reusing the cached hash while size/mtime match."""
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            return None
+        with self._hash_lock:
+            c = self._file_hashes.get(key)
+            if c and c.get("size") == st.st_size and c.get("mtime_ns") == st.st_mtime_ns:
+                return c["sha1"]
+        digest = _sha1_file(key)
+        with self._hash_lock:
+            self._file_hashes[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": digest}
+        return digest
+
+    def _input_hashes(self, step: Step) -> Dict[str, Optional[str]]:
+        hashes = {p: self.file_hash(p) for p in step.inputs}
+        for p in self._code.get(step.name, ()):
+            hashes.setdefault(p, self.file_hash(p))
+        return hashes
+
+    def _up_to_date(self, step: Step, inputs: Dict[str, Optional[str]]) -> bool:
+        if self.force or not step.cache:
+            return False
+        prev = ((self._prev.get("steps") or {}).get(step.name)) or {}
+        if prev.get("status") not in ("ran", "skipped"):
+            return False
+        if prev.get("params") != _params_hash(step.params) or prev.get("inputs") != inputs:
+            return False
+        # outputs still there and not touched since (missing -> None never matches a recorded hash)
+        outputs = {p: self.file_hash(p) for p in step.outputs}
+        return None not in outputs.values() and prev.get("outputs") == outputs
+
+    def _save_manifest(self, run: dict) -> None:
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(run, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    # ---------- run ----------
+
+    def _run_step(self, step: Step, ctx: Context) -> dict:
+        rec: Dict[str, Any] = {"started_at": _now(), "params": _params_hash(step.params)}
+        t0 = time.perf_counter()
+        inputs = self._input_hashes(step)
+        rec["inputs"] = inputs
+        if self._up_to_date(step, inputs):
+            rec["status"] = "skipped"
+        else:
+            try:
+                with stage(step.name) as st:
+                    for p in step.inputs:
+                        st.read(p)
+                    rc = step.fn(ctx)
+                    for p in step.outputs:
+                        st.wrote(p)
+            except SystemExit as e:
+                # scripts abort with SystemExit("message") or SystemExit(rc)
+                rc = e.code if isinstance(e.code, int) or e.code is None else 1
+                if rc and not isinstance(e.code, int):
+                    rec["error"] = str(e.code)
+            except Exception as e:
+                rc = 1
+                rec["error"] = f"{type(e).__name__}: {e}"
+            rec["status"] = "ran" if not rc else "failed"
+            if rc and "error" not in rec:
+                rec["error"] = f"rc={rc}"
+        rec["seconds"] = round(time.perf_counter() - t0, 4)
+        rec["outputs"] = {p: self.file_hash(p) for p in step.outputs}
+        return rec
+
+    def run(self, ctx: Optional[Context] = None) -> dict:
+        """Run every step; returns the run manifest (also written to manifest_path)."""
+        ctx = ctx or Context()
+        t0 = time.perf_counter()
+        run: Dict[str, Any] = {"version": MANIFEST_VERSION, "pipeline": self.name, "started_at": _now(), "steps": {}}
+        results: Dict[str, dict] = run["steps"]
+        pending = {s.name: s for s in self.steps}
+        running: Dict[Any, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            while pending or running:
+                for name in list(pending):
+                    step = pending[name]
+                    if any(d not in results for d in step.deps):
+                        continue
+                    del pending[name]
+                    bad = [d for d in step.deps if results[d]["status"] in ("failed", "blocked")]
+                    if bad and not self.keep_going:
+                        results[name] = {"status": "blocked", "error": "failed deps: " + ",".join(bad), "seconds": 0.0}
+                        print(f"WARN: step blocked: {name} (failed deps: {','.join(bad)})")
+                        continue
+                    running[ex.submit(self._run_step, step, ctx)] = name
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    rec = fut.result()
+                    results[name] = rec
+                    if rec["status"] == "failed":
+                        print(f"WARN: step failed: {name}: {rec.get('error', '')}")
+                    else:
+                        print(f"step {name}: {rec['status']} ({rec['seconds']:.2f}s)")
+
+        run["seconds"] = round(time.perf_counter() - t0, 4)
+        run["ok"] = all(r["status"] in ("ran", "skipped") for r in results.values())
+        run["steps"] = {s.name: results[s.name] for s in self.steps}
+        run["files"] = self._file_hashes
+        try:
+            self._save_manifest(run)
+        except OSError as e:
+            print(f"WARN: could not write run manifest {self.manifest_path}: {e}")
+        return run
+
+
+# ---------- helpers for steps that are whole scripts ----------
+
+_MODULES: Dict[str, Any] = {}
+_MODULES_LOCK = threading.Lock()
+
+
+def load_script(path: str):
+    """Import a script file as a module (once per path), without running its __main__ block."""
+    key = os.path.abspath(path)
+    with _MODULES_LOCK:
+        mod = _MODULES.get(key)
+        if mod is None:
+            name = "_pipeline_" + os.path.splitext(os.path.basename(key))[0]
+            spec = importlib.util.spec_from_file_location(name, key)
+            mod = importlib.util.module_from_spec(spec)
+            sys.modules[name] = mod  # dataclasses look their module up there
+            try:
+                spec.loader.exec_module(mod)
+            except BaseException:
+                sys.modules.pop(name, None)
+                raise
+            _MODULES[key] = mod
+        return mod
+
+
+def script_step(path: str, argv: List[str], python: str = "") -> Callable[[Context], int]:
+    """
+    Step fn running a script's main(argv) in this process; with `python`, as
+    a child process of that interpreter instead (the old behaviour).
+    """
+    def fn(ctx: Context) -> int:
+        if python:
+            print(">> " + " ".join([python, path] + argv))
+            return int(subprocess.run([python, path] + argv).returncode)
+        print(">> " + " ".join([os.path.basename(path)] + argv))
+        return int(load_script(path).main(argv) or 0)
+    return fn
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """
 ranking_engine.py
-- Read daily universe CSV (e.g. data/all_stocks_daily.csv)
+- Read daily universe CSV (e.g. data/all_stocks_daily.csv) through universe_store
+  (only the target date's month partition)
 - Select latest date (or specified date) and rank by total_score
 - Output top N ranking CSV
 
@@ -17,25 +18,17 @@ from typing import Optional
 
 import pandas as pd
 
-REQUIRED = ["date", "code", "total_score"]
-
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS not in sys.path:
+    sys.path.insert(0, SCRIPTS)
+ROOT = os.path.dirname(SCRIPTS)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
 
-def _read_csv(path: str) -> pd.DataFrame:
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Missing: {path}")
+from universe_store import latest_universe_date, load_universe
+from src.utils.instrument import stage, traced_run
 
-    # Force stable dtypes to avoid mixed-type warnings on big CSVs
-    dtype = {
-        "date": str,
-        "code": str,
-        "source": str,
-    }
-
-    # best effort encoding handling
-    try:
-        return pd.read_csv(path, dtype=dtype, low_memory=False)
-    except UnicodeDecodeError:
-        return pd.read_csv(path, encoding="utf-8-sig", dtype=dtype, low_memory=False)
+REQUIRED = ["date", "code", "total_score"]
 
 
 def _ensure_cols(df: pd.DataFrame, cols: list[str]) -> None:
@@ -54,24 +47,39 @@ def build_ranking(
     top: int = 200,
     date: str = "",
 ) -> pd.DataFrame:
-    df = _read_csv(in_csv)
-    _ensure_cols(df, REQUIRED)
-
-    # normalize
-    df["date"] = df["date"].astype(str)
-    df["code"] = df["code"].astype(str).str.strip()
-    df["total_score"] = _to_float_series(df["total_score"])
+    if not os.path.exists(in_csv):
+        raise FileNotFoundError(f"Missing: {in_csv}")
 
     if date:
         d = str(date)
     else:
-        # pick latest available date
-        # (string sort works with YYYY-MM-DD)
-        d = df["date"].dropna().astype(str).max()
+        # pick latest available date (from the store manifest, no row reads)
+        d = latest_universe_date(in_csv) or ""
+
+    # only the target date's month partition is read
+    with stage("load_universe") as st:
+        df = load_universe(d, d, csv_path=in_csv, float32_scores=False)
+        st.rows_out = len(df)
+    with stage("rank_date", rows_in=len(df)) as st:
+        out = rank_date(df, d, top)
+        st.rows_out = None if out is None else len(out)
+    if out is None:
+        raise ValueError(f"No rows for date={d} in {in_csv}")
+    return out
+
+
+def rank_date(df: pd.DataFrame, d: str, top: int = 200) -> Optional[pd.DataFrame]:
+    """TopN rows of date d from a universe frame (df is not modified); None when d has no rows."""
+    _ensure_cols(df, REQUIRED)
 
-    day = df[df["date"].astype(str) == d].copy()
+    day = df[df["date"].astype(str) == str(d)].copy()
     if len(day) == 0:
-        raise ValueError(f"No rows for date={d} in {in_csv}")
+        return None
+
+    # normalize
+    day["date"] = day["date"].astype(str)
+    day["code"] = day["code"].astype(str).str.strip()
+    day["total_score"] = _to_float_series(day["total_score"])
 
     # sort by total_score desc, then code asc for stability
     day = day.dropna(subset=["total_score"])
@@ -91,17 +99,20 @@ def main(argv: Optional[list[str]] = None) -> int:
     ap.add_argument("--date", default="", help="Target date YYYY-MM-DD (default: latest in in_csv)")
     args = ap.parse_args(argv)
 
-    out_df = build_ranking(args.in_csv, top=args.top, date=args.date)
+    with traced_run("ranking_engine"):
+        out_df = build_ranking(args.in_csv, top=args.top, date=args.date)
 
-    # default output path
-    out_date = out_df["date"].astype(str).iloc[0]
-    out_csv = args.out_csv.strip() or os.path.join("data", f"ranking_{out_date}.csv")
+        # default output path
+        out_date = out_df["date"].astype(str).iloc[0]
+        out_csv = args.out_csv.strip() or os.path.join("data", f"ranking_{out_date}.csv")
 
-    os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+        os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
 
-    # Write UTF-8 (no BOM) by default; PowerShell side already uses Write-Utf8NoBom usually,
-    # but here keep python side standard.
-    out_df.to_csv(out_csv, index=False, encoding="utf-8")
+        # Write UTF-8 (no BOM) by default; PowerShell side already uses Write-Utf8NoBom usually,
+        # but here keep python side standard.
+        with stage("write_ranking", rows_in=len(out_df)) as st:
+            out_df.to_csv(out_csv, index=False, encoding="utf-8")
+            st.wrote(out_csv)
 
     print(f"OK: wrote -> {os.path.abspath(out_csv)} (rows={len(out_df)})")
     return 0
@@ -1,14 +1,13 @@
 ﻿from __future__ import annotations
 
 import argparse
-import subprocess
+import os
 import sys
 from pathlib import Path
 
-
-def run(cmd: list[str]) -> None:
-    print("==> " + " ".join(cmd))
-    subprocess.check_call(cmd)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pipeline_dag import Pipeline, Step, script_step
+from src.utils.instrument import traced_run
 
 
 def main() -> int:
@@ -30,11 +29,12 @@ def main() -> int:
     ap.add_argument("--trailing_stop", type=float, default=0.0)
     ap.add_argument("--trailing_mode", choices=["close", "low"], default="close")  # NEW
     ap.add_argument("--take_profit", type=float, default=0.0)
+    ap.add_argument("--force", action="store_true", help="run every phase even if its inputs are unchanged")
 
     args = ap.parse_args()
 
     root = Path(".")
-    scripts = root / "scripts"
+    scripts = Path(os.path.dirname(os.path.abspath(__file__)))
     data = root / "data"
     reports = root / "reports"
     reports.mkdir(parents=True, exist_ok=True)
@@ -50,21 +50,14 @@ def main() -> int:
     p6_equity = data / f"phase6_equity_{args.symbol}.csv"
     p7_out = reports / f"report_{args.symbol}.md"
 
-    py = str(Path(sys.executable))
-
-    # Phase 5
-    run([
-        py, str(scripts / "phase5_signals_rsi.py"),
+    p5_args = [
         "--in", str(inp),
         "--out", str(p5_out),
         "--rsi_period", str(args.rsi_period),
         "--buy_rsi", str(args.buy_rsi),
         "--sell_rsi", str(args.sell_rsi),
-    ])
-
-    # Phase 6
-    run([
-        py, str(scripts / "phase6_backtest_singlepos.py"),
+    ]
+    p6_args = [
         "--in", str(p5_out),
         "--out_trades", str(p6_trades),
         "--out_equity", str(p6_equity),
@@ -76,15 +69,37 @@ def main() -> int:
         "--trailing_stop", str(args.trailing_stop),
         "--trailing_mode", str(args.trailing_mode),   # NEW passthrough
         "--take_profit", str(args.take_profit),
-    ])
-
-    # Phase 7
-    run([
-        py, str(scripts / "phase7_report.py"),
+    ]
+    p7_args = [
         "--equity", str(p6_equity),
         "--trades", str(p6_trades),
         "--out", str(p7_out),
-    ])
+    ]
+
+    # Phase 5 -> 6 -> 7, in-process; a phase is skipped when its inputs/args/code did not change
+    p5 = str(scripts / "phase5_signals_rsi.py")
+    p6 = str(scripts / "phase6_backtest_singlepos.py")
+    p7 = str(scripts / "phase7_report.py")
+    steps = [
+        Step("phase5", script_step(p5, p5_args),
+             inputs=[str(inp)], outputs=[str(p5_out)], params={"argv": p5_args}, code=[p5]),
+        Step("phase6", script_step(p6, p6_args),
+             inputs=[str(p5_out)], outputs=[str(p6_trades), str(p6_equity)], deps=["phase5"], params={"argv": p6_args},
+             code=[p6]),
+        Step("phase7", script_step(p7, p7_args),
+             inputs=[str(p6_equity), str(p6_trades)], outputs=[str(p7_out)], deps=["phase6"], params={"argv": p7_args},
+             code=[p7]),
+    ]
+    with traced_run("run_pipeline"):
+        run = Pipeline(
+            f"phase567_{args.symbol}",
+            steps,
+            manifest_path=str(reports / f"pipeline_phase567_{args.symbol}_manifest.json"),
+            force=args.force,
+        ).run()
+    if not run["ok"]:
+        print("ERROR: pipeline failed: " + ", ".join(k for k, v in run["steps"].items() if v["status"] not in ("ran", "skipped")))
+        return 1
 
     print(f"OK pipeline done. Report: {p7_out}")
     return 0
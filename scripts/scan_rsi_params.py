@@ -1,51 +1,199 @@
 ﻿from __future__ import annotations
 
+import argparse
 import itertools
-import subprocess
+import multiprocessing as mp
+import os
 import sys
+import time
 from pathlib import Path
+from typing import Optional
 
 import pandas as pd
 
+# phase5/6/7 live next to this file; import their logic instead of shelling out
+SCRIPTS = Path(__file__).resolve().parent
+if str(SCRIPTS) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS))
+
+import phase5_signals_rsi as phase5  # noqa: E402
+import phase6_backtest_singlepos as phase6  # noqa: E402
+import phase7_report as phase7  # noqa: E402
+
+# Combo = (rsi_period, buy_rsi, sell_rsi, cooldown_bars, trend_mode)
+Combo = tuple[int, int, int, int, str]
+
+
+def evaluate_combo(
+    base: pd.DataFrame,
+    signals: dict,
+    j: int,
+    cooldown: int,
+    initial_cash: float = 1_000_000.0,
+    report_path: Optional[Path] = None,
+) -> dict:
+    """
+    Phase6 single-position backtest -> Phase7 metrics for signal setting j of
+    phase5.signal_arrays, all in memory.
+    """
+    df = base.copy()
+    df["gate_trend_ok"] = signals["gate_trend_ok"][:, j]
+    df["trend_break"] = signals["trend_break"]
+    df["buy_signal"] = signals["buy_signal"][:, j]
+    df["sell_signal"] = signals["sell_signal"][:, j]
+
+    res = phase6.backtest_singlepos(
+        df,
+        initial_cash=initial_cash,
+        cooldown_bars=int(cooldown),
+        slippage_bps=0.0,
+        stop_loss=0.0,
+        take_profit=0.0,
+    )
 
-def run(cmd: list[str]) -> None:
-    subprocess.check_call(cmd)
-
-
-def parse_report(md_path: Path) -> dict:
-    txt = md_path.read_text(encoding="utf-8", errors="ignore").splitlines()
-    out = {"total_return": None, "max_drawdown": None, "sharpe": None, "trade_count": None, "win_rate": None}
-    for line in txt:
-        line = line.strip()
-        if line.startswith("- Total Return:"):
-            out["total_return"] = float(line.split(":")[1].replace("%", "").strip())
-        elif line.startswith("- Max Drawdown:"):
-            out["max_drawdown"] = float(line.split(":")[1].replace("%", "").strip())
-        elif line.startswith("- Sharpe"):
-            out["sharpe"] = float(line.split(":")[1].strip())
-        elif line.startswith("- Trade Count:"):
-            out["trade_count"] = int(line.split(":")[1].strip())
-        elif line.startswith("- Win Rate:"):
-            out["win_rate"] = float(line.split(":")[1].replace("%", "").strip())
-    return out
+    eq = res.equity
+    tr = pd.DataFrame(res.trades)
+    m = phase7.compute_metrics(eq, tr)
+
+    if report_path is not None:
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report_path.write_text(phase7.render_report(eq, tr, m), encoding="utf-8")
+
+    # same precision the Markdown report (and so the old subprocess scan) used
+    return {
+        "trade_count": int(m["trade_count"]),
+        "win_rate_pct": round(m["win_rate"] * 100.0, 2),
+        "total_return_pct": round(m["total_return"] * 100.0, 2),
+        "max_drawdown_pct": round(m["max_drawdown"] * 100.0, 2),
+        "sharpe": round(m["sharpe"], 2),
+    }
+
+
+# ---------------------------
+# Worker pool
+# ---------------------------
+
+# Set once per worker process by _init_worker (inherited under fork, pickled
+# once per worker under spawn) so prices and signals are not re-sent per combo.
+_WORKER_STATE: Optional[tuple[pd.DataFrame, dict, Optional[Path], str]] = None
+
+
+def _init_worker(base: pd.DataFrame, signals: dict, report_dir: Optional[Path], symbol: str) -> None:
+    global _WORKER_STATE
+    _WORKER_STATE = (base, signals, report_dir, symbol)
+
+
+def _report_path(report_dir: Optional[Path], symbol: str, combo: Combo) -> Optional[Path]:
+    if report_dir is None:
+        return None
+    period, buy, sell, cooldown, trend_mode = combo
+    return report_dir / f"report_{symbol}_p{period}_b{buy}_s{sell}_c{cooldown}_t{trend_mode}.md"
+
+
+def _run_combo(task: tuple[int, int, Combo]) -> tuple[int, dict]:
+    idx, j, combo = task
+    base, signals, report_dir, symbol = _WORKER_STATE
+    return idx, evaluate_combo(base, signals, j, combo[3], report_path=_report_path(report_dir, symbol, combo))
+
+
+def _mp_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork" if "fork" in methods else None)
+
+
+def scan(
+    prices: pd.DataFrame,
+    combos: list[Combo],
+    sma_fast: int = 50,
+    sma_slow: int = 200,
+    workers: int = 1,
+    report_dir: Optional[Path] = None,
+    symbol: str = "2330",
+) -> list[dict]:
+    """
+    Evaluate every combo on one price frame; rows come back in `combos` order.
+
+    Signals for every distinct (period, buy, sell, trend) setting come from one
+    phase5.signal_arrays pass (each RSI period computed once); combos that only
+    differ in cooldown share a setting.
+    """
+    if not combos:
+        return []
+    settings: list[phase5.Setting] = []
+    setting_of: dict[tuple, int] = {}
+    for period, buy, sell, _cooldown, trend_mode in combos:
+        key = (int(period), float(buy), float(sell), str(trend_mode))
+        if key not in setting_of:
+            setting_of[key] = len(settings)
+            settings.append(key)
+    signals = phase5.signal_arrays(prices, settings, sma_fast, sma_slow)
+    setting_idx = [setting_of[(int(c[0]), float(c[1]), float(c[2]), str(c[4]))] for c in combos]
+
+    base = prices.copy()
+    base["close"] = pd.to_numeric(base["close"], errors="coerce")
+
+    workers = max(1, min(int(workers), len(combos)))
+    if workers == 1:
+        metrics = [
+            evaluate_combo(base, signals, j, c[3], report_path=_report_path(report_dir, symbol, c))
+            for j, c in zip(setting_idx, combos)
+        ]
+    else:
+        slots: list[Optional[dict]] = [None] * len(combos)
+        tasks = [(i, j, c) for i, (j, c) in enumerate(zip(setting_idx, combos))]
+        chunksize = max(1, len(tasks) // (workers * 8))
+        with _mp_context().Pool(
+            processes=workers,
+            initializer=_init_worker,
+            initargs=(base, signals, report_dir, symbol),
+        ) as pool:
+            for idx, m in pool.imap_unordered(_run_combo, tasks, chunksize=chunksize):
+                slots[idx] = m
+        metrics = [m for m in slots if m is not None]
+
+    rows = []
+    for (period, buy, sell, cooldown, trend_mode), m in zip(combos, metrics):
+        report = _report_path(report_dir, symbol, (period, buy, sell, cooldown, trend_mode))
+        rows.append({
+            "rsi_period": period,
+            "buy_rsi": buy,
+            "sell_rsi": sell,
+            "cooldown_bars": cooldown,
+            "trend_mode": trend_mode,
+            "sma_fast": sma_fast,
+            "sma_slow": sma_slow,
+            "trade_count": m["trade_count"],
+            "win_rate_pct": m["win_rate_pct"],
+            "total_return_pct": m["total_return_pct"],
+            "max_drawdown_pct": m["max_drawdown_pct"],
+            "sharpe": m["sharpe"],
+            "report": str(report).replace("\\", "/") if report is not None else "",
+        })
+    return rows
 
 
 def main() -> int:
     # Strategy intent:
     # - RSI is timing, trend gate defines regime
     # - Aim for enough trades to evaluate (>= 10)
-
-    symbol = "2330"
-    inp = Path("data/2330.csv")
+    ap = argparse.ArgumentParser(description="In-process RSI parameter scan (Phase5 -> Phase6 -> Phase7)")
+    ap.add_argument("--in", dest="inp", default="data/2330.csv")
+    ap.add_argument("--symbol", default="2330")
+    ap.add_argument("--workers", type=int, default=1, help="process pool size (0 = all CPUs)")
+    ap.add_argument("--reports", action="store_true", help="also write one Markdown report per combo to reports/scan_tmp")
+    args = ap.parse_args()
+
+    symbol = args.symbol
+    inp = Path(args.inp)
     if not inp.exists():
-        raise SystemExit("Missing data/2330.csv")
+        raise SystemExit(f"Missing {inp}")
 
     # More sensible grid for trend-gated RSI on 2330:
     rsi_periods = [14, 20]
     buy_levels = [35, 40, 45, 50]
     sell_levels = [55, 60, 65]
     cooldowns = [0, 2, 3, 5]
-    trend_modes = ["both", "sma_cross", "close_above_slow"]  # exclude none by default
+    trend_modes = ["both", "fast", "slow"]  # phase5 --trend choices
 
     # SMA choices (keep stable)
     sma_fast = 50
@@ -53,73 +201,23 @@ def main() -> int:
 
     trade_threshold = 10
 
-    py = sys.executable
-    results = []
-
-    out_dir = Path("reports/scan_tmp")
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    phase5_out = Path(f"data/phase5_signals_{symbol}.csv")
-    phase6_trades = Path(f"data/phase6_trades_{symbol}.csv")
-    phase6_equity = Path(f"data/phase6_equity_{symbol}.csv")
-
-    combos = list(itertools.product(rsi_periods, buy_levels, sell_levels, cooldowns, trend_modes))
-    total = 0
-
-    for period, buy, sell, cooldown, trend_mode in combos:
-        if buy >= sell:
-            continue
-
-        total += 1
-        report_out = out_dir / f"report_{symbol}_p{period}_b{buy}_s{sell}_c{cooldown}_t{trend_mode}.md"
-
-        run([
-            py, "scripts/phase5_signals_rsi.py",
-            "--in", str(inp),
-            "--out", str(phase5_out),
-            "--rsi_period", str(period),
-            "--buy_rsi", str(float(buy)),
-            "--sell_rsi", str(float(sell)),
-            "--sma_fast", str(sma_fast),
-            "--sma_slow", str(sma_slow),
-            "--trend_mode", trend_mode,
-        ])
-
-        run([
-            py, "scripts/phase6_backtest_singlepos.py",
-            "--in", str(phase5_out),
-            "--out_trades", str(phase6_trades),
-            "--out_equity", str(phase6_equity),
-            "--initial_cash", "1000000",
-            "--cooldown_bars", str(cooldown),
-            "--slippage_bps", "0",
-            "--stop_loss", "0",
-            "--take_profit", "0",
-        ])
-
-        run([
-            py, "scripts/phase7_report.py",
-            "--equity", str(phase6_equity),
-            "--trades", str(phase6_trades),
-            "--out", str(report_out),
-        ])
-
-        m = parse_report(report_out)
-        results.append({
-            "rsi_period": period,
-            "buy_rsi": buy,
-            "sell_rsi": sell,
-            "cooldown_bars": cooldown,
-            "trend_mode": trend_mode,
-            "sma_fast": sma_fast,
-            "sma_slow": sma_slow,
-            "trade_count": m["trade_count"],
-            "win_rate_pct": m["win_rate"],
-            "total_return_pct": m["total_return"],
-            "max_drawdown_pct": m["max_drawdown"],
-            "sharpe": m["sharpe"],
-            "report": str(report_out).replace("\\", "/"),
-        })
+    prices = pd.read_csv(inp)
+    need_cols = {"date", "open", "high", "low", "close"}
+    if not need_cols.issubset(set(prices.columns)):
+        raise SystemExit(f"Missing OHLC columns. Need={sorted(need_cols)} got={prices.columns.tolist()}")
+
+    combos = [
+        (period, buy, sell, cooldown, trend_mode)
+        for period, buy, sell, cooldown, trend_mode in itertools.product(rsi_periods, buy_levels, sell_levels, cooldowns, trend_modes)
+        if buy < sell
+    ]
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    report_dir = Path("reports/scan_tmp") if args.reports else None
+
+    t0 = time.perf_counter()
+    results = scan(prices, combos, sma_fast, sma_slow, workers=workers, report_dir=report_dir, symbol=symbol)
+    print(f"scanned combos={len(results)} workers={workers} seconds={time.perf_counter() - t0:.2f}")
 
     df = pd.DataFrame(results)
 
@@ -128,6 +226,7 @@ def main() -> int:
 
     # If nothing passes threshold, still export full df but flag
     out_full = Path("reports/rsi_scan_full.csv")
+    out_full.parent.mkdir(parents=True, exist_ok=True)
     df.to_csv(out_full, index=False, encoding="utf-8")
 
     out_rank = Path("reports/rsi_scan_rank.csv")
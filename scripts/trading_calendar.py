@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+trading_calendar.py
+
+Shared trading-day calendar for the daily scripts (v3 backtester, ranking
+history builder), plus the tail readers (last_csv_date / offset_after_date)
+behind the incremental breadth history and market pack reads.
+
+Dates are YYYY-MM-DD strings (string order == chronological order), kept
+sorted and de-duplicated once; every lookup is a bisect (O(log n)) instead
+of re-sorting and scanning the date list per call. A time part after the date
+("2024-01-02 00:00:00", "2024-01-02T13:30") is dropped. Input data that is
+not YYYY-MM-DD (a "2026/02/12" row, a trailing "TOTAL" line) is skipped when
+building a calendar or reading CSV dates; a lookup with such a date raises
+ValueError instead of silently never matching.
+
+Default sources for from_csv (missing files are skipped):
+- data/all_stocks_daily.csv
+- data/ranking_history.csv
+- data/market_snapshot_taiex.csv
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}(?:[ T].*)?$")
+_MISSING = ("", "nan", "NaN", "NaT", "None")
+
+DEFAULT_SOURCES = (
+    os.path.join("data", "all_stocks_daily.csv"),
+    os.path.join("data", "ranking_history.csv"),
+    os.path.join("data", "market_snapshot_taiex.csv"),
+)
+
+
+def _date_key(d) -> str:
+    """YYYY-MM-DD of d (date, datetime/Timestamp or ISO string, time part dropped)."""
+    s = str(d).strip()
+    if not _DATE_RE.match(s):
+        raise ValueError(f"not a YYYY-MM-DD date: {d!r}")
+    return s[:10]
+
+
+def _try_key(d) -> Optional[str]:
+    """_date_key(d), or None for missing (None / empty / NaN) and malformed dates."""
+    if d is None or str(d).strip() in _MISSING:
+        return None
+    try:
+        return _date_key(d)
+    except ValueError:
+        return None
+
+
+class TradingCalendar:
+    """Sorted, unique trading dates with O(log n) neighbour lookups."""
+
+    def __init__(self, dates: Iterable = ()):
+        """dates: any iterable of dates; None / empty / NaN / malformed entries are skipped."""
+        keys = {_try_key(d) for d in dates}
+        keys.discard(None)
+        self.dates: List[str] = sorted(keys)
+        self._index: Dict[str, int] = {d: i for i, d in enumerate(self.dates)}
+
+    @classmethod
+    def from_csv(cls, paths: Sequence[str] = DEFAULT_SOURCES, date_col: str = "date") -> "TradingCalendar":
+        """Union of the date column of every existing CSV in paths."""
+        dates: set = set()
+        for p in paths:
+            dates.update(read_csv_dates(p, date_col))
+        return cls(dates)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.dates)
+
+    def __contains__(self, d) -> bool:
+        return _date_key(d) in self._index
+
+    def index_on_or_before(self, d) -> int:
+        """Position of the last trading date <= d, or -1."""
+        key = _date_key(d)
+        i = self._index.get(key)
+        if i is not None:
+            return i
+        return bisect_right(self.dates, key) - 1
+
+    def prev_on_or_before(self, d) -> Optional[str]:
+        """Nearest trading date <= d, or None when d precedes the calendar."""
+        i = self.index_on_or_before(d)
+        return self.dates[i] if i >= 0 else None
+
+    def next_after(self, d) -> Optional[str]:
+        """First trading date > d, or None when d is on/after the last date."""
+        i = bisect_right(self.dates, _date_key(d))
+        return self.dates[i] if i < len(self.dates) else None
+
+    def offset(self, d, k: int) -> Optional[str]:
+        """
+        Trading date k steps from prev_on_or_before(d) (k < 0 = earlier).
+
+        offset(d, 0) == prev_on_or_before(d); offset(d, 1) == next_after(d).
+        None when the step falls outside the calendar.
+        """
+        j = self.index_on_or_before(d) + int(k)
+        if j < 0 or j >= len(self.dates):
+            return None
+        return self.dates[j]
+
+    def between(self, start=None, end=None) -> List[str]:
+        """Trading dates with start <= d <= end (either bound optional)."""
+        lo = bisect_left(self.dates, _date_key(start)) if start else 0
+        hi = bisect_right(self.dates, _date_key(end)) if end else len(self.dates)
+        return self.dates[lo:hi]
+
+
+def read_csv_dates(path: str, date_col: str = "date") -> set:
+    """Distinct dates of one CSV's date column (malformed ones skipped); empty set when the file/column is missing."""
+    if not os.path.exists(path):
+        return set()
+    out: set = set()
+    # utf-8-sig: several data/*.csv files are written with a BOM
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return out
+        cols = [h.strip().lower() for h in header]
+        if date_col not in cols:
+            return out
+        k = cols.index(date_col)
+        for row in reader:
+            key = _try_key(row[k]) if len(row) > k else None
+            if key is not None:
+                out.add(key)
+    return out
+
+
+def last_csv_date(path: str, date_col: str = "date", block: int = 65536) -> Optional[str]:
+    """
+    Date of the last row of a date-ordered CSV (i.e. its latest date), read by
+    seeking back from the end instead of parsing the whole file.
+    None when the file/column is missing, has no data rows, or the last row's
+    date is not YYYY-MM-DD (e.g. a trailing "TOTAL" line; callers fall back to
+    a full read).
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader([f.readline()]), None)
+    if not header:
+        return None
+    cols = [h.strip().lower() for h in header]
+    if date_col not in cols:
+        return None
+    k = cols.index(date_col)
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        tail = b""
+        pos = end
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            lines = [ln for ln in tail.splitlines() if ln.strip()]
+            # need one complete line that is not the header
+            if len(lines) >= 2 or (pos == 0 and lines):
+                break
+    lines = [ln for ln in tail.splitlines() if ln.strip()]
+    if pos == 0:
+        lines = lines[1:]
+    if not lines:
+        return None
+    row = next(csv.reader([lines[-1].decode("utf-8-sig")]), [])
+    if len(row) <= k:
+        return None
+    return _try_key(row[k])
+
+
+def offset_after_date(path: str, after: str, date_col: str = "date", block: int = 1 << 20) -> Optional[int]:
+    """
+    Byte offset of the first data row dated > after in a date-ordered CSV,
+    found by scanning back from the end (cost ~ size of the new rows).
+    Returns the file size when nothing is newer; None when the file/column is
+    missing or a scanned row's date is not YYYY-MM-DD (caller falls back to a
+    full read).
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        header_line = f.readline()
+        data_start = f.tell()
+        cols = [h.strip().lower() for h in next(csv.reader([header_line.decode("utf-8-sig")]), [])]
+        if date_col not in cols:
+            return None
+        k = cols.index(date_col)
+        key = _date_key(after)
+
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        carry = b""  # partial first line of the block read after this one
+        while pos > data_start:
+            step = min(block, pos - data_start)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + carry
+            lines = buf.split(b"\n")
+            # lines[0] may start mid-row unless we are at the first data row
+            carry = lines[0] if pos > data_start else b""
+            body = lines[1:] if pos > data_start else lines
+            start = pos + (len(lines[0]) + 1 if pos > data_start else 0)
+            ends = []
+            off = start
+            for ln in body:
+                ends.append(off)
+                off += len(ln) + 1
+            for ln, line_off in zip(reversed(body), reversed(ends)):
+                if not ln.strip():
+                    continue
+                row = next(csv.reader([ln.decode("utf-8", errors="replace")]), [])
+                if len(row) <= k:
+                    continue
+                try:
+                    row_key = _date_key(row[k])
+                except ValueError:
+                    return None
+                if row_key <= key:
+                    return min(line_off + len(ln) + 1, os.path.getsize(path))
+        return data_start
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+universe_store.py
+
+Columnar, month-partitioned copy of data/all_stocks_daily.csv (the CSV stays
+the interchange format; the store is a cache rebuilt from it on demand).
+
+Layout: <csv dir>/store/<csv stem>/
+- YYYY-MM.parquet (pyarrow installed) or YYYY-MM.npz (numpy only)
+- _manifest.json: source size/mtime/tail hash, column order, per-month rows
+
+Typed columns:
+- date: str (YYYY-MM-DD; rows without one are dropped), code: categorical,
+  name/sector/source: str
+- scores (total_score, liquidity, volatility, momentum): numeric; float
+  columns are stored as float32 when that is lossless for the partition
+- everything else: whatever pd.read_csv infers (strings dictionary-encoded
+  in .npz partitions)
+
+load_universe(start, end, columns=...) reads only the months overlapping
+[start, end] and only the requested columns (npz/parquet both load columns
+independently). An appended CSV only rewrites the months its new rows touch;
+any other change rebuilds the store.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+DEFAULT_CSV = os.path.join("data", "all_stocks_daily.csv")
+SCORE_COLS = ("total_score", "liquidity", "volatility", "momentum")
+CSV_DTYPE = {"date": str, "code": str, "name": str, "sector": str, "source": str}
+MANIFEST = "_manifest.json"
+STORE_VERSION = 1
+_TAIL_BYTES = 4096
+_CATS = "::cats"
+
+
+def store_dir_for(csv_path: str) -> str:
+    csv_path = os.path.abspath(csv_path)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(csv_path), "store", stem)
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# ---------------------------
+# typing
+# ---------------------------
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    if "date" in df.columns:
+        # rows without a date cannot be partitioned (nor matched by any script)
+        df = df[df["date"].notna()].copy()
+        df["date"] = df["date"].astype(str).str.strip()
+    if "code" in df.columns:
+        df["code"] = df["code"].astype(str).str.strip()
+    for c in SCORE_COLS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df
+
+
+def _compact_scores(df: pd.DataFrame) -> pd.DataFrame:
+    # float32 only when every value survives the round trip, so writers that
+    # print scores back out stay byte-identical after upcasting
+    for c in SCORE_COLS:
+        if c in df.columns and df[c].dtype == np.float64:
+            v = df[c].to_numpy()
+            v32 = v.astype(np.float32)
+            if np.array_equal(v32.astype(np.float64), v, equal_nan=True):
+                df[c] = v32
+    return df
+
+
+def _read_source(data: "str | bytes", names: Optional[List[str]] = None) -> pd.DataFrame:
+    if isinstance(data, bytes):
+        src = io.BytesIO(data)
+        return _typed(pd.read_csv(src, header=None, names=names, dtype=CSV_DTYPE, low_memory=False, encoding="utf-8"))
+    return _typed(pd.read_csv(data, dtype=CSV_DTYPE, low_memory=False, encoding="utf-8-sig"))
+
+
+# ---------------------------
+# partitions
+# ---------------------------
+
+def _part_path(store: str, month: str, fmt: str) -> str:
+    return os.path.join(store, f"{month}.{fmt}")
+
+
+def _write_part(path: str, df: pd.DataFrame, fmt: str) -> None:
+    df = _compact_scores(df.reset_index(drop=True).copy())
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        if "code" in df.columns:
+            df["code"] = df["code"].astype("category")
+        df.to_parquet(tmp, index=False)
+    else:
+        arrays: Dict[str, np.ndarray] = {}
+        for c in df.columns:
+            s = df[c]
+            if pd.api.types.is_numeric_dtype(s.dtype) or pd.api.types.is_bool_dtype(s.dtype):
+                arrays[c] = s.to_numpy()
+            else:
+                # dictionary-encoded: int32 codes (-1 = NaN) + sorted distinct values
+                codes, uniques = pd.factorize(s, sort=True)
+                arrays[c] = codes.astype(np.int32)
+                arrays[c + _CATS] = np.asarray([str(u) for u in uniques], dtype=str)
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def _read_part(path: str, fmt: str, columns: List[str]) -> pd.DataFrame:
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    out: Dict[str, object] = {}
+    with np.load(path, allow_pickle=False) as z:
+        for c in columns:
+            a = z[c]
+            if c + _CATS not in z.files:
+                out[c] = a
+                continue
+            cats = z[c + _CATS]
+            if c == "code":
+                out[c] = pd.Categorical.from_codes(a, cats.tolist())
+            else:
+                # code -1 picks the trailing NaN
+                lut = np.array(cats.tolist() + [np.nan], dtype=object)
+                out[c] = pd.Series(lut[a])
+    return pd.DataFrame(out, columns=columns)
+
+
+# ---------------------------
+# sync
+# ---------------------------
+
+def _source_stat(csv_path: str) -> dict:
+    st = os.stat(csv_path)
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+
+def _tail_hash(csv_path: str, size: int) -> str:
+    with open(csv_path, "rb") as f:
+        f.seek(max(0, size - _TAIL_BYTES))
+        return hashlib.sha1(f.read(min(size, _TAIL_BYTES))).hexdigest()
+
+
+def _load_manifest(store: str) -> Optional[dict]:
+    p = os.path.join(store, MANIFEST)
+    if not os.path.exists(p):
+        return None
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return m if m.get("version") == STORE_VERSION else None
+
+
+def _save_manifest(store: str, m: dict) -> None:
+    p = os.path.join(store, MANIFEST)
+    with open(p + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(m, f, ensure_ascii=False, indent=2)
+    os.replace(p + ".tmp", p)
+
+
+def _part_info(df: pd.DataFrame) -> dict:
+    return {"rows": int(len(df)), "min_date": str(df["date"].min()), "max_date": str(df["date"].max())}
+
+
+def _write_months(store: str, df: pd.DataFrame, fmt: str, m: dict, append: bool) -> None:
+    months = df["date"].str[:7]
+    for month, g in df.groupby(months, sort=True):
+        path = _part_path(store, month, fmt)
+        if append and month in m["partitions"]:
+            g = pd.concat([_read_part(path, fmt, m["columns"]), g], ignore_index=True)
+        _write_part(path, g, fmt)
+        m["partitions"][month] = _part_info(g)
+
+
+def _rebuild(csv_path: str, store: str, fmt: str, stat: dict) -> dict:
+    if os.path.isdir(store):
+        shutil.rmtree(store)
+    os.makedirs(store, exist_ok=True)
+    df = _read_source(csv_path)
+    if "date" not in df.columns:
+        raise ValueError(f"{csv_path} has no date column")
+    m = {
+        "version": STORE_VERSION,
+        "source": os.path.basename(csv_path),
+        "format": fmt,
+        "columns": list(df.columns),
+        "partitions": {},
+        **stat,
+        "tail_sha1": _tail_hash(csv_path, stat["size"]),
+    }
+    _write_months(store, df, fmt, m, append=False)
+    _save_manifest(store, m)
+    return m
+
+
+def sync_store(csv_path: str = DEFAULT_CSV, store_dir: Optional[str] = None, fmt: Optional[str] = None) -> dict:
+    """Bring the store up to date with csv_path; returns its manifest."""
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Missing: {csv_path}")
+    store = store_dir or store_dir_for(csv_path)
+    fmt = fmt or ("parquet" if _parquet_available() else "npz")
+    stat = _source_stat(csv_path)
+
+    m = _load_manifest(store)
+    if m is None or m.get("format") != fmt:
+        return _rebuild(csv_path, store, fmt, stat)
+    if m["size"] == stat["size"] and m["mtime_ns"] == stat["mtime_ns"]:
+        return m
+
+    old = int(m["size"])
+    appended = stat["size"] > old and _tail_hash(csv_path, old) == m.get("tail_sha1")
+    if appended:
+        with open(csv_path, "rb") as f:
+            f.seek(old - 1)
+            new = f.read()
+        appended = new[:1] == b"\n"
+    if not appended:
+        return _rebuild(csv_path, store, fmt, stat)
+
+    if new[1:].strip():
+        df = _read_source(new[1:], names=m["columns"])
+        _write_months(store, df, fmt, m, append=True)
+    m.update(stat)
+    m["tail_sha1"] = _tail_hash(csv_path, stat["size"])
+    _save_manifest(store, m)
+    return m
+
+
+# ---------------------------
+# read API
+# ---------------------------
+
+def _finish(df: pd.DataFrame, float32_scores: bool) -> pd.DataFrame:
+    if "code" in df.columns and not isinstance(df["code"].dtype, pd.CategoricalDtype):
+        df["code"] = df["code"].astype(str).astype("category")
+    if not float32_scores:
+        for c in SCORE_COLS:
+            if c in df.columns and df[c].dtype == np.float32:
+                df[c] = df[c].astype(np.float64)
+    return df
+
+
+def load_universe(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    csv_path: str = DEFAULT_CSV,
+    store_dir: Optional[str] = None,
+    float32_scores: bool = True,
+) -> pd.DataFrame:
+    """
+    Rows with start <= date <= end (bounds optional), only `columns` (default:
+    all; names the file does not have are skipped, so callers keep their own
+    missing-column checks).
+
+    float32_scores=False upcasts float32 score columns to float64 (exact) for
+    callers that write scores back out.
+    Falls back to a typed read of the CSV when the store cannot be written.
+    """
+    try:
+        m = sync_store(csv_path, store_dir)
+    except OSError:
+        df = _read_source(csv_path)
+        if start:
+            df = df[df["date"] >= str(start)]
+        if end:
+            df = df[df["date"] <= str(end)]
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        return _finish(df.reset_index(drop=True), float32_scores)
+
+    store = store_dir or store_dir_for(csv_path)
+    want = list(m["columns"]) if columns is None else [c for c in columns if c in m["columns"]]
+    read_cols = want if "date" in want else ["date"] + want
+
+    lo = str(start)[:7] if start else None
+    hi = str(end)[:7] if end else None
+    frames = []
+    for month in sorted(m["partitions"]):
+        if (lo and month < lo) or (hi and month > hi):
+            continue
+        part = _read_part(_part_path(store, month, m["format"]), m["format"], read_cols)
+        info = m["partitions"][month]
+        if start and info["min_date"] < str(start):
+            part = part[part["date"] >= str(start)]
+        if end and info["max_date"] > str(end):
+            part = part[part["date"] <= str(end)]
+        frames.append(part)
+
+    if frames:
+        codes = None
+        if "code" in read_cols and all(isinstance(f["code"].dtype, pd.CategoricalDtype) for f in frames):
+            codes = union_categoricals([f["code"] for f in frames], sort_categories=True)
+        df = pd.concat(frames, ignore_index=True)
+        if codes is not None:
+            df["code"] = codes
+    else:
+        df = pd.DataFrame(columns=read_cols)
+    return _finish(df[want], float32_scores)
+
+
+def latest_universe_date(csv_path: str = DEFAULT_CSV, store_dir: Optional[str] = None) -> Optional[str]:
+    """Latest date in the universe, from the store manifest (no row reads)."""
+    try:
+        m = sync_store(csv_path, store_dir)
+    except OSError:
+        dates = _read_source(csv_path)["date"]
+        return str(dates.max()) if len(dates) else None
+    if not m["partitions"]:
+        return None
+    return max(p["max_date"] for p in m["partitions"].values())
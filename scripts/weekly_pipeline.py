@@ -1,16 +1,17 @@
 # -*- coding: utf-8 -*-
 """
-weekly_pipeline.py (v3 HISTORY runner-safe, FIX CWD)
+weekly_pipeline.py (v3 HISTORY runner-safe, in-process DAG)
 
-Fix:
-- Subprocess cwd MUST be project root, not scripts/.
-  Otherwise child scripts that use relative paths like "data/..." will break.
+Steps run in this process through pipeline_dag (no child interpreters, all
+paths absolute under the project root); 1-3 run concurrently and share one
+universe load, 4 waits for them. A step whose inputs and params are unchanged
+since the last run is skipped; timings go to reports/pipeline_weekly_manifest.json.
 
 Pipeline:
-1) build_ranking_history.py -> data/ranking_history.csv
-2) ranking_engine.py        -> data/ranking_YYYY-MM-DD.csv (latest snapshot)
+1) build_ranking_history  -> data/ranking_history.csv
+2) ranking_engine         -> data/ranking_YYYY-MM-DD.csv (latest snapshot)
 3) ensure breadth_history.csv
-4) backtest_portfolio_v3.py (uses ranking_history if available)
+4) backtest_portfolio_v3  (uses ranking_history if available)
 """
 
 from __future__ import annotations
@@ -18,10 +19,17 @@ from __future__ import annotations
 import os
 import sys
 import argparse
-import subprocess
 from typing import Optional
 import pandas as pd
 
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS not in sys.path:
+    sys.path.insert(0, SCRIPTS)
+
+from pipeline_dag import Context, Pipeline, Step
+from universe_store import latest_universe_date, load_universe
+from src.utils.instrument import traced_run
+
 
 def _read_csv(path: str, dtype: Optional[dict] = None) -> pd.DataFrame:
     if not os.path.exists(path):
@@ -39,58 +47,118 @@ def _write_csv(df: pd.DataFrame, path: str) -> None:
 
 
 def _latest_date_from_all(all_csv: str) -> str:
-    df = _read_csv(all_csv, dtype={"date": str})
-    df["date"] = df["date"].astype(str)
-    return sorted(df["date"].dropna().unique().tolist())[-1]
-
-
-def _ensure_breadth_history(all_csv: str, out_csv: str, threshold: float) -> None:
-    if os.path.exists(out_csv):
-        return
-
-    df = _read_csv(all_csv, dtype={"date": str, "code": str, "source": str})
-    df["date"] = df["date"].astype(str)
-    df["total_score"] = pd.to_numeric(df.get("total_score", pd.Series([], dtype="float64")), errors="coerce")
-    df["change_percent"] = pd.to_numeric(df.get("change_percent", pd.Series([], dtype="float64")), errors="coerce")
-
-    rows = []
-    for d, g in df.groupby("date"):
-        n = int(len(g))
-        n_score_ge = int((g["total_score"] >= float(threshold)).sum()) if "total_score" in g.columns else 0
-        n_adv = int((g["change_percent"] > 0).sum()) if "change_percent" in g.columns else 0
-        breadth_ratio = (n_score_ge / n) if n > 0 else 0.0
-        adv_ratio = (n_adv / n) if n > 0 else 0.0
-        rows.append({
-            "date": str(d),
-            "n": n,
-            "n_score_ge": n_score_ge,
-            "n_adv": n_adv,
-            "breadth_ratio": breadth_ratio,
-            "adv_ratio": adv_ratio,
-        })
-
-    out = pd.DataFrame(rows).sort_values("date")
-    _write_csv(out, out_csv)
-
-
-def _run_py(script_path: str, args: list[str], cwd: str) -> int:
+    d = latest_universe_date(all_csv)
+    if d is None:
+        raise ValueError(f"No dates in {all_csv}")
+    return d
+
+
+def _newest_ranking_csv(data_dir: str, latest: str) -> str:
+    ranking_out = os.path.join(data_dir, f"ranking_{latest}.csv")
+    if not os.path.exists(ranking_out):
+        # find newest ranking_*.csv under data/
+        cands = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith("ranking_") and f.endswith(".csv")]
+        cands = sorted(cands, key=lambda p: os.path.getmtime(p)) if cands else []
+        if cands:
+            ranking_out = cands[-1]
+        else:
+            print("WARN: no ranking_*.csv found; backtest will fallback.")
+    return ranking_out
+
+
+def build_steps(args: argparse.Namespace, root: str, latest: str) -> list[Step]:
     """
-    Run a python script using current interpreter (sys.executable),
-    with cwd pinned to project root.
+    The weekly DAG. ranking_history / ranking_latest / breadth_history only
+    read the universe and run concurrently; backtest waits for all three.
+    The universe is loaded once (ctx "universe", on first use) and the
+    frames a step writes are handed to later steps in memory (ctx[<csv path>]).
     """
-    if not os.path.exists(script_path):
-        print(f"WARN: missing script: {script_path}")
-        return 127
+    import breadth_analyzer as ba
+    import build_ranking_history as brh
+    import ranking_engine as reng
+    import backtest_portfolio_v3 as bt
 
-    cmd = [sys.executable, script_path] + args
-    try:
-        p = subprocess.run(cmd, cwd=cwd)
-        if p.returncode != 0:
-            print(f"WARN: script failed rc={p.returncode}: {os.path.basename(script_path)}")
-        return int(p.returncode)
-    except Exception as e:
-        print(f"WARN: failed to run {script_path}: {e}")
-        return 127
+    data_dir = os.path.join(root, "data")
+    reports_dir = os.path.join(root, "reports")
+    all_csv = os.path.join(data_dir, "all_stocks_daily.csv")
+    ranking_hist_csv = os.path.join(data_dir, "ranking_history.csv")
+    ranking_csv = os.path.join(data_dir, f"ranking_{latest}.csv")
+    breadth_csv = os.path.join(data_dir, "breadth_history.csv")
+    market_csv = os.path.join(data_dir, "market_snapshot_taiex.csv")
+
+    def universe(ctx: Context) -> pd.DataFrame:
+        return ctx.get("universe", lambda: load_universe(csv_path=all_csv, float32_scores=False))
+
+    # 1) ranking_history
+    def ranking_history(ctx: Context) -> int:
+        out_df = brh.rank_history(universe(ctx), args.top, args.threshold)
+        out_df.to_csv(ranking_hist_csv, index=False, encoding="utf-8")
+        ctx.put(ranking_hist_csv, out_df)
+        brh.print_written(ranking_hist_csv, out_df)
+        return 0
+
+    # 2) latest ranking snapshot (compat/UI)
+    def ranking_latest(ctx: Context) -> int:
+        out_df = reng.rank_date(universe(ctx), latest, args.top)
+        if out_df is None:
+            raise ValueError(f"No rows for date={latest} in {all_csv}")
+        out_df.to_csv(ranking_csv, index=False, encoding="utf-8")
+        ctx.put(ranking_csv, out_df)
+        print(f"OK: wrote -> {os.path.abspath(ranking_csv)} (rows={len(out_df)})")
+        return 0
+
+    # 3) breadth_history (built only when missing)
+    def breadth_history(ctx: Context) -> int:
+        if not os.path.exists(breadth_csv):
+            out = ba.breadth_from_frame(universe(ctx), args.threshold)
+            _write_csv(out, breadth_csv)
+        bh = _read_csv(breadth_csv, dtype={"date": str})
+        print("tail:")
+        print(bh.tail(5).to_string(index=False))
+        return 0
+
+    # 4) backtest v3
+    bt_params = {
+        "breadth_field": str(args.breadth_field),
+        "breadth_min": float(args.breadth_min),
+        "threshold": float(args.threshold),
+        "holdings_on": 15,
+        "cost_bps": 25.0,
+        "init_capital": float(args.init_capital),
+    }
+
+    def backtest(ctx: Context) -> int:
+        bt_args = [
+            "--in_csv", _newest_ranking_csv(data_dir, latest),
+            "--breadth_history_csv", breadth_csv,
+            "--market_csv", market_csv,
+        ]
+        for k, v in bt_params.items():
+            bt_args += [f"--{k}", str(v)]
+        if os.path.exists(ranking_hist_csv):
+            bt_args += ["--ranking_history_csv", ranking_hist_csv]
+        frames = {p: ctx.get(p) for p in (ranking_hist_csv, ranking_csv) if ctx.has(p)}
+        res = bt.backtest_from_args(bt.parse_args(bt_args), all_df=universe(ctx), frames=frames)
+        bt.write_outputs(res, reports_dir)
+        return 0
+
+    bt_outputs = [os.path.join(reports_dir, f) for f in (
+        "portfolio_backtest_v3.csv", "portfolio_attribution_v3.csv", "portfolio_holdings_v3.csv",
+        "portfolio_plan_v3_daily.csv", "portfolio_backtest_v3_summary.json")]
+
+    # the step bodies above live in this file; each step's module (and its imports) is code too
+    this = os.path.abspath(__file__)
+    return [
+        Step("ranking_history", ranking_history, inputs=[all_csv, this], outputs=[ranking_hist_csv],
+             params={"top": args.top, "threshold": args.threshold}, code=[brh.__file__]),
+        Step("ranking_latest", ranking_latest, inputs=[all_csv, this], outputs=[ranking_csv],
+             params={"top": args.top, "date": latest}, code=[reng.__file__]),
+        Step("breadth_history", breadth_history, inputs=[all_csv], outputs=[breadth_csv], cache=False,
+             code=[ba.__file__]),
+        Step("backtest", backtest, inputs=[all_csv, ranking_hist_csv, ranking_csv, breadth_csv, market_csv, this],
+             outputs=bt_outputs, deps=["ranking_history", "ranking_latest", "breadth_history"], params=bt_params,
+             code=[bt.__file__]),
+    ]
 
 
 def main(argv: Optional[list[str]] = None) -> int:
@@ -101,13 +169,14 @@ def main(argv: Optional[list[str]] = None) -> int:
     ap.add_argument("--init_capital", type=float, default=1_000_000.0)
     ap.add_argument("--breadth_field", default="adv_ratio")
     ap.add_argument("--breadth_min", type=float, default=0.50)
+    ap.add_argument("--workers", type=int, default=4, help="steps run concurrently")
+    ap.add_argument("--force", action="store_true", help="run every step even if its inputs are unchanged")
     args = ap.parse_args(argv)
 
     # project root
     root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
     data_dir = os.path.join(root, "data")
     reports_dir = os.path.join(root, "reports")
-    scripts_dir = os.path.join(root, "scripts")
 
     os.makedirs(data_dir, exist_ok=True)
     os.makedirs(reports_dir, exist_ok=True)
@@ -118,63 +187,23 @@ def main(argv: Optional[list[str]] = None) -> int:
 
     latest = _latest_date_from_all(all_csv)
 
-    # 1) ranking_history
-    build_hist = os.path.join(scripts_dir, "build_ranking_history.py")
-    ranking_hist_csv = os.path.join(data_dir, "ranking_history.csv")
-    _run_py(build_hist, [
-        "--in_csv", all_csv,
-        "--out_csv", ranking_hist_csv,
-        "--top", str(args.top),
-        "--threshold", str(args.threshold),
-    ], cwd=root)
-
-    # 2) latest ranking snapshot (compat/UI)
-    rank_engine = os.path.join(scripts_dir, "ranking_engine.py")
-    _run_py(rank_engine, [
-        "--in_csv", all_csv,
-        "--top", str(args.top),
-    ], cwd=root)
-
-    ranking_out = os.path.join(data_dir, f"ranking_{latest}.csv")
-    if not os.path.exists(ranking_out):
-        # find newest ranking_*.csv under data/
-        cands = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith("ranking_") and f.endswith(".csv")]
-        cands = sorted(cands, key=lambda p: os.path.getmtime(p)) if cands else []
-        if cands:
-            ranking_out = cands[-1]
-        else:
-            print("WARN: no ranking_*.csv found; backtest will fallback.")
-
-    # 3) breadth_history
-    breadth_csv = os.path.join(data_dir, "breadth_history.csv")
-    _ensure_breadth_history(all_csv, breadth_csv, args.threshold)
-
-    bh = _read_csv(breadth_csv, dtype={"date": str})
-    print("tail:")
-    print(bh.tail(5).to_string(index=False))
-
-    # 4) backtest v3
-    backtest = os.path.join(scripts_dir, "backtest_portfolio_v3.py")
-    bt_args = [
-        "--in_csv", ranking_out,
-        "--breadth_history_csv", breadth_csv,
-        "--breadth_field", str(args.breadth_field),
-        "--breadth_min", str(args.breadth_min),
-        "--threshold", str(args.threshold),
-        "--holdings_on", "15",
-        "--cost_bps", "25",
-        "--init_capital", str(args.init_capital),
-    ]
-    if os.path.exists(ranking_hist_csv):
-        bt_args += ["--ranking_history_csv", ranking_hist_csv]
-
-    _run_py(backtest, bt_args, cwd=root)
+    pipe = Pipeline(
+        "weekly",
+        build_steps(args, root, latest),
+        manifest_path=os.path.join(reports_dir, "pipeline_weekly_manifest.json"),
+        workers=args.workers,
+        keep_going=True,
+        force=args.force,
+    )
+    with traced_run("weekly_pipeline"):
+        run = pipe.run()
 
     print(f"v3: {os.path.join(reports_dir, 'portfolio_backtest_v3.csv')}")
+    print(f"manifest: {pipe.manifest_path} ({run['seconds']:.2f}s)")
     print("=== PIPELINE DONE ===")
     print(f"date={latest}")
     return 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
\ No newline at end of file
+    raise SystemExit(main())
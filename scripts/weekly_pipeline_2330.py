@@ -1,18 +1,19 @@
 ﻿from __future__ import annotations
 
 import argparse
-import subprocess
+import os
+import sys
 from pathlib import Path
 
-
-def run(cmd: list[str]) -> None:
-    print(">> " + " ".join(cmd))
-    subprocess.run(cmd, check=True)
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS)
+from pipeline_dag import Pipeline, Step, script_step
+from src.utils.instrument import traced_run
 
 
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Weekly pipeline: Phase5 -> Phase6 -> Weekly report")
-    ap.add_argument("--py", default=r".\.venv\Scripts\python.exe")
+    ap.add_argument("--py", default="", help="run each phase with this interpreter as a child process (default: in-process)")
     ap.add_argument("--symbol", default="2330")
     ap.add_argument("--in_csv", default=r"data\2330.csv")
 
@@ -31,13 +32,13 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--trend_exit", default="sma_fast")
 
     ap.add_argument("--out_dir", default="reports")
+    ap.add_argument("--force", action="store_true", help="run every phase even if its inputs are unchanged")
     return ap.parse_args()
 
 
 def main() -> int:
     args = parse_args()
 
-    root = Path(".")
     py = args.py
 
     symbol = str(args.symbol)
@@ -52,10 +53,8 @@ def main() -> int:
     alloc = out_dir / f"allocation_final_{symbol}.json"
 
     # Phase5
-    run(
+    p5_args = (
         [
-            py,
-            r".\scripts\phase5_signals_rsi.py",
             "--in",
             str(inp),
             "--out",
@@ -76,10 +75,8 @@ def main() -> int:
     )
 
     # Phase6
-    run(
+    p6_args = (
         [
-            py,
-            r".\scripts\phase6_backtest_singlepos.py",
             "--in",
             str(signals),
             "--out_trades",
@@ -108,10 +105,8 @@ def main() -> int:
     )
 
     # Weekly
-    run(
+    wk_args = (
         [
-            py,
-            r".\scripts\weekly_runbook.py",
             "--symbol",
             symbol,
             "--equity_csv",
@@ -127,6 +122,30 @@ def main() -> int:
         ]
     )
 
+    def script(name: str) -> str:
+        return os.path.join(SCRIPTS, name)
+
+    p5, p6, wk = script("phase5_signals_rsi.py"), script("phase6_backtest_singlepos.py"), script("weekly_runbook.py")
+    steps = [
+        Step("phase5", script_step(p5, p5_args, python=py),
+             inputs=[str(inp)], outputs=[str(signals)], params={"argv": p5_args}, code=[p5]),
+        Step("phase6", script_step(p6, p6_args, python=py),
+             inputs=[str(signals)], outputs=[str(trades), str(equity)], deps=["phase5"], params={"argv": p6_args},
+             code=[p6]),
+        Step("weekly", script_step(wk, wk_args, python=py),
+             inputs=[str(equity), str(trades)], outputs=[str(report), str(alloc)], deps=["phase6"], params={"argv": wk_args},
+             code=[wk]),
+    ]
+    with traced_run("weekly_pipeline_2330"):
+        run = Pipeline(
+            f"weekly_{symbol}",
+            steps,
+            manifest_path=str(out_dir / f"pipeline_weekly_{symbol}_manifest.json"),
+            force=args.force,
+        ).run()
+    if not run["ok"]:
+        raise SystemExit("weekly_pipeline failed: " + ", ".join(k for k, v in run["steps"].items() if v["status"] not in ("ran", "skipped")))
+
     print(f"OK weekly_pipeline done. report={report} allocation={alloc}")
     return 0
 
@@ -26,7 +26,7 @@ class Snapshot:
     equity: float
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Weekly report generator (no tabulate dependency)")
     ap.add_argument("--symbol", required=True)
     ap.add_argument("--equity_csv", required=True)
@@ -35,7 +35,7 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--out_allocation", required=True)
     ap.add_argument("--trades_tail", type=int, default=10)
     ap.add_argument("--data_csv", default="", help="Optional original data csv (data/{symbol}.csv) for last_close fallback")
-    return ap.parse_args()
+    return ap.parse_args(argv)
 
 
 def _to_float(x) -> float:
@@ -223,8 +223,8 @@ def write_allocation(out_allocation: Path, snap: Snapshot) -> None:
     out_allocation.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
 
 
-def main() -> int:
-    args = parse_args()
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
     symbol = str(args.symbol)
 
     equity_csv = Path(args.equity_csv)
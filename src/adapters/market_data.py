@@ -1,49 +1,223 @@
 ﻿from __future__ import annotations
-from dataclasses import dataclass
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date as Date
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
 import csv
 
+from src.adapters.price_cache import load_cached_prices
+
+DateLike = Union[str, Date]
+
+
+def _date_key(d: DateLike) -> str:
+    # ISO YYYY-MM-DD strings sort chronologically, so bisect can work on them directly
+    if isinstance(d, Date):
+        return d.isoformat()
+    return str(d).strip()[:10]
+
+
+@dataclass
+class SymbolSeries:
+    """
+    One symbol's closes, sorted by date.
+
+    Lookups bisect the date keys (O(log n)); closes_upto returns a read-only
+    view over a contiguous array('d') instead of copying the prefix.
+    """
+    dates: List[str]
+    closes: array
+    _view: memoryview = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.closes, array) or self.closes.typecode != "d":
+            self.closes = array("d", self.closes)
+        self._view = memoryview(self.closes).toreadonly()
+
+    # memoryviews cannot be pickled (sweeper worker pools); rebuild on load
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state.pop("_view", None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._view = memoryview(self.closes).toreadonly()
+
+    def index_on_or_before(self, d: DateLike) -> int:
+        """Position of the last bar dated <= d, or -1."""
+        return bisect_right(self.dates, _date_key(d)) - 1
+
+    def closes_upto(self, d: DateLike) -> memoryview:
+        return self._view[: self.index_on_or_before(d) + 1]
+
+    def last_price_on(self, d: DateLike) -> Optional[float]:
+        i = self.index_on_or_before(d)
+        return float(self.closes[i]) if i >= 0 else None
+
 
 @dataclass
 class MarketDataResult:
-    dates: list[str]
-    closes: list[float]
-
-    def closes_upto(self, symbol: str, date: str) -> list[float]:
-        out = []
-        for d, c in zip(self.dates, self.closes):
-            if d <= date:
-                out.append(c)
-            else:
-                break
+    """
+    Multi-symbol close panel keyed by symbol.
+
+    dates() is the sorted union of every symbol's dates (as datetime.date),
+    precomputed once; per-symbol lookups are bisect-based, so the portfolio
+    backtester does O(log n) work per (date, symbol) instead of a linear scan.
+    """
+    series: Dict[str, SymbolSeries]
+    _dates: List[Date] = field(init=False, repr=False, compare=False)
+    _date_index: Dict[str, int] = field(init=False, repr=False, compare=False)
+    _symbols: List[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        keys = sorted({d for s in self.series.values() for d in s.dates})
+        self._dates = [Date.fromisoformat(k) for k in keys]
+        self._date_index = {k: i for i, k in enumerate(keys)}
+        self._symbols = sorted(self.series.keys())
+
+    @classmethod
+    def single(cls, symbol: str, dates: List[str], closes: Iterable[float]) -> "MarketDataResult":
+        if not dates:
+            return cls({})
+        return cls({symbol: SymbolSeries(list(dates), array("d", closes))})
+
+    def symbols(self) -> List[str]:
+        return list(self._symbols)
+
+    def dates(self) -> List[Date]:
+        return list(self._dates)
+
+    def date_index(self, d: DateLike) -> Optional[int]:
+        """Position of d in dates(), or None when no symbol traded that day."""
+        return self._date_index.get(_date_key(d))
+
+    def closes_upto(self, symbol: str, date: DateLike) -> memoryview:
+        s = self.series.get(symbol)
+        if s is None:
+            return memoryview(array("d")).toreadonly()
+        return s.closes_upto(date)
+
+    def last_price_on(self, symbol: str, date: DateLike) -> float:
+        s = self.series.get(symbol)
+        if s is None:
+            return 0.0
+        px = s.last_price_on(date)
+        return float(px) if px is not None else 0.0
+
+    def latest_prices_on(self, date: DateLike) -> Dict[str, float]:
+        """Last known close <= date for every symbol that has one."""
+        key = _date_key(date)
+        out: Dict[str, float] = {}
+        for sym in self._symbols:
+            s = self.series[sym]
+            i = bisect_right(s.dates, key) - 1
+            if i >= 0:
+                out[sym] = float(s.closes[i])
         return out
 
-    def last_price_on(self, symbol: str, date: str) -> float:
-        last = None
-        for d, c in zip(self.dates, self.closes):
-            if d <= date:
-                last = c
-            else:
-                break
-        return float(last) if last is not None else 0.0
 
+def _read_rows(path: Path) -> List[Dict[str, str]]:
+    # utf-8-sig: data/history/*.csv are written with a BOM
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        rows = []
+        for r in reader:
+            rows.append({(k or "").strip().lower(): (v or "").strip() for k, v in r.items()})
+        return rows
+
+
+def _build_series(pairs: List[tuple]) -> SymbolSeries:
+    # sort by date; a later duplicate date overwrites the earlier one
+    merged: Dict[str, float] = {}
+    for d, c in pairs:
+        merged[d] = c
+    keys = sorted(merged.keys())
+    return SymbolSeries(keys, array("d", (merged[k] for k in keys)))
+
+
+def _load_series(path: Path, symbol: Optional[str], use_cache: bool) -> Dict[str, SymbolSeries]:
+    cached = load_cached_prices(path) if use_cache else None
+    if cached is not None:
+        keys = cached.date_keys()
+        closes = array("d")
+        closes.frombytes(cached.closes_bytes())
+        if cached.strictly_increasing():
+            series = SymbolSeries(keys, closes)
+        else:
+            series = _build_series(list(zip(keys, closes)))
+        return {symbol or path.stem: series}
+
+    by_symbol: Dict[str, List[tuple]] = {}
+    default_symbol = symbol or path.stem
+    for r in _read_rows(path):
+        d = r.get("date", "")
+        c = r.get("close", "")
+        if not d or not c:
+            continue
+        try:
+            close = float(c)
+        except ValueError:
+            continue
+        sym = r.get("symbol") or r.get("code") or default_symbol
+        by_symbol.setdefault(sym, []).append((_date_key(d), close))
 
-def load_prices_from_csv(csv_path: str | Path) -> MarketDataResult:
-    dates, closes = [], []
+    return {sym: _build_series(pairs) for sym, pairs in by_symbol.items()}
+
+
+def load_prices_from_csv(
+    csv_path: str | Path,
+    symbol: Optional[str] = None,
+    use_cache: bool = True,
+) -> MarketDataResult:
+    """
+    Load closes from one CSV.
+
+    - long format with a symbol/code column -> one series per symbol
+    - plain date,close -> one series named `symbol` (default: file stem),
+      read through the .npy sidecar cache (price_cache) unless use_cache=False
+    """
     path = Path(csv_path)
 
     if not path.exists():
-        return MarketDataResult([], [])
+        return MarketDataResult({})
+    return MarketDataResult(_load_series(path, symbol, use_cache))
 
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if "date" in r and "close" in r:
-                dates.append(r["date"])
-                closes.append(float(r["close"]))
-
-    pairs = sorted(zip(dates, closes), key=lambda x: x[0])
-    return MarketDataResult(
-        dates=[p[0] for p in pairs],
-        closes=[p[1] for p in pairs],
-    )
+
+def load_prices_from_dir(
+    history_dir: str | Path,
+    symbols: Optional[Iterable[str]] = None,
+    use_cache: bool = True,
+) -> MarketDataResult:
+    """
+    Load one <symbol>.csv per symbol (e.g. data/history/2330.csv) into a panel.
+    Missing files are skipped.
+    """
+    root = Path(history_dir)
+    if symbols is None:
+        paths = sorted(root.glob("*.csv"))
+    else:
+        paths = [root / f"{s}.csv" for s in symbols]
+
+    series: Dict[str, SymbolSeries] = {}
+    for p in paths:
+        if not p.exists():
+            continue
+        s = _load_series(p, p.stem, use_cache).get(p.stem)
+        if s is not None and s.dates:
+            series[p.stem] = s
+    return MarketDataResult(series)
+
+
+def load_prices_from_universe(
+    universe_csv: str | Path = Path("data") / "universe_stock.csv",
+    history_dir: str | Path = Path("data") / "history",
+) -> MarketDataResult:
+    """Panel for every code listed in data/universe_stock.csv that has a history file."""
+    path = Path(universe_csv)
+    if not path.exists():
+        return MarketDataResult({})
+    codes = [r.get("code", "") for r in _read_rows(path)]
+    return load_prices_from_dir(history_dir, [c for c in codes if c])
@@ -0,0 +1,206 @@
+﻿from __future__ import annotations
+import csv
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import date as Date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Binary sidecar cache for per-symbol price CSVs (data/history/*.csv,
+# data/cache/stooq_tw/*.csv): one .npy per file, read in one np.load.
+#
+# This is a faster parse, not zero-copy: the loaders copy the columns into
+# their own list[str] dates / array('d') closes (SymbolSeries, MarketData),
+# so a warm load costs one binary read plus that copy per symbol instead of
+# CSV text parsing. The first (cold) load parses the CSV and also writes the
+# sidecar, so it is somewhat slower than a plain parse.
+#
+#   <csv dir>/_npcache/<stem>.npy   structured rows: day int32 (days since
+#                                   1970-01-01), open/high/low/close/volume float64
+#   <csv dir>/_npcache/<stem>.json  source size, mtime_ns, sha1
+#
+# Rows are the CSV's valid (date, close) rows in file order, before any
+# sorting/dedup, so both loaders keep their own semantics on top of it.
+# Files whose dates are not plain YYYY-MM-DD, or that carry a symbol/code
+# column (long format), are not cached. numpy is optional: without it, or
+# when the cache dir is not writable, callers just parse the CSV.
+
+CACHE_DIRNAME = "_npcache"
+CACHE_VERSION = 1
+FIELDS = ("open", "high", "low", "close", "volume")
+_EPOCH_ORDINAL = Date(1970, 1, 1).toordinal()
+
+# day number -> "YYYY-MM-DD", shared by every loaded symbol (one str per day)
+_DAY_KEYS: Dict[int, str] = {}
+
+
+@dataclass(frozen=True)
+class PriceArrays:
+    """Columns of one cached price file (loaders copy what they need out of it)."""
+    rows: Any  # numpy structured array
+
+    def __len__(self) -> int:
+        return int(self.rows.shape[0])
+
+    def date_keys(self) -> List[str]:
+        days = self.rows["day"].tolist()
+        keys = _DAY_KEYS
+        for d in set(days).difference(keys):
+            keys[d] = Date.fromordinal(d + _EPOCH_ORDINAL).isoformat()
+        return [keys[d] for d in days]
+
+    def column(self, name: str):
+        return self.rows[name]
+
+    def strictly_increasing(self) -> bool:
+        import numpy as np
+
+        days = self.rows["day"]
+        return bool(np.all(days[1:] > days[:-1]))
+
+    def closes_bytes(self) -> bytes:
+        """Closes as native float64 bytes, ready for array('d').frombytes."""
+        import numpy as np
+
+        return np.ascontiguousarray(self.rows["close"], dtype=np.float64).tobytes()
+
+
+def _paths(csv_path: Path) -> tuple[Path, Path]:
+    d = csv_path.parent / CACHE_DIRNAME
+    return d / f"{csv_path.stem}.npy", d / f"{csv_path.stem}.json"
+
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _iso_day(d: str) -> Optional[int]:
+    if len(d) != 10:
+        return None
+    try:
+        v = Date.fromisoformat(d)
+    except ValueError:
+        return None
+    if v.isoformat() != d:
+        return None
+    return v.toordinal() - _EPOCH_ORDINAL
+
+
+def _to_float(s: str) -> float:
+    try:
+        return float(s)
+    except ValueError:
+        return float("nan")
+
+
+def _parse_csv(csv_path: Path) -> Optional[List[tuple]]:
+    """(day, o, h, l, c, v) rows with a date and a numeric close; None = not cacheable."""
+    with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return None
+        cols = [(h or "").replace("\ufeff", "").strip().lower() for h in header]
+        if "date" not in cols or "close" not in cols or "symbol" in cols or "code" in cols:
+            return None
+        k_date = cols.index("date")
+        k_close = cols.index("close")
+        k_other = [cols.index(n) if n in cols else -1 for n in FIELDS]
+        width = len(cols)
+
+        out: List[tuple] = []
+        nan = float("nan")
+        for row in reader:
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            d = row[k_date].strip()
+            c = row[k_close].strip()
+            if not d or not c:
+                continue
+            try:
+                close = float(c)
+            except ValueError:
+                continue
+            day = _iso_day(d)
+            if day is None:
+                return None
+            vals = [(_to_float(row[k].strip()) if k >= 0 and row[k].strip() else nan) for k in k_other]
+            vals[3] = close
+            out.append((day, *vals))
+    return out
+
+
+def _dtype():
+    import numpy as np
+
+    return np.dtype([("day", "<i4")] + [(n, "<f8") for n in FIELDS])
+
+
+def _write(npy: Path, meta: Path, arr: Any, stat: os.stat_result, sha1: str) -> None:
+    import numpy as np
+
+    npy.parent.mkdir(parents=True, exist_ok=True)
+    tmp = npy.with_name(npy.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, npy)
+    info = {"version": CACHE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": sha1}
+    tmp = meta.with_name(meta.name + ".tmp")
+    tmp.write_text(json.dumps(info), encoding="utf-8")
+    os.replace(tmp, meta)
+
+
+def load_cached_prices(csv_path: str | Path) -> Optional[PriceArrays]:
+    """
+    Cached rows for csv_path, (re)building the cache when the source
+    changed (size/mtime differ and the sha1 does too).
+    None when the file cannot be cached; the caller then parses the CSV.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+
+    path = Path(csv_path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    npy, meta = _paths(path)
+
+    try:
+        info = json.loads(meta.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        info = None
+
+    if info is not None and info.get("version") == CACHE_VERSION and npy.exists():
+        fresh = info.get("size") == stat.st_size and info.get("mtime_ns") == stat.st_mtime_ns
+        if not fresh and info.get("size") == stat.st_size and info.get("sha1") == _sha1(path):
+            # touched/copied but same bytes: refresh the stamp only
+            info["mtime_ns"] = stat.st_mtime_ns
+            try:
+                meta.write_text(json.dumps(info), encoding="utf-8")
+            except OSError:
+                pass
+            fresh = True
+        if fresh:
+            try:
+                return PriceArrays(np.load(npy))
+            except (OSError, ValueError):
+                pass
+
+    rows = _parse_csv(path)
+    if not rows:
+        return None
+    arr = np.array(rows, dtype=_dtype())
+    try:
+        _write(npy, meta, arr, stat, _sha1(path))
+    except OSError:
+        pass  # unwritable cache dir: still serve this load from the parsed rows
+    return PriceArrays(arr)
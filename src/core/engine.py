@@ -1,10 +1,11 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
+from src.core.indicators import CrossState
 from src.domain.config import AppConfig
-from src.domain.models import Decision
+from src.domain.models import Decision, PriceBar
 
 
 def _sma(values: List[float], window: int) -> Optional[float]:
@@ -18,6 +19,7 @@ def _sma(values: List[float], window: int) -> Optional[float]:
 @dataclass
 class InvestmentEngine:
     config: AppConfig
+    _streams: Dict[str, CrossState] = field(default_factory=dict, init=False, repr=False)
 
     def decide(self, symbol: str, closes: List[float]) -> Decision:
         if not symbol:
@@ -47,6 +49,63 @@ class InvestmentEngine:
         prev_closes = closes[:-1]
         prev_short = _sma(prev_closes, self.config.ma_short)
         prev_long = _sma(prev_closes, self.config.ma_long)
+
+        return self._cross_decision(symbol, price, short_ma, long_ma, prev_short, prev_long)
+
+    def decide_next(self, bar: PriceBar) -> Decision:
+        """
+        Streaming variant of decide(): feed one bar per symbol, in date order.
+
+        Keeps running-sum SMAs per symbol, so each call is O(1) instead of
+        re-slicing the whole close history. For the same sequence of closes it
+        returns the same Decision as decide(symbol, closes).
+        """
+        symbol = bar.symbol
+        if not symbol:
+            return Decision("HOLD", None, None, 0, "No symbol provided")
+
+        price = float(bar.close)
+        if self.config.ma_short <= 0 or self.config.ma_long <= 0:
+            return Decision("HOLD", symbol, price, 0, "MA unavailable")
+
+        state = self._streams.get(symbol)
+        if state is None:
+            state = CrossState.of(self.config.ma_short, self.config.ma_long)
+            self._streams[symbol] = state
+        state.update(price)
+
+        need = max(self.config.ma_short, self.config.ma_long)
+        if state.count < need:
+            return Decision(
+                "HOLD",
+                symbol,
+                price,
+                0,
+                f"Not enough price history (need {need}, got {state.count})",
+            )
+
+        short_ma, long_ma = state.current()
+        if short_ma is None or long_ma is None:
+            return Decision("HOLD", symbol, price, 0, "MA unavailable")
+
+        return self._cross_decision(symbol, price, short_ma, long_ma, state.prev_fast, state.prev_slow)
+
+    def reset_stream(self, symbol: Optional[str] = None) -> None:
+        """Drop streaming state for one symbol (or all symbols)."""
+        if symbol is None:
+            self._streams.clear()
+        else:
+            self._streams.pop(symbol, None)
+
+    def _cross_decision(
+        self,
+        symbol: str,
+        price: float,
+        short_ma: float,
+        long_ma: float,
+        prev_short: Optional[float],
+        prev_long: Optional[float],
+    ) -> Decision:
         if prev_short is None or prev_long is None:
             return Decision("HOLD", symbol, price, 0, "Not enough history for cross detection")
 
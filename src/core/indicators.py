@@ -0,0 +1,229 @@
+﻿from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional, Tuple
+
+
+@dataclass
+class RollingSMA:
+    """
+    Simple moving average advanced one value at a time.
+
+    Keeps a running sum over the last `window` values, so each update is O(1)
+    instead of re-summing closes[-window:] on every bar. The running sum is
+    re-based from the buffer once per `window` updates so rounding error
+    cannot drift over long replays (amortized O(1)).
+    """
+    window: int
+    _buf: Deque[float] = field(default_factory=deque, init=False, repr=False)
+    _sum: float = field(default=0.0, init=False, repr=False)
+    _since_resync: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.window <= 0:
+            raise ValueError("SMA window must be > 0")
+
+    @property
+    def ready(self) -> bool:
+        return len(self._buf) >= self.window
+
+    @property
+    def value(self) -> Optional[float]:
+        if not self.ready:
+            return None
+        return self._sum / float(self.window)
+
+    def exact(self) -> Optional[float]:
+        """Same value as sum(values[-window:]) / window, summed in order (O(window))."""
+        if not self.ready:
+            return None
+        return sum(self._buf) / float(self.window)
+
+    def update(self, x: float) -> Optional[float]:
+        x = float(x)
+        self._buf.append(x)
+        self._sum += x
+        if len(self._buf) > self.window:
+            self._sum -= self._buf.popleft()
+            self._since_resync += 1
+            if self._since_resync >= self.window:
+                self._sum = sum(self._buf)
+                self._since_resync = 0
+        return self.value
+
+    def reset(self) -> None:
+        self._buf.clear()
+        self._sum = 0.0
+        self._since_resync = 0
+
+
+@dataclass
+class EMA:
+    """
+    Exponential moving average (adjust=False).
+
+    alpha defaults to 2 / (period + 1); the first value seeds the average.
+    Reports None until `period` values have been seen (pandas min_periods).
+    """
+    period: int
+    alpha: Optional[float] = None
+    _value: Optional[float] = field(default=None, init=False, repr=False)
+    _count: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.period <= 0:
+            raise ValueError("EMA period must be > 0")
+        if self.alpha is None:
+            self.alpha = 2.0 / (float(self.period) + 1.0)
+
+    @property
+    def ready(self) -> bool:
+        return self._count >= self.period
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value if self.ready else None
+
+    def update(self, x: float) -> Optional[float]:
+        x = float(x)
+        if self._value is None:
+            self._value = x
+        else:
+            self._value = self._value + float(self.alpha) * (x - self._value)
+        self._count += 1
+        return self.value
+
+    def reset(self) -> None:
+        self._value = None
+        self._count = 0
+
+
+@dataclass
+class WilderRSI:
+    """
+    Wilder's RSI, fed one close at a time.
+
+    Matches scripts/phase5_signals_rsi.py::rsi: gains/losses smoothed with an
+    EMA of alpha=1/period (adjust=False, min_periods=period), where the first
+    diff seeds the averages. Returns None while warming up or when the
+    average loss is zero (the pandas version yields NaN there).
+    """
+    period: int
+    _prev: Optional[float] = field(default=None, init=False, repr=False)
+    _gain: EMA = field(init=False, repr=False)
+    _loss: EMA = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.period <= 1:
+            raise ValueError("RSI period must be > 1")
+        alpha = 1.0 / float(self.period)
+        self._gain = EMA(self.period, alpha)
+        self._loss = EMA(self.period, alpha)
+
+    @property
+    def value(self) -> Optional[float]:
+        g = self._gain.value
+        l = self._loss.value
+        if g is None or l is None or l == 0:
+            return None
+        rs = g / l
+        return 100.0 - (100.0 / (1.0 + rs))
+
+    def update(self, close: float) -> Optional[float]:
+        close = float(close)
+        if self._prev is not None:
+            diff = close - self._prev
+            self._gain.update(diff if diff > 0 else 0.0)
+            self._loss.update(-diff if diff < 0 else 0.0)
+        self._prev = close
+        return self.value
+
+    def reset(self) -> None:
+        self._prev = None
+        self._gain.reset()
+        self._loss.reset()
+
+
+@dataclass
+class CutlerRSI:
+    """
+    RSI over a simple average of the last `period` gains/losses.
+
+    Same formula as src/strategy/rsi.py::RSIStrategy.decide (avg_loss == 0
+    -> 100), kept as two running sums so each update is O(1).
+    """
+    period: int
+    _prev: Optional[float] = field(default=None, init=False, repr=False)
+    _gain: RollingSMA = field(init=False, repr=False)
+    _loss: RollingSMA = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.period <= 1:
+            raise ValueError("RSI period must be > 1")
+        self._gain = RollingSMA(self.period)
+        self._loss = RollingSMA(self.period)
+
+    @property
+    def value(self) -> Optional[float]:
+        g = self._gain.value
+        l = self._loss.value
+        if g is None or l is None:
+            return None
+        if l == 0:
+            return 100.0
+        rs = g / l
+        return 100.0 - (100.0 / (1.0 + rs))
+
+    def update(self, close: float) -> Optional[float]:
+        close = float(close)
+        if self._prev is not None:
+            diff = close - self._prev
+            self._gain.update(diff if diff >= 0 else 0.0)
+            self._loss.update(-diff if diff < 0 else 0.0)
+        self._prev = close
+        return self.value
+
+    def reset(self) -> None:
+        self._prev = None
+        self._gain.reset()
+        self._loss.reset()
+
+
+# relative gap under which a fast/slow pair counts as a near-tie
+_TIE_RTOL = 1e-9
+
+
+@dataclass
+class CrossState:
+    """
+    Fast/slow SMA pair that remembers the previous bar's values,
+    which is all a crossover check needs.
+
+    Near-ties are re-evaluated with RollingSMA.exact(), so `<=` / `>=`
+    comparisons agree with a full re-sum of the close history.
+    """
+    fast: RollingSMA
+    slow: RollingSMA
+    count: int = 0
+    prev_fast: Optional[float] = None
+    prev_slow: Optional[float] = None
+
+    @classmethod
+    def of(cls, fast_window: int, slow_window: int) -> "CrossState":
+        return cls(fast=RollingSMA(fast_window), slow=RollingSMA(slow_window))
+
+    def current(self) -> Tuple[Optional[float], Optional[float]]:
+        f = self.fast.value
+        s = self.slow.value
+        if f is None or s is None:
+            return f, s
+        if abs(f - s) <= _TIE_RTOL * max(abs(f), abs(s), 1.0):
+            return self.fast.exact(), self.slow.exact()
+        return f, s
+
+    def update(self, close: float) -> None:
+        self.prev_fast, self.prev_slow = self.current()
+        self.fast.update(close)
+        self.slow.update(close)
+        self.count += 1
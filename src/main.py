@@ -42,9 +42,9 @@ def run_backtest(args):
     strategy = build_strategy(args)
 
     for d in md.dates:
-        closes = md.closes_upto(d)
-        decision = strategy.decide(args.symbol, closes)
         price = md.last_price_on(d)
+        # streaming: strategy keeps its own rolling state, one bar per date
+        decision = strategy.decide_next(args.symbol, price)
 
         if decision:
             broker.handle_decision(decision, d, price)
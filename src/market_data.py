@@ -1,9 +1,12 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from pathlib import Path
 import csv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence
+
+from src.adapters.price_cache import load_cached_prices
 
 
 def _norm_key(s: str) -> str:
@@ -28,19 +31,39 @@ class MarketData:
       - close
 
     Other columns are ignored.
+
+    closes are stored in one contiguous array('d'); closes_upto() returns
+    read-only memoryview slices over it, so walking N bars does not copy the
+    history N times.
+
+    from_csv reads through the .npy sidecar cache (src/adapters/price_cache.py)
+    when the file is cacheable; use_cache=False always parses the text.
     """
     dates: List[str]
-    closes: List[float]
+    closes: Sequence[float]
     _date_to_index: Dict[str, int]
+    _view: memoryview = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.closes, array) or self.closes.typecode != "d":
+            object.__setattr__(self, "closes", array("d", self.closes))
+        object.__setattr__(self, "_view", memoryview(self.closes).toreadonly())
 
     @classmethod
-    def from_csv(cls, csv_path: str | Path) -> "MarketData":
+    def from_csv(cls, csv_path: str | Path, use_cache: bool = True) -> "MarketData":
         path = Path(csv_path)
         if not path.exists():
             raise FileNotFoundError(f"CSV not found: {path}")
 
+        cached = load_cached_prices(path) if use_cache else None
+        if cached is not None:
+            dates = cached.date_keys()
+            closes = array("d")
+            closes.frombytes(cached.closes_bytes())
+            return cls(dates=dates, closes=closes, _date_to_index={d: i for i, d in enumerate(dates)})
+
         dates: List[str] = []
-        closes: List[float] = []
+        closes = array("d")
 
         # utf-8-sig automatically strips BOM for the first header token in many cases,
         # but we still normalize keys to be safe.
@@ -83,14 +106,17 @@ class MarketData:
         date_to_index = {d: i for i, d in enumerate(dates)}
         return cls(dates=dates, closes=closes, _date_to_index=date_to_index)
 
-    def closes_upto(self, date: str) -> List[float]:
+    def closes_upto(self, date: str) -> memoryview:
         """
         Returns closes from beginning up to and including 'date'.
+
+        Zero-copy, read-only view: supports len(), indexing (incl. negative),
+        slicing, iteration and sum() like a list; call .tolist() for a copy.
         """
         if date not in self._date_to_index:
             raise KeyError(f"Date not found in MarketData: {date}")
         idx = self._date_to_index[date]
-        return self.closes[: idx + 1]
+        return self._view[: idx + 1]
 
     def last_price_on(self, date: str) -> float:
         """
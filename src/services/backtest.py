@@ -1,7 +1,7 @@
 ﻿from __future__ import annotations
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import date, datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -11,6 +11,8 @@ from src.domain.config import AppConfig
 from src.domain.models import Decision
 from src.domain.portfolio import Portfolio
 from src.services.broker import PaperBroker, Fill
+from src.services.log_sink import BufferedLogSink
+from src.utils.instrument import stage
 
 
 @dataclass(frozen=True)
@@ -51,15 +53,6 @@ def _ensure_parent(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def _append_csv_row(path: Path, header: List[str], row: List[str]) -> None:
-    _ensure_parent(path)
-    exists = path.exists()
-    with path.open("a", encoding="utf-8", newline="") as f:
-        if not exists:
-            f.write(",".join(header) + "\n")
-        f.write(",".join(row) + "\n")
-
-
 def _portfolio_value(portfolio: Portfolio, prices: Dict[str, float]) -> Tuple[float, float]:
     pos_value = 0.0
     for sym, pos in portfolio.positions.items():
@@ -71,113 +64,92 @@ def _portfolio_value(portfolio: Portfolio, prices: Dict[str, float]) -> Tuple[fl
     return total, pos_value
 
 
-def run_backtest(
-    md: MarketDataResult,
-    engine,
-    cfg: AppConfig,
+_TRADE_LOG_HEADER = [
+    "ts",
+    "event",
+    "action",
+    "symbol",
+    "fill_price",
+    "quantity",
+    "fee",
+    "cash_delta",
+    "cash_after",
+    "position_qty",
+    "position_avg_cost",
+    "realized_pnl",
+    "note",
+]
+
+
+@dataclass
+class _FillStats:
+    fills: List[Fill] = field(default_factory=list)
+    realized_pnls: List[float] = field(default_factory=list)
+    buys: int = 0
+    sells: int = 0
+
+
+def _open_trade_sink(path: Optional[Path]) -> Optional[BufferedLogSink]:
+    if path is None:
+        return None
+    # one buffered appender per run instead of open/close per fill
+    return BufferedLogSink(path, _TRADE_LOG_HEADER, lineterminator="\n")
+
+
+def _handle_fill(
+    fill: Optional[Fill],
+    portfolio: Portfolio,
+    stats: _FillStats,
+    trade_sink: Optional[BufferedLogSink],
+    log_rejected: bool,
+) -> None:
+    if not fill:
+        return
+
+    is_fill = (fill.quantity > 0)
+    if is_fill:
+        stats.fills.append(fill)
+        if fill.action == "BUY":
+            stats.buys += 1
+        elif fill.action == "SELL":
+            stats.sells += 1
+            stats.realized_pnls.append(float(fill.realized_pnl))
+
+    if trade_sink is not None:
+        # Only write fills unless log_rejected=True
+        if is_fill or log_rejected:
+            event = "FILL" if is_fill else "REJECT"
+            pos = portfolio.get_position(fill.symbol)
+            trade_sink.write_row([
+                _iso_now(),
+                event,
+                fill.action,
+                fill.symbol,
+                float(fill.price),
+                int(fill.quantity),
+                float(fill.fee),
+                float(fill.cash_delta),
+                float(portfolio.cash),
+                int(pos.quantity),
+                float(pos.avg_cost),
+                float(fill.realized_pnl),
+                (fill.note or "").replace(",", " "),
+            ])
+
+
+def _build_report(
     start_cash: float,
+    equity: List[EquityPoint],
+    max_dd: float,
+    stats: _FillStats,
     log_equity_path: Optional[Path],
     log_metrics_path: Optional[Path],
-    log_trades_path: Optional[Path],
-    log_rejected: bool = False,
 ) -> BacktestReport:
-    broker = PaperBroker(cfg)
-
-    # in-memory portfolio only (backtest should not reuse live portfolio.json)
-    portfolio = Portfolio(cash=float(start_cash))
-
-    dates = md.dates()
-    symbols = md.symbols()
-
-    equity: List[EquityPoint] = []
-    fills: List[Fill] = []
-
-    peak = float(start_cash)
-    max_dd = 0.0
-
-    realized_pnls: List[float] = []
-    buys = 0
-    sells = 0
-
-    for d in dates:
-        # 1) decisions + execution for this date
-        for sym in symbols:
-            closes = md.closes_upto(sym, d)
-            decision: Decision = engine.decide(sym, closes)
-
-            # backtest always executes (paper) here; logging controlled separately
-            portfolio, fill = broker.execute(portfolio, decision)
-            if fill:
-                is_fill = (fill.quantity > 0)
-                if is_fill:
-                    fills.append(fill)
-                    if fill.action == "BUY":
-                        buys += 1
-                    elif fill.action == "SELL":
-                        sells += 1
-                        realized_pnls.append(float(fill.realized_pnl))
-
-                if log_trades_path is not None:
-                    # Only write fills unless log_rejected=True
-                    if is_fill or log_rejected:
-                        header = [
-                            "ts",
-                            "event",
-                            "action",
-                            "symbol",
-                            "fill_price",
-                            "quantity",
-                            "fee",
-                            "cash_delta",
-                            "cash_after",
-                            "position_qty",
-                            "position_avg_cost",
-                            "realized_pnl",
-                            "note",
-                        ]
-                        event = "FILL" if is_fill else "REJECT"
-                        pos = portfolio.get_position(fill.symbol)
-                        row = [
-                            _iso_now(),
-                            event,
-                            fill.action,
-                            fill.symbol,
-                            f"{float(fill.price):.6f}",
-                            str(int(fill.quantity)),
-                            f"{float(fill.fee):.6f}",
-                            f"{float(fill.cash_delta):.6f}",
-                            f"{float(portfolio.cash):.6f}",
-                            str(int(pos.quantity)),
-                            f"{float(pos.avg_cost):.6f}",
-                            f"{float(fill.realized_pnl):.6f}",
-                            (fill.note or "").replace(",", " "),
-                        ]
-                        _append_csv_row(log_trades_path, header, row)
-
-        # 2) equity snapshot (valuation uses last known price up to date)
-        prices = md.latest_prices_on(d)
-        total, pos_value = _portfolio_value(portfolio, prices)
-
-        if total > peak:
-            peak = total
-        dd = 0.0 if peak <= 0 else (total / peak - 1.0)
-        if dd < max_dd:
-            max_dd = dd
-
-        equity.append(
-            EquityPoint(
-                d=d,
-                total_value=float(total),
-                cash=float(portfolio.cash),
-                position_value=float(pos_value),
-                drawdown=float(dd),
-            )
-        )
-
     end_value = equity[-1].total_value if equity else float(start_cash)
     total_return = 0.0 if start_cash == 0 else (end_value / float(start_cash) - 1.0)
 
     # win-rate
+    realized_pnls = stats.realized_pnls
     wins = [p for p in realized_pnls if p > 0]
     losses = [p for p in realized_pnls if p < 0]
     trades = len(realized_pnls)
@@ -191,8 +163,8 @@ def run_backtest(
         total_return=float(total_return),
         max_drawdown=float(max_dd),
         trades=int(trades),
-        buys=int(buys),
-        sells=int(sells),
+        buys=int(stats.buys),
+        sells=int(stats.sells),
         win_rate=float(win_rate),
         avg_win=float(avg_win),
         avg_loss=float(avg_loss),
@@ -224,4 +196,113 @@ def run_backtest(
         }
         log_metrics_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    return BacktestReport(metrics=metrics, equity=equity, fills=fills)
+    return BacktestReport(metrics=metrics, equity=equity, fills=stats.fills)
+
+
+def run_backtest(
+    md: MarketDataResult,
+    engine,
+    cfg: AppConfig,
+    start_cash: float,
+    log_equity_path: Optional[Path],
+    log_metrics_path: Optional[Path],
+    log_trades_path: Optional[Path],
+    log_rejected: bool = False,
+    engine_mode: str = "loop",
+) -> BacktestReport:
+    """
+    engine_mode:
+      - "loop"       : engine.decide + broker.execute for every (date, symbol)
+      - "vectorized" : MA-cross signals for the whole panel in NumPy, then only
+                       the cash/position accounting runs per event
+                       (see src/services/backtest_vectorized.py)
+    """
+    # instrument stage: rows_in = (date, symbol) cells, rows_out = equity points
+    with stage("services.run_backtest", rows_in=len(md.dates()) * len(md.symbols())) as st:
+        report = _run_backtest(
+            md, engine, cfg, start_cash, log_equity_path, log_metrics_path, log_trades_path, log_rejected, engine_mode
+        )
+        st.rows_out = len(report.equity)
+        for p in (log_equity_path, log_metrics_path, log_trades_path):
+            if p is not None:
+                st.wrote(p)
+    return report
+
+
+def _run_backtest(
+    md: MarketDataResult,
+    engine,
+    cfg: AppConfig,
+    start_cash: float,
+    log_equity_path: Optional[Path],
+    log_metrics_path: Optional[Path],
+    log_trades_path: Optional[Path],
+    log_rejected: bool,
+    engine_mode: str,
+) -> BacktestReport:
+    if engine_mode == "vectorized":
+        from src.services.backtest_vectorized import run_backtest_vectorized
+
+        return run_backtest_vectorized(
+            md=md,
+            engine=engine,
+            cfg=cfg,
+            start_cash=start_cash,
+            log_equity_path=log_equity_path,
+            log_metrics_path=log_metrics_path,
+            log_trades_path=log_trades_path,
+            log_rejected=log_rejected,
+        )
+    if engine_mode != "loop":
+        raise ValueError(f"Unknown engine_mode: {engine_mode}")
+
+    broker = PaperBroker(cfg)
+
+    # in-memory portfolio only (backtest should not reuse live portfolio.json)
+    portfolio = Portfolio(cash=float(start_cash))
+
+    dates = md.dates()
+    symbols = md.symbols()
+
+    equity: List[EquityPoint] = []
+    stats = _FillStats()
+
+    peak = float(start_cash)
+    max_dd = 0.0
+
+    trade_sink = _open_trade_sink(log_trades_path)
+    try:
+        for d in dates:
+            # 1) decisions + execution for this date
+            for sym in symbols:
+                closes = md.closes_upto(sym, d)
+                decision: Decision = engine.decide(sym, closes)
+
+                # backtest always executes (paper) here; logging controlled separately
+                portfolio, fill = broker.execute(portfolio, decision)
+                _handle_fill(fill, portfolio, stats, trade_sink, log_rejected)
+
+            # 2) equity snapshot (valuation uses last known price up to date)
+            prices = md.latest_prices_on(d)
+            total, pos_value = _portfolio_value(portfolio, prices)
+
+            if total > peak:
+                peak = total
+            dd = 0.0 if peak <= 0 else (total / peak - 1.0)
+            if dd < max_dd:
+                max_dd = dd
+
+            equity.append(
+                EquityPoint(
+                    d=d,
+                    total_value=float(total),
+                    cash=float(portfolio.cash),
+                    position_value=float(pos_value),
+                    drawdown=float(dd),
+                )
+            )
+    finally:
+        if trade_sink is not None:
+            trade_sink.close()
+
+    return _build_report(start_cash, equity, max_dd, stats, log_equity_path, log_metrics_path)
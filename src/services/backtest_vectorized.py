@@ -0,0 +1,233 @@
+﻿from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.adapters.market_data import MarketDataResult
+from src.domain.config import AppConfig
+from src.domain.models import Decision
+from src.domain.portfolio import Portfolio
+from src.services.backtest import (
+    BacktestReport,
+    EquityPoint,
+    _FillStats,
+    _build_report,
+    _handle_fill,
+    _open_trade_sink,
+)
+from src.services.broker import PaperBroker
+
+# tie slack for cumsum-based SMAs, relative to the symbol's max close;
+# anything this close to a cross is re-checked with engine.decide
+_TIE_RTOL = 1e-7
+
+
+def _rolling_mean_from_cumsum(cs: np.ndarray, window: int) -> np.ndarray:
+    """cs = [0, c0, c0+c1, ...]; out[i] = mean(c[i-window+1 : i+1]), NaN until the window is full."""
+    n = cs.shape[0] - 1
+    out = np.full(n, np.nan)
+    if window <= 0 or n < window:
+        return out
+    out[window - 1:] = (cs[window:] - cs[:-window]) / float(window)
+    return out
+
+
+def _cross_candidates(short_ma: np.ndarray, long_ma: np.ndarray, need: int, tol: float) -> np.ndarray:
+    """
+    Bars where InvestmentEngine.decide may return BUY/SELL.
+
+    Deliberately loose around ties: every returned bar is confirmed with the
+    real engine, every other bar is guaranteed to be HOLD.
+    """
+    n = short_ma.shape[0]
+    if n <= need:
+        return np.zeros(0, dtype=np.int64)
+
+    gap = short_ma - long_ma
+    prev = np.empty_like(gap)
+    prev[0] = np.nan
+    prev[1:] = gap[:-1]
+
+    with np.errstate(invalid="ignore"):
+        up = (prev <= tol) & (gap > -tol)
+        down = (prev >= -tol) & (gap < tol)
+    mask = up | down
+    mask[:need] = False
+    return np.flatnonzero(mask)
+
+
+def _price_matrix(md: MarketDataResult, date_keys: np.ndarray, symbols: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (P, pos): P[g, s] = last close <= date g (0.0 when none yet),
+    pos[g, s] = index of that bar in the symbol's own series (-1 when none).
+    """
+    P = np.zeros((date_keys.shape[0], len(symbols)))
+    pos = np.empty((date_keys.shape[0], len(symbols)), dtype=np.int64)
+    for j, sym in enumerate(symbols):
+        s = md.series[sym]
+        keys = np.asarray(s.dates)
+        idx = np.searchsorted(keys, date_keys, side="right") - 1
+        pos[:, j] = idx
+        closes = np.frombuffer(s.closes, dtype=np.float64)
+        has = idx >= 0
+        P[has, j] = closes[idx[has]]
+    return P, pos
+
+
+class PanelCache:
+    """
+    Everything about a MarketDataResult that does not depend on MA windows:
+    date x symbol price matrix, per-symbol cumulative sums, and each distinct
+    window's SMA series (computed once, on first use).
+
+    Build one per panel and pass it to every run_backtest_vectorized call of a
+    parameter sweep, so cost scales with distinct windows rather than pairs.
+    """
+
+    def __init__(self, md: MarketDataResult):
+        self.md = md
+        self.dates = md.dates()
+        self.symbols = md.symbols()
+        self.col = {sym: j for j, sym in enumerate(self.symbols)}
+        date_keys = np.array([d.isoformat() for d in self.dates])
+        self.P, self.pos = _price_matrix(md, date_keys, self.symbols)
+
+        self._cumsum: List[np.ndarray] = []
+        self.tol: List[float] = []
+        for sym in self.symbols:
+            c = np.frombuffer(md.series[sym].closes, dtype=np.float64)
+            self._cumsum.append(np.concatenate(([0.0], np.cumsum(c))))
+            peak = float(np.max(np.abs(c))) if c.shape[0] else 0.0
+            self.tol.append(_TIE_RTOL * max(1.0, peak))
+        self._sma: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def sma(self, j: int, window: int) -> np.ndarray:
+        key = (j, int(window))
+        out = self._sma.get(key)
+        if out is None:
+            out = _rolling_mean_from_cumsum(self._cumsum[j], int(window))
+            self._sma[key] = out
+        return out
+
+    def precompute(self, windows: List[int]) -> None:
+        for j in range(len(self.symbols)):
+            for w in sorted(set(int(x) for x in windows)):
+                self.sma(j, w)
+
+
+def run_backtest_vectorized(
+    md: MarketDataResult,
+    engine,
+    cfg: AppConfig,
+    start_cash: float,
+    log_equity_path: Optional[Path],
+    log_metrics_path: Optional[Path],
+    log_trades_path: Optional[Path],
+    log_rejected: bool = False,
+    panel: Optional[PanelCache] = None,
+) -> BacktestReport:
+    """
+    Same BacktestReport as run_backtest(engine_mode="loop") for the MA-cross
+    InvestmentEngine, without calling engine.decide on every (date, symbol).
+
+    1) NumPy: rolling SMAs per symbol, cross candidates, date x symbol price
+       matrix (forward-filled last close).
+    2) Candidates are confirmed with engine.decide on the same closes the loop
+       would see (a symbol with no bar on a date re-sees its previous bar, and
+       so repeats its previous decision, exactly like the loop).
+    3) Python: only BUY/SELL cells reach broker.execute, in date then symbol
+       order; equity is valued from the price matrix over held symbols only.
+
+    Assumes HOLD decisions are no-ops for the broker (no fill, nothing logged),
+    so log_rejected=True (which also logs what the broker does with HOLD cells)
+    is refused; use engine_mode="loop" for that.
+    Pass a PanelCache built from the same md to reuse its arrays across calls.
+    """
+    if log_rejected:
+        raise ValueError("vectorized engine_mode does not support log_rejected=True (HOLD cells never reach the broker); use engine_mode='loop'")
+    config = getattr(engine, "config", None)
+    if config is None or not hasattr(config, "ma_short") or not hasattr(config, "ma_long"):
+        raise ValueError("vectorized engine_mode needs an MA-cross engine with config.ma_short/ma_long")
+    ma_short = int(config.ma_short)
+    ma_long = int(config.ma_long)
+
+    broker = PaperBroker(cfg)
+    portfolio = Portfolio(cash=float(start_cash))
+
+    if panel is None or panel.md is not md:
+        panel = PanelCache(md)
+    dates = panel.dates
+    symbols = panel.symbols
+    col = panel.col
+    P = panel.P
+    pos = panel.pos
+    need = max(ma_short, ma_long)
+
+    # (date, symbol) cells whose decision is not HOLD, in execution order
+    decisions: Dict[Tuple[int, int], Decision] = {}
+    events: Dict[int, List[int]] = {}
+    for j, sym in enumerate(symbols):
+        if ma_short <= 0 or ma_long <= 0:
+            break
+        cand = _cross_candidates(panel.sma(j, ma_short), panel.sma(j, ma_long), need, panel.tol[j])
+        if cand.shape[0] == 0:
+            continue
+        s = md.series[sym]
+        view = s.closes_upto(s.dates[-1])
+        hits: List[int] = []
+        for i in cand.tolist():
+            dec = engine.decide(sym, view[: i + 1])
+            if dec.action != "HOLD":
+                decisions[(i, j)] = dec
+                hits.append(i)
+        if not hits:
+            continue
+        for g in np.flatnonzero(np.isin(pos[:, j], hits)).tolist():
+            events.setdefault(g, []).append(j)
+
+    equity: List[EquityPoint] = []
+    stats = _FillStats()
+
+    peak = float(start_cash)
+    max_dd = 0.0
+
+    trade_sink = _open_trade_sink(log_trades_path)
+    try:
+        for g, d in enumerate(dates):
+            for j in events.get(g, ()):
+                decision = decisions[(int(pos[g, j]), j)]
+                portfolio, fill = broker.execute(portfolio, decision)
+                _handle_fill(fill, portfolio, stats, trade_sink, log_rejected)
+
+            row = P[g]
+            pos_value = 0.0
+            for sym, p in portfolio.positions.items():
+                if p.quantity == 0:
+                    continue
+                j = col.get(sym)
+                px = float(row[j]) if j is not None else 0.0
+                pos_value += float(p.quantity) * px
+            total = float(portfolio.cash) + float(pos_value)
+
+            if total > peak:
+                peak = total
+            dd = 0.0 if peak <= 0 else (total / peak - 1.0)
+            if dd < max_dd:
+                max_dd = dd
+
+            equity.append(
+                EquityPoint(
+                    d=d,
+                    total_value=float(total),
+                    cash=float(portfolio.cash),
+                    position_value=float(pos_value),
+                    drawdown=float(dd),
+                )
+            )
+    finally:
+        if trade_sink is not None:
+            trade_sink.close()
+
+    return _build_report(start_cash, equity, max_dd, stats, log_equity_path, log_metrics_path)
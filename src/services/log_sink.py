@@ -0,0 +1,150 @@
+﻿from __future__ import annotations
+
+import csv
+import io
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+COLUMNAR_SUFFIXES = (".npz", ".parquet")
+
+
+def _format_cell(v: Any) -> str:
+    # same conventions the trade loggers always used: floats as %.6f, None as empty
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return str(v)
+    if isinstance(v, int):
+        return str(v)
+    if isinstance(v, float):
+        return f"{v:.6f}"
+    return str(v)
+
+
+class BufferedLogSink:
+    """
+    Buffered, append-only row sink for trade/decision logs.
+
+    - .csv (default): rows are buffered and appended in one write every
+      `flush_rows` rows and on close(); the directory and header are handled
+      once instead of per row. An existing non-empty file is appended to.
+    - .npz / .parquet: columnar output for large runs. Values keep their
+      Python types (float64 / int64 / str columns). Parquet writes one row
+      group per flush and needs pyarrow; .npz is written once on close
+      (overwrites).
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        header: Sequence[str],
+        flush_rows: int = 1000,
+        lineterminator: str = "\r\n",
+    ):
+        self.path = Path(path)
+        self.header = list(header)
+        self.flush_rows = max(1, int(flush_rows))
+        self.lineterminator = lineterminator
+        self.rows_written = 0
+
+        self._rows: List[Sequence[Any]] = []
+        self._columns: Optional[Dict[str, List[Any]]] = None
+        self._parquet_writer = None
+        self._prepared = False
+        self._closed = False
+
+        self.columnar = self.path.suffix.lower() in COLUMNAR_SUFFIXES
+        if self.path.suffix.lower() == ".npz":
+            self._columns = {h: [] for h in self.header}
+
+    def __enter__(self) -> "BufferedLogSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def write_row(self, row: Sequence[Any]) -> None:
+        if self._closed:
+            raise ValueError(f"Sink already closed: {self.path}")
+        if len(row) != len(self.header):
+            raise ValueError(f"Row has {len(row)} values, header has {len(self.header)}")
+        if self._columns is not None:
+            for h, v in zip(self.header, row):
+                self._columns[h].append(v)
+            self.rows_written += 1
+            return
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        self._prepare()
+        if self.path.suffix.lower() == ".parquet":
+            self._flush_parquet()
+        else:
+            self._flush_csv()
+        self.rows_written += len(self._rows)
+        self._rows = []
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        if self._columns is not None:
+            self._write_npz()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        self._closed = True
+
+    # ---------------------------
+    # internals
+    # ---------------------------
+
+    def _prepare(self) -> None:
+        if self._prepared:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._prepared = True
+
+    def _flush_csv(self) -> None:
+        write_header = (not self.path.exists()) or (self.path.stat().st_size == 0)
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator=self.lineterminator)
+        if write_header:
+            w.writerow(self.header)
+        w.writerows([_format_cell(v) for v in r] for r in self._rows)
+        with self.path.open("a", encoding="utf-8", newline="") as f:
+            f.write(buf.getvalue())
+
+    def _flush_parquet(self) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet trade logs need pyarrow (pip install pyarrow); use .csv or .npz instead") from e
+
+        cols = {h: [r[i] for r in self._rows] for i, h in enumerate(self.header)}
+        table = pa.Table.from_pydict(cols)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(str(self.path), table.schema)
+        self._parquet_writer.write_table(table)
+
+    def _write_npz(self) -> None:
+        import numpy as np
+
+        self._prepare()
+        arrays = {}
+        for h, values in self._columns.items():
+            if values and all(isinstance(v, float) for v in values):
+                arrays[h] = np.asarray(values, dtype=np.float64)
+            elif values and all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                arrays[h] = np.asarray(values, dtype=np.int64)
+            else:
+                arrays[h] = np.asarray(["" if v is None else str(v) for v in values], dtype=str)
+        with self.path.open("wb") as f:
+            np.savez_compressed(f, **arrays)
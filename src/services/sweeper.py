@@ -1,14 +1,20 @@
 ﻿from __future__ import annotations
 
+import argparse
 import csv
+import multiprocessing as mp
+import os
+import sys
+import time
 from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Iterable, List, Optional, Tuple
 
-from src.adapters.market_data import MarketDataResult
+from src.adapters.market_data import MarketDataResult, load_prices_from_csv
 from src.core.engine import InvestmentEngine
 from src.domain.config import AppConfig
 from src.services.backtest import BacktestReport, run_backtest
+from src.utils.instrument import stage, traced_run
 
 
 @dataclass(frozen=True)
@@ -44,26 +50,35 @@ def generate_ma_grid(shorts: Iterable[int], longs: Iterable[int]) -> List[Tuple[
     return out
 
 
-def run_ma_sweep(
+def _sweep_row(
     md: MarketDataResult,
     base_cfg: AppConfig,
-    output_csv: Path,
-    shorts: List[int] | None = None,
-    longs: List[int] | None = None,
-) -> List[SweepRow]:
-    shorts = shorts or _default_short_grid()
-    longs = longs or _default_long_grid()
-
-    grid = generate_ma_grid(shorts, longs)
+    ma_s: int,
+    ma_l: int,
+    engine_mode: str,
+    panel=None,
+) -> SweepRow:
+    cfg = replace(base_cfg, ma_short=int(ma_s), ma_long=int(ma_l))
+    engine = InvestmentEngine(cfg)
 
-    rows: List[SweepRow] = []
+    # IMPORTANT: sweep uses in-memory portfolio, never touches your live paper portfolio.json
+    if panel is not None:
+        # shared-precomputation path: SMAs come from the sweep-wide PanelCache
+        from src.services.backtest_vectorized import run_backtest_vectorized
 
-    for ma_s, ma_l in grid:
-        cfg = replace(base_cfg, ma_short=int(ma_s), ma_long=int(ma_l))
-        engine = InvestmentEngine(cfg)
-
-        # IMPORTANT: sweep uses in-memory portfolio, never touches your live paper portfolio.json
-        report: BacktestReport = run_backtest(
+        report: BacktestReport = run_backtest_vectorized(
+            md=md,
+            engine=engine,
+            cfg=cfg,
+            start_cash=float(cfg.total_capital),
+            log_equity_path=None,
+            log_metrics_path=None,
+            log_trades_path=None,
+            log_rejected=False,
+            panel=panel,
+        )
+    else:
+        report = run_backtest(
             md=md,
             engine=engine,
             cfg=cfg,
@@ -72,24 +87,76 @@ def run_ma_sweep(
             log_metrics_path=None,
             log_trades_path=None,
             log_rejected=False,
+            engine_mode=engine_mode,
         )
 
-        rows.append(
-            SweepRow(
-                ma_short=ma_s,
-                ma_long=ma_l,
-                start_cash=report.metrics.start_cash,
-                end_value=report.metrics.end_value,
-                total_return=report.metrics.total_return,
-                max_drawdown=report.metrics.max_drawdown,
-                trades=report.metrics.trades,
-                buys=report.metrics.buys,
-                sells=report.metrics.sells,
-                win_rate=report.metrics.win_rate,
-            )
+    return SweepRow(
+        ma_short=ma_s,
+        ma_long=ma_l,
+        start_cash=report.metrics.start_cash,
+        end_value=report.metrics.end_value,
+        total_return=report.metrics.total_return,
+        max_drawdown=report.metrics.max_drawdown,
+        trades=report.metrics.trades,
+        buys=report.metrics.buys,
+        sells=report.metrics.sells,
+        win_rate=report.metrics.win_rate,
+    )
+
+
+# ---------------------------
+# Parallel sweep
+# ---------------------------
+
+# Set once per worker process by _init_worker. With the "fork" start method the
+# initializer args are inherited, not pickled; with "spawn" (Windows) they are
+# pickled once per worker rather than once per grid combination.
+_WORKER_STATE: Optional[Tuple[MarketDataResult, AppConfig, str, object]] = None
+
+
+def _init_worker(md: MarketDataResult, base_cfg: AppConfig, engine_mode: str, panel=None) -> None:
+    global _WORKER_STATE
+    _WORKER_STATE = (md, base_cfg, engine_mode, panel)
+
+
+def _run_combo(task: Tuple[int, int, int]) -> Tuple[int, SweepRow]:
+    idx, ma_s, ma_l = task
+    md, base_cfg, engine_mode, panel = _WORKER_STATE
+    return idx, _sweep_row(md, base_cfg, ma_s, ma_l, engine_mode, panel)
+
+
+class SweepProgress:
+    """Prints done/total, elapsed and ETA to stderr every `every` combinations."""
+
+    def __init__(self, total: int, every: int = 0, label: str = "sweep"):
+        self.total = int(total)
+        self.every = int(every) if every > 0 else max(1, self.total // 20)
+        self.label = label
+        self.done = 0
+        self._t0 = time.perf_counter()
+
+    def step(self, n: int = 1) -> None:
+        self.done += n
+        if self.done % self.every != 0 and self.done != self.total:
+            return
+        elapsed = time.perf_counter() - self._t0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        print(
+            f"[{self.label}] {self.done}/{self.total} ({pct:.1f}%) elapsed={elapsed:.1f}s eta={eta:.1f}s",
+            file=sys.stderr,
+            flush=True,
         )
 
-    # write CSV
+
+def _mp_context():
+    # fork shares the parent's price arrays copy-on-write; fall back to the platform default
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork" if "fork" in methods else None)
+
+
+def _write_sweep_csv(output_csv: Path, rows: List[SweepRow]) -> None:
     output_csv.parent.mkdir(parents=True, exist_ok=True)
     with output_csv.open("w", encoding="utf-8", newline="") as f:
         w = csv.writer(f)
@@ -123,4 +190,118 @@ def run_ma_sweep(
                 ]
             )
 
+
+def run_ma_sweep(
+    md: MarketDataResult,
+    base_cfg: AppConfig,
+    output_csv: Path,
+    shorts: List[int] | None = None,
+    longs: List[int] | None = None,
+    workers: int = 1,
+    engine_mode: str = "loop",
+    progress: bool = False,
+) -> List[SweepRow]:
+    """
+    Backtest every (ma_short, ma_long) pair of the grid.
+
+    workers > 1 runs combinations in a process pool; rows are always returned
+    (and written) in generate_ma_grid order, whatever order workers finish in.
+
+    engine_mode="vectorized" builds one PanelCache up front and computes the
+    SMA of every distinct window once (cumsum based); each pair then only
+    compares two cached series, so the SMA cost scales with len(shorts) +
+    len(longs) rather than with the number of pairs.
+    """
+    shorts = shorts or _default_short_grid()
+    longs = longs or _default_long_grid()
+
+    grid = generate_ma_grid(shorts, longs)
+    with stage("services.run_ma_sweep", rows_in=len(grid)) as st:
+        rows = _sweep_grid(md, base_cfg, grid, workers, engine_mode, progress)
+        _write_sweep_csv(output_csv, rows)
+        st.rows_out = len(rows)
+        st.wrote(output_csv)
     return rows
+
+
+def _sweep_grid(
+    md: MarketDataResult,
+    base_cfg: AppConfig,
+    grid: List[Tuple[int, int]],
+    workers: int,
+    engine_mode: str,
+    progress: bool,
+) -> List[SweepRow]:
+    tracker = SweepProgress(len(grid)) if progress else None
+
+    workers = max(1, min(int(workers), len(grid))) if grid else 1
+
+    panel = None
+    if engine_mode == "vectorized" and grid:
+        from src.services.backtest_vectorized import PanelCache
+
+        panel = PanelCache(md)
+        panel.precompute(sorted({w for pair in grid for w in pair}))
+
+    if workers == 1:
+        rows: List[SweepRow] = []
+        for ma_s, ma_l in grid:
+            rows.append(_sweep_row(md, base_cfg, ma_s, ma_l, engine_mode, panel))
+            if tracker:
+                tracker.step()
+    else:
+        slots: List[Optional[SweepRow]] = [None] * len(grid)
+        tasks = [(i, s, l) for i, (s, l) in enumerate(grid)]
+        chunksize = max(1, len(tasks) // (workers * 8))
+        with _mp_context().Pool(
+            processes=workers,
+            initializer=_init_worker,
+            initargs=(md, base_cfg, engine_mode, panel),
+        ) as pool:
+            for idx, row in pool.imap_unordered(_run_combo, tasks, chunksize=chunksize):
+                slots[idx] = row
+                if tracker:
+                    tracker.step()
+        rows = [r for r in slots if r is not None]
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="MA (short, long) parameter sweep over services.backtest")
+    ap.add_argument("--csv", default="data/2330.csv", help="date,close CSV (or long format with symbol/code)")
+    ap.add_argument("--out", default="data/ma_sweep.csv")
+    ap.add_argument("--shorts", default="", help="comma list, e.g. 2,3,4,5")
+    ap.add_argument("--longs", default="", help="comma list, e.g. 10,20,60")
+    ap.add_argument("--workers", type=int, default=1, help="process pool size (0 = all CPUs)")
+    ap.add_argument("--engine_mode", choices=["loop", "vectorized"], default="loop")
+    ap.add_argument("--quiet", action="store_true", help="no progress/ETA output")
+    args = ap.parse_args(argv)
+
+    def _ints(s: str) -> List[int] | None:
+        vals = [int(x) for x in s.split(",") if x.strip()]
+        return vals or None
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    out = Path(args.out)
+    with traced_run("sweeper"):
+        with stage("load_prices") as st:
+            md = load_prices_from_csv(args.csv)
+            st.read(args.csv)
+            st.rows_out = len(md.dates())
+        rows = run_ma_sweep(
+            md=md,
+            base_cfg=AppConfig.load_default(),
+            output_csv=out,
+            shorts=_ints(args.shorts),
+            longs=_ints(args.longs),
+            workers=workers,
+            engine_mode=args.engine_mode,
+            progress=not args.quiet,
+        )
+    print(f"OK: wrote -> {out} (rows={len(rows)} workers={workers})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
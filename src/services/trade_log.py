@@ -1,6 +1,5 @@
 ﻿from __future__ import annotations
 
-import csv
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
@@ -8,6 +7,7 @@ from typing import Optional
 
 from src.domain.portfolio import Portfolio
 from src.services.broker import Fill
+from src.services.log_sink import BufferedLogSink
 
 
 @dataclass(frozen=True)
@@ -26,8 +26,31 @@ class TradeLogRow:
 
 
 class TradeLogger:
-    def __init__(self, path: Path):
+    FIELDNAMES = [
+        "ts",
+        "action",
+        "symbol",
+        "fill_price",
+        "quantity",
+        "fee",
+        "cash_delta",
+        "cash_after",
+        "position_qty",
+        "position_avg_cost",
+        "note",
+    ]
+
+    def __init__(self, path: Path, flush_rows: int = 1):
+        # flush_rows=1 keeps the old write-through behaviour;
+        # backtests can pass a larger buffer and close() (or use `with`) at the end.
         self.path = path
+        self._sink = BufferedLogSink(path, self.FIELDNAMES, flush_rows=flush_rows)
+
+    def __enter__(self) -> "TradeLogger":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
 
     def append(self, fill: Fill, portfolio: Portfolio) -> None:
         # Derive position snapshot after fill
@@ -51,41 +74,25 @@ class TradeLogger:
 
         self._write_row(row)
 
-    def _write_row(self, row: TradeLogRow) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        is_new = not self.path.exists()
+    def flush(self) -> None:
+        self._sink.flush()
 
-        with self.path.open("a", encoding="utf-8", newline="") as f:
-            writer = csv.writer(f)
-            if is_new:
-                writer.writerow(
-                    [
-                        "ts",
-                        "action",
-                        "symbol",
-                        "fill_price",
-                        "quantity",
-                        "fee",
-                        "cash_delta",
-                        "cash_after",
-                        "position_qty",
-                        "position_avg_cost",
-                        "note",
-                    ]
-                )
+    def close(self) -> None:
+        self._sink.close()
 
-            writer.writerow(
-                [
-                    row.ts,
-                    row.action,
-                    row.symbol,
-                    f"{row.fill_price:.6f}",
-                    row.quantity,
-                    f"{row.fee:.6f}",
-                    f"{row.cash_delta:.6f}",
-                    f"{row.cash_after:.6f}",
-                    row.position_qty,
-                    f"{row.position_avg_cost:.6f}",
-                    row.note,
-                ]
-            )
+    def _write_row(self, row: TradeLogRow) -> None:
+        self._sink.write_row(
+            [
+                row.ts,
+                row.action,
+                row.symbol,
+                row.fill_price,
+                row.quantity,
+                row.fee,
+                row.cash_delta,
+                row.cash_after,
+                row.position_qty,
+                row.position_avg_cost,
+                row.note,
+            ]
+        )
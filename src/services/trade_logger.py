@@ -1,16 +1,18 @@
 ﻿from __future__ import annotations
 
-import csv
 from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
+from src.services.log_sink import BufferedLogSink
+
 
 class TradeLogger:
     """
     Append fills to a CSV file with a fixed schema.
     Ensures header exists and column order is stable.
+    Writes go through a BufferedLogSink (.npz/.parquet paths give columnar output).
     """
 
     FIELDNAMES = [
@@ -27,8 +29,17 @@ class TradeLogger:
         "note",
     ]
 
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, flush_rows: int = 1):
+        # flush_rows=1 keeps the old write-through behaviour;
+        # backtests can pass a larger buffer and close() (or use `with`) at the end.
         self.path = path
+        self._sink = BufferedLogSink(path, self.FIELDNAMES, flush_rows=flush_rows)
+
+    def __enter__(self) -> "TradeLogger":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
 
     def append_fill(
         self,
@@ -45,26 +56,24 @@ class TradeLogger:
         note: str,
         ts: Optional[datetime] = None,
     ) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-
-        write_header = (not self.path.exists()) or (self.path.stat().st_size == 0)
+        self._sink.write_row(
+            [
+                (ts or datetime.now()).isoformat(timespec="seconds"),
+                str(action),
+                str(symbol),
+                float(fill_price),
+                int(quantity),
+                float(fee),
+                float(cash_delta),
+                float(cash_after),
+                int(position_qty),
+                float(position_avg_cost),
+                str(note),
+            ]
+        )
 
-        row = {
-            "ts": (ts or datetime.now()).isoformat(timespec="seconds"),
-            "action": str(action),
-            "symbol": str(symbol),
-            "fill_price": f"{float(fill_price):.6f}",
-            "quantity": int(quantity),
-            "fee": f"{float(fee):.6f}",
-            "cash_delta": f"{float(cash_delta):.6f}",
-            "cash_after": f"{float(cash_after):.6f}",
-            "position_qty": int(position_qty),
-            "position_avg_cost": f"{float(position_avg_cost):.6f}",
-            "note": str(note),
-        }
+    def flush(self) -> None:
+        self._sink.flush()
 
-        with self.path.open("a", encoding="utf-8", newline="") as f:
-            w = csv.DictWriter(f, fieldnames=self.FIELDNAMES)
-            if write_header:
-                w.writeheader()
-            w.writerow(row)
+    def close(self) -> None:
+        self._sink.close()
@@ -1,5 +1,5 @@
 ﻿from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Dict, List, Optional
 from src.domain.models import Decision
 
 
@@ -18,3 +18,20 @@ class Strategy(ABC):
         回傳 Decision 或 None
         """
         raise NotImplementedError
+
+    def decide_next(
+        self,
+        symbol: str,
+        close: float,
+    ) -> Optional[Decision]:
+        """
+        逐根 K 棒推進（串流版 decide）
+
+        預設實作：累積 closes 後呼叫 decide；
+        有增量狀態的策略應覆寫成 O(1)。
+        """
+        if not hasattr(self, "_stream_closes"):
+            self._stream_closes: Dict[str, List[float]] = {}
+        closes = self._stream_closes.setdefault(symbol, [])
+        closes.append(float(close))
+        return self.decide(symbol, closes)
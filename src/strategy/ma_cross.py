@@ -1,4 +1,5 @@
-﻿from typing import List, Optional
+﻿from typing import Dict, List, Optional
+from src.core.indicators import CrossState
 from src.domain.models import Decision
 from src.strategy.base import Strategy
 
@@ -9,6 +10,7 @@ class MACrossStrategy(Strategy):
             raise ValueError("Invalid MA parameters")
         self.ma_short = ma_short
         self.ma_long = ma_long
+        self._streams: Dict[str, CrossState] = {}
 
     def decide(
         self,
@@ -24,6 +26,33 @@ class MACrossStrategy(Strategy):
         short_now = sum(closes[-self.ma_short :]) / self.ma_short
         long_now = sum(closes[-self.ma_long :]) / self.ma_long
 
+        return self._cross(symbol, short_prev, long_prev, short_now, long_now)
+
+    def decide_next(
+        self,
+        symbol: str,
+        close: float,
+    ) -> Optional[Decision]:
+        state = self._streams.get(symbol)
+        if state is None:
+            state = CrossState.of(self.ma_short, self.ma_long)
+            self._streams[symbol] = state
+        state.update(close)
+
+        if state.count < self.ma_long + 1:
+            return None
+
+        short_now, long_now = state.current()
+        return self._cross(symbol, state.prev_fast, state.prev_slow, short_now, long_now)
+
+    @staticmethod
+    def _cross(
+        symbol: str,
+        short_prev: float,
+        long_prev: float,
+        short_now: float,
+        long_now: float,
+    ) -> Optional[Decision]:
         if short_prev <= long_prev and short_now > long_now:
             return Decision("BUY", symbol, None, 1, "golden_cross")
 
@@ -1,4 +1,5 @@
-﻿from typing import List, Optional
+﻿from typing import Dict, List, Optional
+from src.core.indicators import CutlerRSI
 from src.domain.models import Decision
 from src.strategy.base import Strategy
 
@@ -19,6 +20,7 @@ class RSIStrategy(Strategy):
         self.period = period
         self.overbought = overbought
         self.oversold = oversold
+        self._streams: Dict[str, CutlerRSI] = {}
 
     def decide(
         self,
@@ -58,6 +60,30 @@ class RSIStrategy(Strategy):
             rs = avg_gain / avg_loss
             rsi = 100.0 - (100.0 / (1.0 + rs))
 
+        return self._rule(symbol, rsi, position)
+
+    def decide_next(
+        self,
+        symbol: str,
+        close: float,
+        position: int = 0,
+    ) -> Optional[Decision]:
+        """
+        Streaming decide(): feed one close per bar; RSI is kept as
+        running gain/loss sums per symbol (O(1) per bar).
+        """
+        state = self._streams.get(symbol)
+        if state is None:
+            state = CutlerRSI(self.period)
+            self._streams[symbol] = state
+
+        rsi = state.update(close)
+        if rsi is None:
+            return None
+
+        return self._rule(symbol, rsi, position)
+
+    def _rule(self, symbol: str, rsi: float, position: int) -> Optional[Decision]:
         # === Trading Rules (Single Position) ===
 
         # BUY only if no position
@@ -0,0 +1,417 @@
+﻿from __future__ import annotations
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+# Per-stage timing / memory / row / byte counters for scripts/* and src/services/*.
+#
+#   from src.utils.instrument import stage, traced_run
+#
+#   with traced_run("build_ranking_history"):       # entry point (main)
+#       with stage("load", rows_in=None) as st:
+#           df = load(...)
+#           st.read(path); st.rows_out = len(df)
+#
+# Off unless IA_TRACE is set; stage() then only costs two clock reads.
+#
+#   IA_TRACE=1            append one JSON line per stage to reports/trace.jsonl
+#                         (any other value but "0" = the trace file path);
+#                         traced_run() prints a summary table when it ends
+#   IA_PROFILE=a,b        also profile the stages named a and b ("*" = all) ->
+#                         reports/profile/<run>_<stage>.prof (cProfile)
+#   IA_PROFILER=pyinstrument
+#                         use pyinstrument instead (-> .html), when installed
+#
+# peak_rss_mb is the process high-water mark when the stage ended (it never
+# goes down), rss_mb the resident size then; cpu_s is the CPU time of the
+# thread that ran the stage; io_read/io_written are process-wide /proc
+# counters (Linux only), bytes_read/bytes_written what the stage declared.
+
+ENV_TRACE = "IA_TRACE"
+ENV_PROFILE = "IA_PROFILE"
+ENV_PROFILER = "IA_PROFILER"
+
+REPORTS_DIR = Path(__file__).resolve().parents[2] / "reports"
+DEFAULT_TRACE = REPORTS_DIR / "trace.jsonl"
+
+
+@dataclass
+class StageRecord:
+    run_id: str
+    script: str
+    seq: int
+    stage: str
+    parent: Optional[str]
+    started_at: str
+    status: str
+    wall_s: float
+    cpu_s: float
+    rss_mb: Optional[float]
+    peak_rss_mb: Optional[float]
+    rows_in: Optional[int]
+    rows_out: Optional[int]
+    bytes_read: Optional[int]
+    bytes_written: Optional[int]
+    io_read: Optional[int]
+    io_written: Optional[int]
+    error: str = ""
+    profile: str = ""
+
+
+# ---------------------------
+# Process counters
+# ---------------------------
+
+def _proc_status_mb(field: str) -> Optional[float]:
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 1024.0, 2)  # kB
+    except OSError:
+        pass
+    return None
+
+
+def _memory_mb() -> tuple[Optional[float], Optional[float]]:
+    """(current RSS, peak RSS) in MiB; None where the platform does not tell."""
+    rss = _proc_status_mb("VmRSS")
+    peak = _proc_status_mb("VmHWM")
+    if peak is None:
+        try:
+            import resource
+
+            r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = round(r / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 2)
+        except (ImportError, OSError):
+            pass
+    if rss is None or peak is None:
+        try:
+            import psutil  # optional (Windows)
+
+            mi = psutil.Process().memory_info()
+            rss = rss if rss is not None else round(mi.rss / 1048576.0, 2)
+            pk = getattr(mi, "peak_wset", None)
+            if peak is None and pk is not None:
+                peak = round(pk / 1048576.0, 2)
+        except Exception:
+            pass
+    return rss, peak
+
+
+def _io_counters() -> Optional[tuple[int, int]]:
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            vals = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(vals["rchar"]), int(vals["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# ---------------------------
+# Run / stage
+# ---------------------------
+
+def _env_trace_path() -> Optional[Path]:
+    v = os.environ.get(ENV_TRACE, "").strip()
+    if not v or v == "0":
+        return None
+    return DEFAULT_TRACE if v == "1" else Path(v)
+
+
+def _profile_wanted(name: str) -> bool:
+    v = os.environ.get(ENV_PROFILE, "").strip()
+    if not v:
+        return False
+    names = {x.strip() for x in v.split(",") if x.strip()}
+    return "*" in names or name in names
+
+
+class _Run:
+    def __init__(self, script: str, trace_path: Path):
+        self.id = datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        self.script = script
+        self.trace_path = trace_path
+        self.root: Optional[str] = None  # traced_run's own stage: parent of stages started on other threads
+        self.records: List[StageRecord] = []
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def next_seq(self) -> int:
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def add(self, rec: StageRecord) -> None:
+        line = json.dumps(asdict(rec), ensure_ascii=False)
+        with self._lock:
+            self.records.append(rec)
+            try:
+                self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.trace_path.open("a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"WARN: trace not written ({self.trace_path}): {e}", file=sys.stderr)
+
+
+_RUN: Optional[_Run] = None
+_RUN_LOCK = threading.Lock()
+_LOCAL = threading.local()
+
+
+def _current_run() -> Optional[_Run]:
+    """The active run; a stage used outside traced_run (e.g. in src/services) starts one on demand."""
+    global _RUN
+    if _RUN is not None:
+        return _RUN
+    path = _env_trace_path()
+    if path is None:
+        return None
+    with _RUN_LOCK:
+        if _RUN is None:
+            _RUN = _Run(Path(sys.argv[0] or "python").stem, path)
+            atexit.register(_print_at_exit, _RUN)
+    return _RUN
+
+
+def _print_at_exit(run: _Run) -> None:
+    if run.records:
+        print(format_summary(run.records), file=sys.stderr)
+
+
+class Stage:
+    """Handle yielded by stage(): set rows_in / rows_out, declare files read / written."""
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.bytes_read: Optional[int] = None
+        self.bytes_written: Optional[int] = None
+
+    @staticmethod
+    def _size(what: Union[str, os.PathLike, int]) -> int:
+        if isinstance(what, int):
+            return what
+        try:
+            return os.path.getsize(what)
+        except OSError:
+            return 0
+
+    def read(self, what: Union[str, os.PathLike, int]) -> None:
+        """Count a file (its size) or a byte count as read."""
+        self.bytes_read = (self.bytes_read or 0) + self._size(what)
+
+    def wrote(self, what: Union[str, os.PathLike, int]) -> None:
+        self.bytes_written = (self.bytes_written or 0) + self._size(what)
+
+
+@contextmanager
+def _profiled(run: _Run, name: str) -> Iterator[List[str]]:
+    """Yields a one-slot list that holds the dump path once the stage is done."""
+    out: List[str] = []
+    prof_dir = run.trace_path.parent / "profile"
+    safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+    if os.environ.get(ENV_PROFILER, "").strip().lower() == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("WARN: pyinstrument not installed; using cProfile", file=sys.stderr)
+        else:
+            p = Profiler()
+            p.start()
+            try:
+                yield out
+            finally:
+                p.stop()
+                path = prof_dir / f"{run.id}_{safe}.html"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(p.output_html(), encoding="utf-8")
+                out.append(str(path))
+            return
+
+    import cProfile
+
+    p = cProfile.Profile()
+    try:
+        p.enable()
+    except ValueError:  # another profiler is already active
+        yield out
+        return
+    try:
+        yield out
+    finally:
+        p.disable()
+        path = prof_dir / f"{run.id}_{safe}.prof"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        p.dump_stats(str(path))
+        out.append(str(path))
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None) -> Iterator[Stage]:
+    """Time the block as stage `name` (recorded only while tracing is on)."""
+    st = Stage(name, rows_in)
+    run = _current_run()
+    if run is None:
+        yield st
+        return
+
+    stack = getattr(_LOCAL, "stack", None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    parent = stack[-1] if stack else (run.root if run.root != name else None)
+    stack.append(name)
+    seq = run.next_seq()
+
+    started = datetime.now().replace(microsecond=0).isoformat()
+    io0 = _io_counters()
+    cpu0 = time.thread_time()
+    t0 = time.perf_counter()
+    status, error, profile = "ok", "", []
+    try:
+        if _profile_wanted(name):
+            with _profiled(run, name) as profile:
+                yield st
+        else:
+            yield st
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        wall = time.perf_counter() - t0
+        cpu = time.thread_time() - cpu0
+        io1 = _io_counters()
+        rss, peak = _memory_mb()
+        stack.pop()
+        run.add(StageRecord(
+            run_id=run.id,
+            script=run.script,
+            seq=seq,
+            stage=name,
+            parent=parent,
+            started_at=started,
+            status=status,
+            wall_s=round(wall, 6),
+            cpu_s=round(cpu, 6),
+            rss_mb=rss,
+            peak_rss_mb=peak,
+            rows_in=st.rows_in,
+            rows_out=st.rows_out,
+            bytes_read=st.bytes_read,
+            bytes_written=st.bytes_written,
+            io_read=(io1[0] - io0[0]) if io0 and io1 else None,
+            io_written=(io1[1] - io0[1]) if io0 and io1 else None,
+            error=error,
+            profile=profile[0] if profile else "",
+        ))
+
+
+@contextmanager
+def traced_run(script: str) -> Iterator[Optional[_Run]]:
+    """
+    Entry-point wrapper: groups the stages below under one run id (plus a
+    stage named `script` for the whole run) and prints the summary table at
+    the end. Does nothing unless IA_TRACE is set.
+    """
+    global _RUN
+    path = _env_trace_path()
+    if path is None or _RUN is not None:  # off, or nested inside another traced run
+        with stage(script):
+            yield _RUN
+        return
+    run = _Run(script, path)
+    run.root = script
+    with _RUN_LOCK:
+        _RUN = run
+    try:
+        with stage(script):
+            yield run
+    finally:
+        with _RUN_LOCK:
+            _RUN = None
+        print(format_summary(run.records))
+        print(f"trace: {run.trace_path} run_id={run.id}")
+
+
+# ---------------------------
+# Summary
+# ---------------------------
+
+def _fmt_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return "-"
+    for unit in ("B", "K", "M", "G"):
+        if abs(n) < 1024 or unit == "G":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n = n / 1024.0
+    return "-"
+
+
+def format_summary(records: List[Union[StageRecord, Dict[str, Any]]]) -> str:
+    """Fixed-width table of stage records (dataclasses or trace.jsonl dicts), in start order."""
+    rows = sorted((asdict(r) if isinstance(r, StageRecord) else r for r in records), key=lambda r: r.get("seq", 0))
+    depth_of: Dict[str, int] = {}
+    head = ["stage", "status", "wall_s", "cpu_s", "rss_mb", "peak_mb", "rows_in", "rows_out", "read", "written"]
+    body = []
+    for r in rows:
+        depth = depth_of.get(r.get("parent") or "", -1) + 1
+        depth_of[str(r.get("stage"))] = depth
+        body.append([
+            "  " * depth + str(r.get("stage")),
+            str(r.get("status")),
+            f"{r.get('wall_s', 0.0):.3f}",
+            f"{r.get('cpu_s', 0.0):.3f}",
+            "-" if r.get("rss_mb") is None else f"{r['rss_mb']:.1f}",
+            "-" if r.get("peak_rss_mb") is None else f"{r['peak_rss_mb']:.1f}",
+            "-" if r.get("rows_in") is None else str(r["rows_in"]),
+            "-" if r.get("rows_out") is None else str(r["rows_out"]),
+            _fmt_bytes(r.get("bytes_read") if r.get("bytes_read") is not None else r.get("io_read")),
+            _fmt_bytes(r.get("bytes_written") if r.get("bytes_written") is not None else r.get("io_written")),
+        ])
+    widths = [max(len(h), *(len(b[i]) for b in body)) if body else len(h) for i, h in enumerate(head)]
+    lines = ["  ".join(h.ljust(w) if i == 0 else h.rjust(w) for i, (h, w) in enumerate(zip(head, widths)))]
+    for b in body:
+        lines.append("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(b, widths))))
+    return "\n".join(lines)
+
+
+def load_trace(path: Union[str, Path] = DEFAULT_TRACE, run_id: str = "") -> List[Dict[str, Any]]:
+    """Records of run_id from a trace file (default: the last run in it)."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        recs = [json.loads(line) for line in f if line.strip()]
+    if not recs:
+        return []
+    rid = run_id or recs[-1]["run_id"]
+    return [r for r in recs if r.get("run_id") == rid]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Summary table of one run in a stage trace (JSONL)")
+    ap.add_argument("trace", nargs="?", default=str(DEFAULT_TRACE))
+    ap.add_argument("--run_id", default="", help="default: the last run in the file")
+    args = ap.parse_args(argv)
+
+    recs = load_trace(args.trace, args.run_id)
+    if not recs:
+        print(f"no records in {args.trace}")
+        return 1
+    print(f"run_id={recs[0]['run_id']} script={recs[0]['script']}")
+    print(format_summary(recs))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())